@@ -0,0 +1,236 @@
+"""
+Agent HTTP Client
+Pooled keep-alive client for the remote /classify and /score agents, with
+timeouts, jittered retries and a circuit breaker
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_API_BASE = "http://localhost:8000"
+
+
+class AgentUnavailable(Exception):
+    """Raised when an agent cannot be reached or the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    Closed: calls go through. After `failure_threshold` consecutive
+    failures it opens and rejects calls for `reset_timeout` seconds, then
+    lets a single trial call through (half-open); success closes it again,
+    failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """True if a call may be attempted now."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def abandon(self):
+        """Free the half-open trial slot of a call that ended without a verdict."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class AgentClient:
+    """
+    HTTP client for the classification and scoring agents.
+
+    One `requests.Session` with a sized connection pool is reused for every
+    call, so consecutive /classify and /score requests share warm keep-alive
+    connections instead of paying TCP/TLS setup each time. The session (and
+    `requests` itself) is created on the first call, so mock-mode processes
+    never import it.
+    """
+
+    def __init__(self, base_url: str = None, connect_timeout: float = 0.5,
+                 read_timeout: float = 2.0, retries: int = 2, backoff: float = 0.05,
+                 max_backoff: float = 1.0, pool_size: int = 20,
+                 breaker: CircuitBreaker = None, session=None):
+        self.base_url = (base_url or os.getenv("AURA_API_BASE", DEFAULT_API_BASE)).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.pool_size = pool_size
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._session = session
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled `requests.Session`, created on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                          max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _sleep_before_retry(self, attempt: int):
+        # Full jitter: uniform in [0, backoff * 2^attempt], capped.
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    def post(self, path: str, payload: dict) -> dict:
+        """
+        POST JSON to an agent endpoint and return the decoded response.
+
+        Connection errors, timeouts and 5xx responses are retried; 4xx
+        responses are not. Raises AgentUnavailable when the breaker is open
+        or every attempt failed.
+        """
+        if not self.breaker.allow():
+            raise AgentUnavailable(f"circuit open for {self.base_url}")
+        settled = False
+        try:
+            session = self.session
+            import requests
+
+            url = f"{self.base_url}{path}"
+            last_error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self._sleep_before_retry(attempt - 1)
+                try:
+                    response = session.post(url, json=payload, timeout=self.timeout)
+                except requests.RequestException as exc:
+                    last_error = exc
+                    continue
+
+                if response.status_code >= 500:
+                    last_error = requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                    continue
+                if response.status_code >= 400:
+                    # The agent is up; the request itself is bad. Don't trip the breaker.
+                    settled = True
+                    self.breaker.record_success()
+                    raise AgentUnavailable(f"{response.status_code} from {url}: {response.text[:200]}")
+
+                try:
+                    data = response.json()
+                except ValueError as exc:
+                    last_error = exc
+                    continue
+                settled = True
+                self.breaker.record_success()
+                return data
+
+            settled = True
+            self.breaker.record_failure()
+            raise AgentUnavailable(f"{url} failed after {self.retries + 1} attempts: {last_error}")
+        finally:
+            if not settled:
+                # Something other than a request error ended the call (a bug,
+                # an interrupt): a half-open trial must not stay taken, or the
+                # breaker would never let another call through.
+                self.breaker.abandon()
+
+    def classify(self, merchant: str, location: dict = None) -> dict:
+        return self.post("/classify", {"merchant": merchant, "location": location})
+
+    def score(self, txn: dict, cards: list) -> dict:
+        return self.post("/score", {"txn": txn, "cards": cards})
+
+    def _run_in_pool(self, fn, *args):
+        # A dedicated executor sized like the connection pool, so concurrent
+        # async callers are not throttled by the loop's small default one.
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                        thread_name_prefix="aura-agent")
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def aclassify(self, merchant: str, location: dict = None) -> dict:
+        """`classify` without blocking the event loop."""
+        return await self._run_in_pool(self.classify, merchant, location)
+
+    async def ascore(self, txn: dict, cards: list) -> dict:
+        """`score` without blocking the event loop."""
+        return await self._run_in_pool(self.score, txn, cards)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_agent_client() -> AgentClient:
+    """Process-wide client, created on first use so pools are shared."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AgentClient()
+    return _client
+
+
+def set_agent_client(client: AgentClient):
+    """Replace the process-wide client (e.g. to point at another server)."""
+    global _client
+    with _client_lock:
+        _client = client
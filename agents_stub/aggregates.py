@@ -0,0 +1,230 @@
+"""
+Dashboard Aggregates
+Running totals per month, card and category plus a ring buffer of recent
+transactions, updated in O(1) per confirmed payment
+"""
+
+import math
+import threading
+from collections import deque
+
+from .ledger import get_cap_ledger
+from .store import DEFAULT_USER, base_amount, get_transaction_store
+
+RECENT_SIZE = 20
+
+
+def _empty():
+    return [0.0, 0.0, 0]
+
+
+def _as_totals(acc) -> dict:
+    spend, rewards, count = acc
+    return {
+        "spend": spend,
+        "rewards": rewards,
+        "count": count,
+        "effective_rate": (rewards / spend) * 100 if spend else 0.0,
+    }
+
+
+class DashboardAggregates:
+    """
+    In-memory rollups for one user's dashboard.
+
+    Loaded once from the store's rollup table (whose size depends on months,
+    cards and categories, not on the number of transactions) and then kept
+    current by `apply`, so reading any dashboard figure never scans history.
+    Spend is summed in the base currency (`base_amount`), whatever the
+    currency of each purchase. Readers take the same lock as `apply` and
+    get copies, so a payment confirmed on another session's thread never
+    changes a table mid-read.
+    `last_id` is the user's newest row folded in.
+    """
+
+    def __init__(self, recent_size: int = RECENT_SIZE):
+        self.all_time = _empty()
+        self.months = {}
+        self.cards = {}
+        self.categories = {}
+        self.month_cards = {}
+        self.month_categories = {}
+        self.recent = deque(maxlen=recent_size)
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def _add(self, month, card, category, spend, reward, count):
+        for table, key in (
+            (self.months, month),
+            (self.cards, card),
+            (self.categories, category),
+            (self.month_cards, (month, card)),
+            (self.month_categories, (month, category)),
+        ):
+            acc = table.get(key)
+            if acc is None:
+                acc = table[key] = _empty()
+            acc[0] += spend
+            acc[1] += reward
+            acc[2] += count
+        self.all_time[0] += spend
+        self.all_time[1] += reward
+        self.all_time[2] += count
+
+    def apply(self, txn: dict, row_id: int = None):
+        """Fold one new transaction into every total and the recent buffer."""
+        with self._lock:
+            self._add(
+                (txn.get("timestamp") or "")[:7],
+                txn.get("card_used"),
+                txn.get("category"),
+                base_amount(txn),
+                float(txn.get("reward", 0) or 0),
+                1,
+            )
+            self.recent.appendleft(txn)
+            if row_id is not None:
+                self.last_id = row_id
+
+    @classmethod
+    def load(cls, store, user_id: str = DEFAULT_USER, recent_size: int = RECENT_SIZE):
+        """Build aggregates from the store's rollups and newest rows."""
+        while True:
+            agg = cls(recent_size)
+            agg.last_id = store.last_id(user_id)
+            for month, card, category, spend, reward, count in store.rollups(user_id):
+                agg._add(month, card, category, spend, reward, count)
+            agg.recent.extend(store.recent(recent_size, user_id=user_id))
+            # A row committed between the reads would be counted in the
+            # rollups but not in last_id, and folded in a second time by
+            # its writer; read again until nothing moved.
+            if store.last_id(user_id) == agg.last_id:
+                return agg
+
+    def totals(self, month: str = None) -> dict:
+        """Spend, rewards, count and effective rate for a month or all time."""
+        with self._lock:
+            if month is None:
+                return _as_totals(self.all_time)
+            return _as_totals(self.months.get(month, _empty()))
+
+    def by_card(self, month: str = None) -> dict:
+        with self._lock:
+            if month is None:
+                return {card: _as_totals(acc) for card, acc in self.cards.items()}
+            return {card: _as_totals(acc) for (m, card), acc in self.month_cards.items() if m == month}
+
+    def by_category(self, month: str = None) -> dict:
+        with self._lock:
+            if month is None:
+                return {cat: _as_totals(acc) for cat, acc in self.categories.items()}
+            return {cat: _as_totals(acc) for (m, cat), acc in self.month_categories.items() if m == month}
+
+    def recent_transactions(self, limit: int = 5) -> list:
+        with self._lock:
+            return [dict(txn) for txn in list(self.recent)[:limit]]
+
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregates(user_id: str = DEFAULT_USER, store=None) -> DashboardAggregates:
+    """
+    Current aggregates for a user.
+
+    Cached per process; if any other writer has added rows for this user
+    since they were built (checked with one index seek), they are reloaded
+    from the rollups. Other users' payments never force a reload. The
+    reload runs outside the cache lock, so it never holds up payments.
+    """
+    store = store or get_transaction_store()
+    key = (store.path, user_id)
+    with _aggregates_lock:
+        agg = _aggregates.get(key)
+        if agg is not None and agg.last_id == store.last_id(user_id):
+            return agg
+    loaded = DashboardAggregates.load(store, user_id)
+    with _aggregates_lock:
+        agg = _aggregates.get(key)
+        # Keep aggregates another thread loaded or folded past ours.
+        if agg is None or agg.last_id < loaded.last_id:
+            agg = _aggregates[key] = loaded
+        return agg
+
+
+def _fold_in(store, user_id: str, txn: dict, row_id: int):
+    """
+    Apply a row just written to the cached aggregates, or drop them if they
+    fell behind. Called under `_aggregates_lock`.
+    """
+    agg = _aggregates.get((store.path, user_id))
+    if agg is None or agg.last_id >= row_id:
+        # Nothing cached, or loaded after the row was committed.
+        return
+    if agg.last_id == store.last_id(user_id, before=row_id):
+        agg.apply({**txn, "id": row_id}, row_id)
+    else:
+        # Another writer added rows for this user in between; rebuild
+        # on next read.
+        del _aggregates[(store.path, user_id)]
+
+
+def record_transaction(txn: dict, user_id: str = DEFAULT_USER, store=None) -> int:
+    """
+    Persist a confirmed payment and update the cached aggregates in O(1).
+
+    Returns the new row id.
+    """
+    store = store or get_transaction_store()
+    row_id = store.add(txn, user_id=user_id)
+    with _aggregates_lock:
+        _fold_in(store, user_id, txn, row_id)
+    return row_id
+
+
+def record_payment(txn: dict, card_id: str, reward: float, category: str = None,
+                   sub_cap: float = math.inf, user_id: str = DEFAULT_USER, store=None,
+                   ledger=None) -> dict:
+    """
+    Count a confirmed payment against its card's caps and persist it, in one
+    SQLite transaction: either both the cap event and the transaction row
+    are committed or neither is.
+
+    Args:
+        txn: Transaction dict; its `reward` is replaced by the reward
+            credited, and its timestamp picks the month charged (default: now)
+        card_id: Card the payment was made with
+        reward: Reward the recommendation promised (base currency)
+        category: Rule category the reward counts against, for sub-caps
+        sub_cap: That category's sub-cap on this card (inf when none)
+        user_id: Wallet owner
+        store: TransactionStore (process-wide store by default)
+        ledger: CapLedger in the same database (process-wide ledger by default)
+
+    Returns:
+        The ledger's result (`reward` credited and the card's usage) plus
+        the new row `id`
+
+    Raises:
+        UnknownCard: if the ledger never opened the card
+        ValueError: if the ledger and the store use different databases
+    """
+    store = store or get_transaction_store()
+    ledger = ledger or get_cap_ledger()
+    if ledger.path != store.path:
+        raise ValueError(f"ledger ({ledger.path}) and store ({store.path}) must share one database")
+    written = {}
+
+    def write(conn, credited):
+        written["txn"] = {**txn, "reward": credited}
+        written["id"] = store.insert(conn, written["txn"], user_id)
+
+    # Only the card's own lock is held while writing, so payments on
+    # different cards commit concurrently.
+    result = ledger.record(card_id, reward, spend=base_amount(txn), category=category,
+                           sub_cap=sub_cap, user_id=user_id,
+                           month=(txn.get("timestamp") or "")[:7] or None, write=write)
+    with _aggregates_lock:
+        _fold_in(store, user_id, written["txn"], written["id"])
+    return {**result, "id": written["id"]}
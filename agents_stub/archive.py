@@ -0,0 +1,365 @@
+"""
+Transaction Archive
+Columnar, memory-mapped storage for transaction history
+
+An archive is a directory holding a small `meta.json` and a generation
+subdirectory with one `.npy` file per column. Numeric fields are fixed-width
+columns; merchant, card, category, currency, id and location city/area are
+dictionary-encoded as int32 codes into string tables kept in the metadata.
+Columns are opened with `numpy.load(mmap_mode="r")`, so opening an archive
+costs the same for ten rows or ten million and pages only touch the columns
+they read.
+
+Rewriting an archive writes a new generation and then atomically replaces
+`meta.json` to point at it; the previous generation is kept, and older
+ones are removed. Readers map every column when they open the archive, so
+an open reader keeps seeing the generation it opened, and one that loses
+the race to a removal between reading `meta.json` and mapping the columns
+follows the pointer again.
+
+Usage:
+    python -m agents_stub.archive pack data/mock_transactions.json
+    python -m agents_stub.archive unpack data/mock_transactions.aura out.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 2
+# Version 1 kept the columns directly in the archive directory.
+READABLE_VERSIONS = (1, 2)
+SUFFIX = ".aura"
+
+MISSING_CODE = -1
+MISSING_MCC = -1
+
+# Fixed-width numeric columns.
+NUMERIC_COLUMNS = {
+    "timestamp": "datetime64[us]",
+    "amount": "float64",
+    "reward": "float64",
+    "mcc": "int32",
+    "lat": "float64",
+    "lng": "float64",
+}
+# Dictionary-encoded string columns (int32 codes, -1 for missing).
+STRING_COLUMNS = ("id", "merchant", "card_used", "category", "currency", "city", "area")
+
+
+def parse_timestamp(value) -> np.datetime64:
+    """Naive UTC datetime64[us] of an ISO timestamp; NaT when empty."""
+    if not value:
+        return np.datetime64("NaT", "us")
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(ts, "us")
+
+
+def format_timestamps(values: np.ndarray) -> list:
+    """ISO strings, dropping a zero microsecond part like `isoformat` does."""
+    out = np.datetime_as_string(values, unit="us").tolist()
+    return [None if s == "NaT" else s[:-7] if s.endswith(".000000") else s for s in out]
+
+
+class ColumnEncoder:
+    """Builds one dictionary-encoded column."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+        self.codes = []
+
+    def add(self, value):
+        if value is None:
+            self.codes.append(MISSING_CODE)
+            return
+        value = str(value)
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+def columns_frame(table, columns):
+    """
+    DataFrame of `columns` from anything with the archive layout: a
+    `column(name)` method and string `dictionaries`. String columns become
+    pandas categoricals built straight from the codes; mcc is a nullable
+    integer column.
+    """
+    import pandas as pd
+
+    data = {}
+    for name in columns:
+        if name in table.dictionaries:
+            categories = pd.Index(table.dictionaries[name], dtype=object)
+            data[name] = pd.Categorical.from_codes(np.asarray(table.column(name)), categories=categories)
+        elif name == "mcc":
+            mcc = np.asarray(table.column(name))
+            data[name] = pd.arrays.IntegerArray(np.array(mcc), mcc == MISSING_MCC)
+        else:
+            data[name] = np.asarray(table.column(name))
+    return pd.DataFrame(data, columns=columns)
+
+
+def write_archive(txns, path) -> Path:
+    """
+    Write transactions (JSON-shaped dicts) to a columnar archive.
+
+    Accepts `reward_earned` or `reward`. Keys other than the archived
+    columns are not kept. The columns are written to a new generation
+    directory, then `meta.json` is atomically replaced to point at it, so
+    readers never see a half-written archive. The generation the old
+    pointer named is kept and every older one is removed: a reader that
+    read the old pointer but has not yet mapped its columns still finds
+    them after one rewrite, and re-reads the pointer if more than one
+    landed in between (see TransactionArchive).
+
+    Args:
+        txns: Iterable of transaction dicts
+        path: Archive directory to create or replace
+
+    Returns:
+        Path of the archive
+    """
+    path = Path(path)
+    encoders = {name: ColumnEncoder() for name in STRING_COLUMNS}
+    numeric = {name: [] for name in NUMERIC_COLUMNS}
+
+    for txn in txns:
+        location = txn.get("location") or {}
+        encoders["id"].add(txn.get("id"))
+        encoders["merchant"].add(txn.get("merchant"))
+        encoders["card_used"].add(txn.get("card_used"))
+        encoders["category"].add(txn.get("category"))
+        encoders["currency"].add(txn.get("currency"))
+        encoders["city"].add(location.get("city"))
+        encoders["area"].add(location.get("area"))
+        numeric["timestamp"].append(parse_timestamp(txn.get("timestamp")))
+        numeric["amount"].append(float(txn.get("amount", 0) or 0))
+        numeric["reward"].append(float(txn.get("reward_earned", txn.get("reward", 0)) or 0))
+        mcc = txn.get("mcc")
+        numeric["mcc"].append(MISSING_MCC if mcc is None else int(mcc))
+        lat, lng = location.get("lat"), location.get("lng")
+        numeric["lat"].append(np.nan if lat is None else float(lat))
+        numeric["lng"].append(np.nan if lng is None else float(lng))
+
+    path.mkdir(parents=True, exist_ok=True)
+    generation = Path(tempfile.mkdtemp(prefix="g", dir=path))
+    try:
+        for name, dtype in NUMERIC_COLUMNS.items():
+            np.save(generation / f"{name}.npy", np.array(numeric[name], dtype=dtype))
+        for name, encoder in encoders.items():
+            np.save(generation / f"{name}.npy", np.array(encoder.codes, dtype=np.int32))
+        meta = {
+            "version": FORMAT_VERSION,
+            "generation": generation.name,
+            "rows": len(numeric["amount"]),
+            "dictionaries": {name: encoder.values for name, encoder in encoders.items()},
+        }
+        previous = _read_meta(path)
+        fd, tmp = tempfile.mkstemp(prefix="meta.", suffix=".tmp", dir=path)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path / "meta.json")
+    except BaseException:
+        shutil.rmtree(generation, ignore_errors=True)
+        raise
+    _prune(path, keep={generation.name, (previous or {}).get("generation")})
+    return path
+
+
+def _read_meta(path: Path):
+    """Parsed meta.json of an archive directory, or None if there is none."""
+    try:
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _prune(path: Path, keep: set):
+    """
+    Remove generations other than `keep`, plus the column files of a
+    version 1 archive. Readers that already mapped them are unaffected.
+    """
+    for entry in path.iterdir():
+        if entry.name in keep:
+            continue
+        if entry.is_dir() and entry.name.startswith("g"):
+            shutil.rmtree(entry, ignore_errors=True)
+        elif entry.suffix == ".npy":
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+
+
+class TransactionArchive:
+    """
+    Read-only view over an archive directory.
+
+    Every column is memory-mapped on open, so the view stays on the
+    generation it opened while the archive is rewritten. `to_frame` hands string
+    columns to pandas as categoricals built straight from the stored codes,
+    and `records` rebuilds the JSON shape row by row for callers that still
+    want dicts.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        while True:
+            with open(self.path / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") not in READABLE_VERSIONS:
+                raise ValueError(f"unsupported archive version {meta.get('version')} in {self.path}")
+            self.rows = meta["rows"]
+            self.dictionaries = meta["dictionaries"]
+            self.generation = meta.get("generation")
+            directory = self.path / self.generation if self.generation else self.path
+            # Empty arrays cannot be memory-mapped.
+            mode = "r" if self.rows else None
+            try:
+                self._columns = {
+                    name: np.load(directory / f"{name}.npy", mmap_mode=mode)
+                    for name in (*NUMERIC_COLUMNS, *STRING_COLUMNS)
+                }
+                return
+            except FileNotFoundError:
+                # Two rewrites between reading meta.json and mapping the
+                # columns pruned the generation it named: follow the
+                # pointer again. Fail if it has not moved.
+                if (_read_meta(self.path) or {}).get("generation") == self.generation:
+                    raise
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column: values for numeric columns, int32 codes for string ones."""
+        return self._columns[name]
+
+    def strings(self, name: str) -> list:
+        """Decode a dictionary-encoded column to a list of str/None."""
+        table = self.dictionaries[name]
+        return [table[c] if c >= 0 else None for c in self.column(name).tolist()]
+
+    def to_frame(self, columns=None):
+        """
+        DataFrame of the requested columns (default all). String columns
+        become pandas categoricals sharing the archive's dictionaries.
+        """
+        return columns_frame(self, columns or list(NUMERIC_COLUMNS) + list(STRING_COLUMNS))
+
+    def records(self, start: int = 0, stop: int = None):
+        """Yield rows in the original JSON shape (with `reward_earned`)."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if start >= stop:
+            return
+        window = slice(start, stop)
+        strings = {
+            name: [table[c] if c >= 0 else None for c in self.column(name)[window].tolist()]
+            for name, table in self.dictionaries.items()
+        }
+        timestamps = format_timestamps(self.column("timestamp")[window])
+        amount = self.column("amount")[window].tolist()
+        reward = self.column("reward")[window].tolist()
+        mcc = self.column("mcc")[window].tolist()
+        lat = self.column("lat")[window].tolist()
+        lng = self.column("lng")[window].tolist()
+
+        for i in range(stop - start):
+            location = {}
+            if strings["city"][i] is not None:
+                location["city"] = strings["city"][i]
+            if strings["area"][i] is not None:
+                location["area"] = strings["area"][i]
+            if lat[i] == lat[i]:
+                location["lat"] = lat[i]
+            if lng[i] == lng[i]:
+                location["lng"] = lng[i]
+            yield {
+                "id": strings["id"][i],
+                "timestamp": timestamps[i],
+                "merchant": strings["merchant"][i],
+                "amount": amount[i],
+                "currency": strings["currency"][i],
+                "location": location,
+                "card_used": strings["card_used"][i],
+                "reward_earned": reward[i],
+                "category": strings["category"][i],
+                "mcc": None if mcc[i] == MISSING_MCC else mcc[i],
+            }
+
+    def __iter__(self):
+        return self.records()
+
+
+def archive_path_for(json_path) -> Path:
+    """Archive location next to a JSON file: data/x.json -> data/x.aura."""
+    return Path(json_path).with_suffix(SUFFIX)
+
+
+def json_to_archive(json_path, archive_path=None) -> Path:
+    """Convert a JSON list of transactions into an archive."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        txns = json.load(f)
+    return write_archive(txns, archive_path or archive_path_for(json_path))
+
+
+def archive_to_json(archive_path, json_path, indent: int = 2) -> Path:
+    """Convert an archive back to the JSON list shape."""
+    archive = TransactionArchive(archive_path)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(list(archive.records()), f, indent=indent, ensure_ascii=False)
+    return Path(json_path)
+
+
+def open_transactions(json_path) -> TransactionArchive:
+    """
+    Archive for a JSON transaction file, (re)built when missing, older
+    than the JSON or in an older format, so the JSON is parsed once rather
+    than on every load.
+    """
+    json_path = Path(json_path)
+    archive_path = archive_path_for(json_path)
+    meta = archive_path / "meta.json"
+    if (
+        not meta.exists()
+        or meta.stat().st_mtime < json_path.stat().st_mtime
+        or (_read_meta(archive_path) or {}).get("version") != FORMAT_VERSION
+    ):
+        json_to_archive(json_path, archive_path)
+    return TransactionArchive(archive_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert transaction history to and from the columnar archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="JSON -> archive")
+    pack.add_argument("json_path")
+    pack.add_argument("archive_path", nargs="?")
+    unpack = sub.add_parser("unpack", help="archive -> JSON")
+    unpack.add_argument("archive_path")
+    unpack.add_argument("json_path")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        out = json_to_archive(args.json_path, args.archive_path)
+        print(f"Wrote {len(TransactionArchive(out))} rows to {out}")
+    else:
+        archive_to_json(args.archive_path, args.json_path)
+        print(f"Wrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Historical Backfill
+Re-score every user's transaction history across a process pool
+
+Users are split into a fixed number of shards by a stable hash of the user
+id. Each shard is a unit of work for the pool (more shards than workers keeps
+every core busy as shards finish unevenly) and owns one JSON-lines result
+file plus one checkpoint. A worker streams each user's history in id order,
+runs chunks through the batch classifier and scorer (`optimize_many`),
+appends the results, fsyncs, and only then advances the checkpoint. A
+crashed or interrupted run picks up where each shard stopped: partial output
+past the checkpoint is truncated and the user is resumed after the last
+checkpointed transaction id.
+
+Usage:
+    python -m agents_stub.backfill --cards data/mock_user_cards.json --out data/backfill
+    python -m agents_stub.backfill --cards wallets.json --out data/backfill --workers 8 --since 2025-01
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .card_rules import get_rules
+from .store import DEFAULT_DB_PATH, TransactionStore
+from .utils import optimize_many
+
+MANIFEST = "manifest.json"
+CHUNK_SIZE = 5_000
+# Shards per worker; enough that a slow shard does not leave cores idle.
+SHARDS_PER_WORKER = 4
+PROGRESS_INTERVAL = 1.0
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    """Stable shard number for a user (same in every process and run)."""
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+
+def _write_json(path: Path, data: dict):
+    """Atomically replace `path` with `data` as JSON."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fresh_wallet(cards: list) -> list:
+    """Cards with monthly usage cleared: history is scored as if each cap were unused."""
+    return [
+        {**card, "used_this_month": 0, "spend_this_month": 0, "category_used": {}}
+        for card in cards
+    ]
+
+
+def _result_row(user_id: str, txn: dict, entry: dict, rules_version: str) -> dict:
+    reward = float(txn.get("reward") or 0)
+    return {
+        "id": txn["id"],
+        "user_id": user_id,
+        "timestamp": txn["timestamp"],
+        "merchant": txn["merchant"],
+        "amount": txn["amount"],
+        "category": entry["predicted_category"],
+        "mcc": entry["predicted_mcc"],
+        "confidence": round(entry["confidence"], 4),
+        "best_card": entry["best_card"],
+        "best_reward": entry["expected_reward"],
+        "card_used": txn.get("card_used"),
+        "reward": reward,
+        "uplift": round(entry["expected_reward"] - reward, 4),
+        "rules_version": rules_version,
+    }
+
+
+# Per-process state set by _init_worker.
+_worker = {}
+
+
+def _init_worker(db_path: str, out_dir: str, wallets, since, chunk_size: int, progress):
+    _worker.update(
+        store=TransactionStore(db_path),
+        out_dir=Path(out_dir),
+        wallets=wallets,
+        since=since,
+        chunk_size=chunk_size,
+        progress=progress,
+    )
+
+
+def _wallet_for(user_id: str):
+    wallets = _worker["wallets"]
+    cards = wallets if isinstance(wallets, list) else wallets.get(user_id)
+    return _fresh_wallet(cards) if cards else None
+
+
+def run_shard(shard: int, users: list) -> dict:
+    """
+    Process one shard to completion (or from its checkpoint onwards).
+
+    Args:
+        shard: Shard number
+        users: The shard's users; only used when the shard has no
+            checkpoint yet, after which the checkpoint's list is authoritative
+
+    Returns:
+        The final checkpoint dict (rows, skipped users, ...)
+    """
+    out_dir = _worker["out_dir"]
+    store = _worker["store"]
+    progress = _worker["progress"]
+    ckpt_path = out_dir / f"shard-{shard:04d}.ckpt.json"
+    out_path = out_dir / f"shard-{shard:04d}.jsonl"
+
+    if ckpt_path.exists():
+        with open(ckpt_path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+    else:
+        ckpt = {"shard": shard, "users": sorted(users), "next": 0, "last_id": 0, "offset": 0,
+                "rows": 0, "skipped": [], "done": False}
+    if ckpt["done"]:
+        return ckpt
+
+    rules_version = get_rules().version
+    with open(out_path, "a+b") as out:
+        # Anything past the checkpoint was written but never committed.
+        out.truncate(ckpt["offset"])
+        while ckpt["next"] < len(ckpt["users"]):
+            user_id = ckpt["users"][ckpt["next"]]
+            cards = _wallet_for(user_id)
+            if cards is None:
+                ckpt["skipped"].append(user_id)
+            else:
+                for chunk in store.iter_chunks(user_id, ckpt["last_id"], _worker["since"],
+                                               _worker["chunk_size"]):
+                    entries = optimize_many(chunk, cards, chunk_size=len(chunk))
+                    lines = "".join(
+                        json.dumps(_result_row(user_id, txn, entry, rules_version)) + "\n"
+                        for txn, entry in zip(chunk, entries)
+                    )
+                    out.write(lines.encode("utf-8"))
+                    out.flush()
+                    os.fsync(out.fileno())
+                    ckpt.update(last_id=chunk[-1]["id"], offset=out.tell(), rows=ckpt["rows"] + len(chunk))
+                    _write_json(ckpt_path, ckpt)
+                    progress.put(len(chunk))
+            ckpt.update(next=ckpt["next"] + 1, last_id=0)
+            _write_json(ckpt_path, ckpt)
+
+    ckpt["done"] = True
+    _write_json(ckpt_path, ckpt)
+    return ckpt
+
+
+def _load_wallets(path):
+    with open(path, "r", encoding="utf-8") as f:
+        wallets = json.load(f)
+    if not isinstance(wallets, (list, dict)):
+        raise ValueError(f"{path}: expected a card list or a {{user_id: cards}} object")
+    return wallets
+
+
+def _prepare(out_dir: Path, shards: int, since, restart: bool, db_path: str) -> dict:
+    """Create or validate the run manifest; returns it."""
+    manifest_path = out_dir / MANIFEST
+    rules_version = get_rules().version
+    if restart and out_dir.exists():
+        for path in out_dir.glob("shard-*"):
+            path.unlink()
+        if manifest_path.exists():
+            manifest_path.unlink()
+
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["since"] != since or manifest["rules_version"] != rules_version:
+            raise SystemExit(
+                f"{out_dir} holds a run for since={manifest['since']!r}, rules {manifest['rules_version']}; "
+                "pass --restart to discard it"
+            )
+        return manifest
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "db": db_path,
+        "shards": shards,
+        "since": since,
+        "rules_version": rules_version,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    _write_json(manifest_path, manifest)
+    return manifest
+
+
+def _report(done: int, total: int, base: int, started: float, shards_done: int, shards: int,
+            final: bool = False):
+    """One progress line on stderr; `base` rows were committed by earlier attempts."""
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rate = (done - base) / elapsed
+    pct = 100.0 * done / total if total else 100.0
+    eta = (total - done) / rate if rate and total > done else 0.0
+    end = "\n" if final else "\r"
+    sys.stderr.write(
+        f"{done:,}/{total:,} txns ({pct:5.1f}%)  {rate:,.0f} txn/s  "
+        f"shards {shards_done}/{shards}  elapsed {elapsed:,.0f}s  eta {eta:,.0f}s{end}"
+    )
+    sys.stderr.flush()
+
+
+def backfill(db_path, out_dir, wallets, workers: int = None, shards: int = None, since: str = None,
+             chunk_size: int = CHUNK_SIZE, restart: bool = False, users=None, quiet: bool = False) -> dict:
+    """
+    Re-score transaction history into `out_dir`, resuming an earlier run
+    there unless `restart`.
+
+    Args:
+        db_path: Transaction store path
+        out_dir: Directory for the manifest, shard results and checkpoints
+        wallets: One card list for every user, or {user_id: cards}; users
+            without a wallet are skipped
+        workers: Processes (default: CPU count)
+        shards: Shard count for a new run (default: SHARDS_PER_WORKER x workers)
+        since: Only transactions at or after this timestamp prefix
+        chunk_size: Transactions per classify/score/write step
+        restart: Discard any existing run in `out_dir`
+        users: Restrict to these users (default: every user in the store)
+        quiet: Suppress progress output
+
+    Returns:
+        Summary with rows, users, skipped users, elapsed seconds and txn/s
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    out_dir = Path(out_dir)
+    store = TransactionStore(db_path)
+    manifest = _prepare(out_dir, shards or SHARDS_PER_WORKER * workers, since, restart, str(db_path))
+    shards = manifest["shards"]
+
+    counts = store.user_counts(since)
+    selected = sorted(users) if users else sorted(store.users())
+    by_shard = {}
+    for user_id in selected:
+        by_shard.setdefault(shard_of(user_id, shards), []).append(user_id)
+
+    # Rows already committed by an earlier attempt count towards progress.
+    done_rows = 0
+    for path in out_dir.glob("shard-*.ckpt.json"):
+        with open(path, "r", encoding="utf-8") as f:
+            done_rows += json.load(f)["rows"]
+    total = max(sum(counts.get(u, 0) for u in selected), done_rows)
+    store.close()
+
+    ctx = mp.get_context()
+    progress = ctx.Queue()
+    started = time.perf_counter()
+    results = []
+    with ctx.Pool(workers, initializer=_init_worker,
+                  initargs=(str(db_path), str(out_dir), wallets, since, chunk_size, progress)) as pool:
+        pending = [pool.apply_async(run_shard, (shard, shard_users)) for shard, shard_users in by_shard.items()]
+        done, last_report = done_rows, 0.0
+        while pending:
+            try:
+                done += progress.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                pass
+            still = []
+            for job in pending:
+                if job.ready():
+                    results.append(job.get())  # re-raises a worker's exception
+                else:
+                    still.append(job)
+            pending = still
+            now = time.perf_counter()
+            if not quiet and now - last_report >= PROGRESS_INTERVAL:
+                _report(done, total, done_rows, started, len(results), len(by_shard))
+                last_report = now
+        while True:
+            try:
+                done += progress.get_nowait()
+            except queue.Empty:
+                break
+
+    elapsed = time.perf_counter() - started
+    rows = sum(r["rows"] for r in results)
+    if not quiet:
+        _report(done, done, done_rows, started, len(results), len(by_shard), final=True)
+    summary = {
+        "rows": rows,
+        "rows_this_run": done - done_rows,
+        "users": len(selected),
+        "skipped_users": sorted(u for r in results for u in r["skipped"]),
+        "shards": len(by_shard),
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "txn_per_s": round((done - done_rows) / elapsed, 1) if elapsed else 0.0,
+        "finished": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    _write_json(out_dir / MANIFEST, {**manifest, "summary": summary})
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score historical transactions across a process pool")
+    parser.add_argument("--db", default=os.getenv("AURA_DB_PATH"), help="transaction store (default: data/aura.db)")
+    parser.add_argument("--cards", required=True, help="JSON card list, or {user_id: cards}")
+    parser.add_argument("--out", required=True, help="output directory (resumed if it holds a run)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shards", type=int, default=None, help="shards for a new run")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--since", default=None, help="only transactions at/after this ISO timestamp prefix")
+    parser.add_argument("--users", default=None, help="comma-separated user ids")
+    parser.add_argument("--restart", action="store_true", help="discard an existing run in --out")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or str(DEFAULT_DB_PATH)
+    summary = backfill(
+        db_path, args.out, _load_wallets(args.cards),
+        workers=args.workers, shards=args.shards, since=args.since, chunk_size=args.chunk_size,
+        restart=args.restart, users=args.users.split(",") if args.users else None, quiet=args.quiet,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
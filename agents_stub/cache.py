@@ -0,0 +1,106 @@
+"""
+Result Cache
+Bounded LRU with per-entry TTL and hit/miss/eviction counters, shared by the
+merchant classification cache (agents_stub.utils) and the per-user
+insights cache (agents_stub.insights)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a time-to-live on every entry.
+
+    Entries are evicted when the cache grows past `maxsize` (least recently
+    used first) or when they are older than `ttl` seconds at lookup time.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+            if self.ttl is not None and self._clock() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key) -> bool:
+        """
+        Whether `key` holds an unexpired entry. A peek: it counts neither
+        a hit nor a miss and does not refresh the entry's LRU position.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (self.ttl is None or self._clock() - entry[1] <= self.ttl)
+
+    def put(self, key, value):
+        """Store `value` under `key`, evicting the oldest entries if full."""
+        with self._lock:
+            self._data[key] = (value, self._clock())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None) -> int:
+        """
+        Drop entries whose key satisfies `predicate`, or every entry if no
+        predicate is given. Returns the number of entries removed.
+        """
+        with self._lock:
+            if predicate is None:
+                removed = len(self._data)
+                self._data.clear()
+            else:
+                stale = [key for key in self._data if predicate(key)]
+                for key in stale:
+                    del self._data[key]
+                removed = len(stale)
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> dict:
+        """Snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self):
+        return len(self._data)
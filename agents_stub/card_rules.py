@@ -0,0 +1,407 @@
+"""
+Card Rule Engine
+Declarative card earning rules compiled into indexed lookup tables, with hot
+reload when the rule file changes
+
+Rule file (JSON, `data/card_rules.json` or AURA_RULES_PATH):
+
+    {
+      "version": "2025.01",
+      "mile_value_sgd": 0.02,
+      "categories": ["Dining", "Groceries", "Transport", "General"],
+      "fallback_category": "General",
+      "default": {"rate": 0.01, "unit": "sgd"},
+      "cards": {
+        "<display name>": {
+          "unit": "sgd" | "mile",
+          "rates": {"<category>": 0.05 | {"rate": 3.0, "unit": "mile"}},
+          "mcc": {"4511": {"rate": 3.0, "label": "Flights"}},
+          "overseas": {"rate": 2.0, "label": "Overseas spend"},
+          "tiers": [{"min_spend": 1000, "rates": {"<category>": 0.02}}],
+          "sub_caps": {"<category>": 80}
+        }
+      }
+    }
+
+A card's rule for a transaction is its MCC override if there is one, else
+its `overseas` rate if the transaction is in a foreign currency (see
+`agents_stub.fx`), else the highest tier whose `min_spend` the card's
+`spend_this_month` has met, else its base category rate. Categories a card does not list earn its
+fallback-category rate; cards missing from the file earn `default`.
+Sub-caps limit the reward per category per month on top of the card's
+overall `monthly_cap` (usage comes from the card's `category_used`).
+
+The shipped file is mock data for the demo wallet. Its base rates
+reproduce the scorer's former hard-coded table. The UOB One spend tiers
+(1000 and 2000) and the OCBC 365 Dining sub-cap (80) are illustrative
+values, not issuer terms: they exercise the tier and sub-cap paths. Replace
+them with the issuers' published terms before relying on the rewards.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from .reference import cached
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parent.parent / "data" / "card_rules.json"
+UNITS = ("sgd", "mile")
+
+
+class RuleError(ValueError):
+    """Raised when a rule file is malformed."""
+
+
+class Rule(NamedTuple):
+    """One compiled earning rule."""
+
+    rate: float
+    unit: str
+    label: str = None   # shown instead of the category, e.g. "Flights"
+    note: str = ""      # appended to the matched rule, e.g. " (min spend $1,000 met)"
+
+    @property
+    def is_mile(self) -> bool:
+        return self.unit == "mile"
+
+
+def as_mcc(value):
+    """MCC as an int, or None when missing or not numeric."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CardProgram:
+    """
+    Compiled rules for one card product.
+
+    Every table is a tuple indexed by category position, and tiers are
+    pre-merged with the base rates, so a lookup is a couple of index
+    operations whatever the size of the rule file.
+    """
+
+    __slots__ = ("name", "base", "tiers", "tier_spend", "mcc", "sub_caps", "overseas")
+
+    def __init__(self, name, base, tiers, mcc, sub_caps, overseas=None):
+        self.name = name
+        self.base = base
+        self.tiers = tuple(table for _, table in tiers)
+        self.tier_spend = tuple(spend for spend, _ in tiers)
+        self.mcc = mcc
+        self.sub_caps = sub_caps
+        self.overseas = overseas
+
+    def tier_level(self, spend) -> int:
+        """0 for base rates, n for the n-th tier reached."""
+        if not self.tier_spend:
+            return 0
+        return bisect_right(self.tier_spend, float(spend or 0))
+
+    def table(self, level: int) -> tuple:
+        return self.tiers[level - 1] if level else self.base
+
+    def lookup(self, category_index: int, mcc=None, spend=0.0, overseas: bool = False) -> Rule:
+        if self.mcc and mcc is not None:
+            rule = self.mcc.get(mcc)
+            if rule is not None:
+                return rule
+        if overseas and self.overseas is not None:
+            return self.overseas
+        return self.table(self.tier_level(spend))[category_index]
+
+
+class CompiledRules:
+    """An immutable, versioned compilation of one rule file."""
+
+    def __init__(self, version, mile_value, categories, fallback, programs, default):
+        self.version = version
+        self.mile_value = mile_value
+        self.categories = tuple(categories)
+        self._category_index = {name: i for i, name in enumerate(self.categories)}
+        self.fallback_index = self._category_index[fallback]
+        self.programs = programs
+        self.default = default
+        self.mcc_codes = frozenset(code for p in programs.values() for code in p.mcc)
+        self.has_overseas = any(p.overseas is not None for p in programs.values())
+        self._tables = {}
+
+    @property
+    def card_names(self) -> list:
+        return list(self.programs)
+
+    def category_index(self, category) -> int:
+        return self._category_index.get(category, self.fallback_index)
+
+    def program(self, card_name: str) -> CardProgram:
+        return self.programs.get(card_name, self.default)
+
+    def lookup(self, card_name: str, category: str, mcc=None, spend=0.0, overseas: bool = False) -> Rule:
+        """The rule a card earns under for one transaction."""
+        return self.program(card_name).lookup(self.category_index(category), as_mcc(mcc), spend, overseas)
+
+    def sub_cap(self, card_name: str, category: str) -> float:
+        """Per-category reward cap, or inf when the card has none."""
+        return self.program(card_name).sub_caps[self.category_index(category)]
+
+    def has_mcc_override(self, mcc) -> bool:
+        return as_mcc(mcc) in self.mcc_codes
+
+    def wallet_tables(self, card_names: tuple, levels: tuple):
+        """
+        Dense category x card arrays for a wallet at given tier levels:
+        rates as quoted, is-mile flags and sub-caps. Built once per distinct
+        wallet and reused; read-only.
+        """
+        key = (card_names, levels)
+        tables = self._tables.get(key)
+        if tables is None:
+            n_cat, n_cards = len(self.categories), len(card_names)
+            rates = np.empty((n_cat, n_cards), dtype=np.float64)
+            is_mile = np.zeros((n_cat, n_cards), dtype=bool)
+            sub_caps = np.empty((n_cat, n_cards), dtype=np.float64)
+            for j, (name, level) in enumerate(zip(card_names, levels)):
+                program = self.program(name)
+                for i, rule in enumerate(program.table(level)):
+                    rates[i, j] = rule.rate
+                    is_mile[i, j] = rule.is_mile
+                sub_caps[:, j] = program.sub_caps
+            for array in (rates, is_mile, sub_caps):
+                array.setflags(write=False)
+            tables = (rates, is_mile, sub_caps)
+            if len(self._tables) >= 256:
+                self._tables.clear()
+            self._tables[key] = tables
+        return tables
+
+    def mcc_patches(self, card_names: tuple) -> dict:
+        """
+        MCC overrides present in a wallet: mcc -> (card columns, rates,
+        is-mile flags) for the cards that override it.
+        """
+        patches = {}
+        for j, name in enumerate(card_names):
+            for code, rule in self.program(name).mcc.items():
+                cols, rates, is_mile = patches.setdefault(code, ([], [], []))
+                cols.append(j)
+                rates.append(rule.rate)
+                is_mile.append(rule.is_mile)
+        return {
+            code: (np.array(cols, dtype=np.intp), np.array(rates), np.array(is_mile, dtype=bool))
+            for code, (cols, rates, is_mile) in patches.items()
+        }
+
+    def overseas_patch(self, card_names: tuple):
+        """
+        Overseas rates in a wallet: (card columns, rates, is-mile flags)
+        for the cards that have one, or None.
+        """
+        found = [(j, self.program(name).overseas) for j, name in enumerate(card_names)]
+        found = [(j, rule) for j, rule in found if rule is not None]
+        if not found:
+            return None
+        return (
+            np.array([j for j, _ in found], dtype=np.intp),
+            np.array([rule.rate for _, rule in found]),
+            np.array([rule.is_mile for _, rule in found], dtype=bool),
+        )
+
+
+def _rule(value, unit, where) -> Rule:
+    if isinstance(value, dict):
+        unit = value.get("unit", unit)
+        label = value.get("label")
+        value = value.get("rate")
+    else:
+        label = None
+    if unit not in UNITS:
+        raise RuleError(f"{where}: unit must be one of {UNITS}, got {unit!r}")
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+        raise RuleError(f"{where}: rate must be a non-negative number, got {value!r}")
+    return Rule(float(value), unit, label)
+
+
+def _check_categories(names, categories, where):
+    unknown = set(names) - set(categories)
+    if unknown:
+        raise RuleError(f"{where}: unknown categories {sorted(unknown)}")
+
+
+def _compile_card(name, spec, categories, fallback, default) -> CardProgram:
+    where = f"cards[{name!r}]"
+    unit = spec.get("unit", "sgd")
+    rates = spec.get("rates", {})
+    _check_categories(rates, categories, f"{where}.rates")
+
+    compiled = {cat: _rule(value, unit, f"{where}.rates.{cat}") for cat, value in rates.items()}
+    fallback_rule = compiled.get(fallback, default)
+    base = tuple(compiled.get(cat, fallback_rule) for cat in categories)
+
+    tiers = []
+    for n, tier in enumerate(sorted(spec.get("tiers", []), key=lambda t: t.get("min_spend", 0))):
+        tier_where = f"{where}.tiers[{n}]"
+        min_spend = tier.get("min_spend")
+        if not isinstance(min_spend, (int, float)) or min_spend <= 0:
+            raise RuleError(f"{tier_where}: min_spend must be a positive number")
+        _check_categories(tier.get("rates", {}), categories, f"{tier_where}.rates")
+        note = f" (min spend ${min_spend:,.0f} met)"
+        overrides = {
+            cat: _rule(value, unit, f"{tier_where}.rates.{cat}")._replace(note=note)
+            for cat, value in tier.get("rates", {}).items()
+        }
+        previous = tiers[-1][1] if tiers else base
+        tiers.append((float(min_spend), tuple(
+            overrides.get(cat, previous[i]) for i, cat in enumerate(categories)
+        )))
+
+    mcc = {}
+    for code, value in spec.get("mcc", {}).items():
+        mcc_code = as_mcc(code)
+        if mcc_code is None:
+            raise RuleError(f"{where}.mcc: {code!r} is not a numeric MCC")
+        rule = _rule(value, unit, f"{where}.mcc.{code}")
+        mcc[mcc_code] = rule._replace(label=rule.label or f"MCC {mcc_code}")
+
+    overseas = None
+    if spec.get("overseas") is not None:
+        overseas = _rule(spec["overseas"], unit, f"{where}.overseas")
+        overseas = overseas._replace(label=overseas.label or "Overseas spend")
+
+    caps = spec.get("sub_caps", {})
+    _check_categories(caps, categories, f"{where}.sub_caps")
+    sub_caps = tuple(float(caps.get(cat, math.inf)) for cat in categories)
+
+    return CardProgram(name, base, tiers, mcc, sub_caps, overseas)
+
+
+def compile_rules(data: dict, digest: str = "") -> CompiledRules:
+    """
+    Compile a parsed rule file.
+
+    Args:
+        data: Parsed rule file
+        digest: Content hash appended to the version string
+
+    Returns:
+        CompiledRules
+
+    Raises:
+        RuleError: if the file is malformed
+    """
+    categories = data.get("categories")
+    if not categories or not isinstance(categories, list):
+        raise RuleError("'categories' must be a non-empty list")
+    fallback = data.get("fallback_category", categories[-1])
+    if fallback not in categories:
+        raise RuleError(f"fallback_category {fallback!r} is not a listed category")
+    default = _rule(data.get("default", {"rate": 0.01, "unit": "sgd"}), "sgd", "default")
+
+    programs = {
+        name: _compile_card(name, spec, categories, fallback, default)
+        for name, spec in data.get("cards", {}).items()
+    }
+    default_program = CardProgram(
+        None, tuple(default for _ in categories), [], {}, tuple(math.inf for _ in categories)
+    )
+    version = str(data.get("version", "0"))
+    if digest:
+        version = f"{version}+{digest}"
+    return CompiledRules(
+        version, float(data.get("mile_value_sgd", 0.02)), categories, fallback, programs, default_program
+    )
+
+
+def load_rules(path) -> CompiledRules:
+    """Read and compile a rule file."""
+    raw = Path(path).read_bytes()
+    try:
+        data = json.loads(raw)
+    except ValueError as exc:
+        raise RuleError(f"{path}: {exc}") from exc
+    return compile_rules(data, hashlib.sha1(raw).hexdigest()[:8])
+
+
+class RuleEngine:
+    """
+    Holds the current CompiledRules for a rule file.
+
+    `rules` re-checks the file's mtime and size at most every
+    `check_interval` seconds and recompiles when they change. A file that
+    fails to compile leaves the previous rules in place and is reported in
+    `last_error`.
+    """
+
+    def __init__(self, path=None, check_interval: float = 1.0, clock=time.monotonic):
+        self.path = Path(path or os.getenv("AURA_RULES_PATH") or DEFAULT_RULES_PATH)
+        self.check_interval = check_interval
+        self.last_error = None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = None
+        self._rules = None
+        self.reload()
+
+    def _file_stamp(self):
+        stat = self.path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile if the file changed (or always with `force`); True if reloaded."""
+        with self._lock:
+            self._checked_at = self._clock()
+            try:
+                stamp = self._file_stamp()
+            except OSError as exc:
+                if self._rules is None:
+                    raise
+                self.last_error = str(exc)
+                return False
+            if not force and stamp == self._stamp:
+                return False
+            try:
+                rules = cached("rules", self.path, load_rules)
+            except RuleError as exc:
+                if self._rules is None:
+                    raise
+                self.last_error = str(exc)
+                self._stamp = stamp
+                return False
+            self._rules, self._stamp, self.last_error = rules, stamp, None
+            return True
+
+    @property
+    def rules(self) -> CompiledRules:
+        if self._clock() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._rules
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_rule_engine() -> RuleEngine:
+    """Process-wide engine for AURA_RULES_PATH or data/card_rules.json."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RuleEngine()
+    return _engine
+
+
+def get_rules() -> CompiledRules:
+    """The current compiled rules (hot-reloaded)."""
+    return get_rule_engine().rules
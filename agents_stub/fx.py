@@ -0,0 +1,201 @@
+"""
+FX Rates
+Conversion of transaction amounts into the wallet's home currency from a
+local rates file, cached with an expiry and applied to whole columns at once
+
+Rates file (JSON, `data/fx_rates.json` or AURA_FX_RATES):
+
+    {
+      "base": "SGD",
+      "as_of": "2025-01-15",
+      "rates": {"USD": 1.3652, "JPY": 0.008681}
+    }
+
+Each rate is the value in the base currency of one unit of the quoted
+currency. Card caps, spend tiers and rewards are all in the base currency;
+a transaction in any other currency is overseas spend. A missing currency
+is the base currency; one the file does not quote is an error.
+
+Batch callers encode a currency column to indexes into the rate table once
+(`encode`, or `encode_table` for dictionary-encoded columns) and convert
+every amount with one multiply (`convert`).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .reference import cached
+
+DEFAULT_RATES_PATH = Path(__file__).resolve().parent.parent / "data" / "fx_rates.json"
+# Seconds a loaded rates file is served before the file is checked again.
+DEFAULT_TTL = 3600.0
+
+
+class FxError(ValueError):
+    """Raised for a malformed rates file or a currency it does not quote."""
+
+
+class FxRates:
+    """
+    An immutable rate table from one rates file.
+
+    The base currency is code 0, so a column of codes doubles as an
+    overseas mask (`codes != 0`).
+    """
+
+    def __init__(self, base: str, rates: dict, as_of: str = "", digest: str = ""):
+        self.base = base
+        self.as_of = as_of
+        self.codes = (base, *sorted(code for code in rates if code != base))
+        self.rates = np.array([1.0] + [float(rates[code]) for code in self.codes[1:]])
+        self.rates.setflags(write=False)
+        self._index = {code: i for i, code in enumerate(self.codes)}
+        self._index[None] = self._index[""] = 0
+        self.version = f"{as_of}+{digest}" if digest else as_of
+
+    def index(self, currency) -> int:
+        """Position of a currency in `codes`."""
+        i = self._index.get(currency)
+        if i is None:
+            i = self._index.get(str(currency).strip().upper())
+            if i is None:
+                raise FxError(f"no {self.base} rate for currency {currency!r}")
+        return i
+
+    def rate(self, currency) -> float:
+        """Base-currency value of one unit of `currency`."""
+        return float(self.rates[self.index(currency)])
+
+    def is_foreign(self, currency) -> bool:
+        return self.index(currency) != 0
+
+    def to_base(self, amount: float, currency) -> float:
+        """One amount in the base currency."""
+        i = self.index(currency)
+        return amount if i == 0 else amount * float(self.rates[i])
+
+    def encode(self, currencies) -> np.ndarray:
+        """Rate-table indexes for a sequence of currency codes (None = base)."""
+        index = self._index
+        try:
+            return np.fromiter((index[c] for c in currencies), dtype=np.intp, count=len(currencies))
+        except KeyError:
+            return np.fromiter((self.index(c) for c in currencies), dtype=np.intp, count=len(currencies))
+
+    def encode_table(self, table) -> np.ndarray:
+        """
+        Rate-table indexes for the values of a dictionary-encoded currency
+        column, plus a trailing base entry so a missing code (-1) maps to
+        the base currency: `encode_table(values)[codes]`.
+        """
+        return np.append(self.encode(list(table)), 0).astype(np.intp)
+
+    def convert(self, amounts: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Amounts in the base currency, given their rate-table indexes."""
+        return amounts * self.rates[codes]
+
+
+def _parse(data: dict, where, digest: str = "") -> FxRates:
+    base = data.get("base")
+    if not isinstance(base, str) or not base:
+        raise FxError(f"{where}: 'base' must be a currency code")
+    rates = data.get("rates")
+    if not isinstance(rates, dict):
+        raise FxError(f"{where}: 'rates' must be an object of currency -> rate")
+    for code, rate in rates.items():
+        if not isinstance(rate, (int, float)) or isinstance(rate, bool) or rate <= 0:
+            raise FxError(f"{where}: rate for {code} must be a positive number, got {rate!r}")
+    if rates.get(base, 1.0) != 1.0:
+        raise FxError(f"{where}: the base currency {base} must have rate 1")
+    return FxRates(base, rates, str(data.get("as_of", "")), digest)
+
+
+def load_rates(path) -> FxRates:
+    """Read and validate a rates file."""
+    raw = Path(path).read_bytes()
+    try:
+        data = json.loads(raw)
+    except ValueError as exc:
+        raise FxError(f"{path}: {exc}") from exc
+    return _parse(data, path, hashlib.sha1(raw).hexdigest()[:8])
+
+
+class FxEngine:
+    """
+    Holds the current FxRates for a rates file.
+
+    Loaded rates are served for `ttl` seconds; the first read after that
+    re-checks the file's mtime and size and reloads it when they changed.
+    A file that fails to load leaves the previous rates in place and is
+    reported in `last_error`.
+    """
+
+    def __init__(self, path=None, ttl: float = None, clock=time.monotonic):
+        self.path = Path(path or os.getenv("AURA_FX_RATES") or DEFAULT_RATES_PATH)
+        self.ttl = float(ttl if ttl is not None else os.getenv("AURA_FX_TTL") or DEFAULT_TTL)
+        self.last_error = None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._expires_at = None
+        self._rates = None
+        self.reload()
+
+    def _file_stamp(self):
+        stat = self.path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """Reload if the file changed (or always with `force`); True if reloaded."""
+        with self._lock:
+            self._expires_at = self._clock() + self.ttl
+            try:
+                stamp = self._file_stamp()
+            except OSError as exc:
+                if self._rates is None:
+                    raise
+                self.last_error = str(exc)
+                return False
+            if not force and stamp == self._stamp:
+                return False
+            try:
+                rates = cached("fx_rates", self.path, load_rates)
+            except FxError as exc:
+                if self._rates is None:
+                    raise
+                self.last_error = str(exc)
+                self._stamp = stamp
+                return False
+            self._rates, self._stamp, self.last_error = rates, stamp, None
+            return True
+
+    @property
+    def rates(self) -> FxRates:
+        if self._clock() >= self._expires_at:
+            self.reload()
+        return self._rates
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_fx_engine() -> FxEngine:
+    """Process-wide engine for AURA_FX_RATES or data/fx_rates.json."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = FxEngine()
+    return _engine
+
+
+def get_fx_rates() -> FxRates:
+    """The current rates (reloaded when the cache expires and the file changed)."""
+    return get_fx_engine().rates
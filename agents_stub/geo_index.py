@@ -0,0 +1,231 @@
+"""
+Merchant Location Index
+Grid (geohash-style) spatial index over known merchant branches
+
+Branch coordinates are bucketed into square cells a little larger than the
+search radius, so a proximity query only has to look at the block of cells
+around the point (3x3 at Singapore's latitude): a few dict lookups and a handful of distance checks,
+independent of how many branches are indexed.
+
+Locations file: CSV with header `merchant,branch,area,lat,lng,mcc,category`.
+"""
+
+import csv
+import math
+import os
+import threading
+from pathlib import Path
+
+from .mcc_index import MIN_SCORE, compact, similarity
+from .reference import cached
+
+DEFAULT_LOCATIONS_PATH = Path(__file__).resolve().parent.parent / "data" / "merchant_locations.csv"
+
+# A branch counts as "here" within this distance of the reported coordinate.
+RADIUS_M = 250.0
+
+_M_PER_DEG_LAT = 110_574.0
+_M_PER_DEG_LNG = 111_320.0
+# Cell edge in degrees: just over RADIUS_M north-south. East-west cells
+# shrink with cos(latitude); `_within` widens its reach to compensate.
+_CELL_DEG = RADIUS_M / _M_PER_DEG_LAT * 1.01
+
+# Coordinates in the same cell of this size share a cached classification
+# (see `cache_cell`). Small next to RADIUS_M, so within one cell the branch
+# found and its reported distance barely move.
+CACHE_CELL_M = 20.0
+_CACHE_CELL_DEG = CACHE_CELL_M / _M_PER_DEG_LAT
+
+
+_BIGRAM_CODES = {ch: i for i, ch in enumerate("0123456789abcdefghijklmnopqrstuvwxyz")}
+
+
+def _bigram_mask(key: str) -> int:
+    """Bit set of the distinct character bigrams in a compacted name."""
+    codes = _BIGRAM_CODES
+    mask = 0
+    for a, b in zip(key, key[1:]):
+        mask |= 1 << (codes[a] * 36 + codes[b])
+    return mask
+
+
+def _max_edits(name_len: int, query_len: int, min_score: float) -> float:
+    """Largest edit distance at which `similarity` can still reach `min_score`."""
+    edits = -1.0
+    whole = (1 - min_score) * max(name_len, query_len)
+    if abs(name_len - query_len) <= whole + 1e-9:
+        edits = whole
+    if name_len < query_len:
+        edits = max(edits, name_len * (1 - min_score / (0.75 + 0.25 * name_len / query_len)))
+    # Distances are whole numbers; the epsilon absorbs float rounding.
+    return math.floor(edits + 1e-9)
+
+
+def _cell(lat: float, lng: float) -> tuple:
+    return math.floor(lat / _CELL_DEG), math.floor(lng / _CELL_DEG)
+
+
+def cache_cell(lat, lng):
+    """Grid cell of about CACHE_CELL_M around a coordinate, or None without one."""
+    if lat is None or lng is None:
+        return None
+    return math.floor(float(lat) / _CACHE_CELL_DEG), math.floor(float(lng) / _CACHE_CELL_DEG)
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular distance in metres; accurate to well under 1% at city scale."""
+    dy = (lat2 - lat1) * _M_PER_DEG_LAT
+    dx = (lng2 - lng1) * _M_PER_DEG_LNG * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
+
+
+class LocationIndex:
+    """
+    Spatial hash of merchant branches.
+
+    Rows are kept in parallel lists; `cells` maps a grid cell to the row ids
+    inside it.
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: Iterable of dicts with merchant, branch, area, lat, lng,
+                mcc and category
+        """
+        self.merchants, self.branches, self.areas = [], [], []
+        self.lats, self.lngs = [], []
+        self.mccs, self.categories = [], []
+        self.keys, self.masks = [], []
+        self.cells = {}
+
+        for row in rows:
+            try:
+                lat, lng = float(row["lat"]), float(row["lng"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            i = len(self.merchants)
+            self.merchants.append(row["merchant"])
+            self.branches.append(row.get("branch") or "")
+            self.areas.append(row.get("area") or "")
+            self.lats.append(lat)
+            self.lngs.append(lng)
+            self.mccs.append(int(row["mcc"]))
+            self.categories.append(row["category"])
+            self.keys.append(compact(row["merchant"]))
+            self.masks.append(_bigram_mask(self.keys[-1]))
+            self.cells.setdefault(_cell(lat, lng), []).append(i)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(csv.DictReader(f))
+
+    def __len__(self):
+        return len(self.merchants)
+
+    def _entry(self, i: int, dist: float, score: float = None) -> dict:
+        entry = {
+            "merchant": self.merchants[i],
+            "branch": self.branches[i],
+            "area": self.areas[i],
+            "mcc": self.mccs[i],
+            "category": self.categories[i],
+            "distance_m": dist,
+        }
+        if score is not None:
+            entry["score"] = score
+        return entry
+
+    def _within(self, lat: float, lng: float, radius_m: float):
+        """(distance, row id) for every branch within `radius_m`, nearest first."""
+        ci, cj = _cell(lat, lng)
+        reach_i = math.ceil(radius_m / (_CELL_DEG * _M_PER_DEG_LAT))
+        reach_j = math.ceil(radius_m / (_CELL_DEG * _M_PER_DEG_LNG * max(math.cos(math.radians(lat)), 1e-6)))
+        cells = self.cells
+        hits = []
+        for di in range(-reach_i, reach_i + 1):
+            for dj in range(-reach_j, reach_j + 1):
+                for i in cells.get((ci + di, cj + dj), ()):
+                    dist = distance_m(lat, lng, self.lats[i], self.lngs[i])
+                    if dist <= radius_m:
+                        hits.append((dist, i))
+        hits.sort()
+        return hits
+
+    def nearby(self, lat: float, lng: float, merchant: str = None, radius_m: float = RADIUS_M,
+               k: int = 10) -> list:
+        """
+        Branches near a coordinate.
+
+        Args:
+            lat, lng: Query coordinate
+            merchant: Optional merchant string; each result is then scored
+                against it by merchant name and sorted best match first
+            radius_m: Search radius in metres
+            k: Maximum number of results
+
+        Returns:
+            List of dicts with merchant, branch, area, mcc, category,
+            distance_m and, when `merchant` is given, score
+        """
+        hits = self._within(lat, lng, radius_m)
+        if merchant is None:
+            return [self._entry(i, dist) for dist, i in hits[:k]]
+
+        key = compact(merchant)
+        scored = []
+        for dist, i in hits:
+            score = similarity(self.keys[i], key)
+            scored.append((-score, dist, i))
+        scored.sort()
+        return [self._entry(i, dist, -neg) for neg, dist, i in scored[:k]]
+
+    def best(self, lat: float, lng: float, merchant: str, min_score: float = MIN_SCORE,
+             radius_m: float = RADIUS_M):
+        """Closest branch within `radius_m` whose name matches `merchant`, or None."""
+        key = compact(merchant)
+        if not key:
+            return None
+        query_mask = _bigram_mask(key)
+        for dist, i in self._within(lat, lng, radius_m):
+            if self._may_match(self.keys[i], self.masks[i], key, query_mask, min_score):
+                score = similarity(self.keys[i], key)
+                if score >= min_score:
+                    return self._entry(i, dist, score)
+        return None
+
+    @staticmethod
+    def _may_match(name_key: str, name_mask: int, key: str, query_mask: int, min_score: float) -> bool:
+        """
+        Cheap necessary condition for similarity(name_key, key) >= min_score.
+
+        Each edit destroys at most two of the name's bigrams, so a name within
+        d edits of (a substring of) the query shares at least
+        distinct_bigrams(name) - 2d distinct bigrams with it.
+        """
+        if not name_key:
+            return False
+        edits = _max_edits(len(name_key), len(key), min_score)
+        if edits < 0:
+            return False
+        return (name_mask & query_mask).bit_count() >= name_mask.bit_count() - 2 * edits
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_location_index():
+    """
+    Process-wide index for AURA_MERCHANT_LOCATIONS or
+    data/merchant_locations.csv, loaded on first use; None if the file does
+    not exist.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = Path(os.getenv("AURA_MERCHANT_LOCATIONS") or DEFAULT_LOCATIONS_PATH)
+                _index = cached("locations", path, LocationIndex.from_csv) if path.exists() else False
+    return _index or None
@@ -0,0 +1,296 @@
+"""
+Insights Engine
+Category spend, per-card rewards, monthly target progress and missed-reward
+tips computed from transaction history in one streaming pass
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+from .cache import ResultCache
+from .card_rules import get_rules
+from .fx import get_fx_rates
+from .models import TransactionArray
+from .scoring_engine import reward_matrix
+from .store import DEFAULT_USER, get_transaction_store
+
+MAX_TIPS = 5
+
+# Insights per (store, user, newest row, wallet, rules, FX rates): the pages
+# rerun on every widget interaction, but the history only changes on a payment.
+INSIGHTS_CACHE = ResultCache(maxsize=64, ttl=None)
+
+
+def _sum_into(total, part):
+    """Add a groupby result into a running total, aligning on the index."""
+    if total is None:
+        return part
+    return total.add(part, fill_value=0)
+
+
+class InsightsAccumulator:
+    """
+    Folds history chunks into running totals.
+
+    Each chunk is a DataFrame with month (or timestamp), amount, card_used,
+    reward and category columns, and optionally currency and base_amount
+    (see `TransactionStore.iter_frames`). Spend is summed from base_amount,
+    taken to be amount when absent; the re-score converts amount from its
+    currency itself. Per chunk the work
+    is a handful of groupbys plus one vectorized re-score against the whole
+    wallet, so memory stays bounded by the chunk size however long the
+    history is.
+
+    Missed rewards compare the best card in the wallet with the card that
+    was actually used, both valued by the scoring engine before caps (the
+    cap position at the time of a past payment is not known).
+    """
+
+    def __init__(self, cards: list):
+        self.cards = list(cards)
+        self._card_index = {card["display_name"]: j for j, card in enumerate(self.cards)}
+        self.category_spend = None
+        self.card_rewards = None
+        self.month_card_rewards = None
+        self.missed = None
+        self.months = set()
+        self.spend = 0.0
+        self.rewards = 0.0
+        self.count = 0
+
+    def update(self, frame: pd.DataFrame):
+        """Fold one chunk of history into the totals."""
+        if frame.empty:
+            return
+        frame = frame.assign(
+            category=frame["category"].fillna("General"),
+            card_used=frame["card_used"].fillna("Unknown"),
+        )
+        if "month" not in frame.columns:
+            frame["month"] = frame["timestamp"].str[:7]
+        if "base_amount" not in frame.columns:
+            frame["base_amount"] = frame["amount"]
+
+        self.spend += float(frame["base_amount"].sum())
+        self.rewards += float(frame["reward"].sum())
+        self.count += len(frame)
+        self.months.update(frame["month"].unique().tolist())
+
+        self.category_spend = _sum_into(
+            self.category_spend, frame.groupby("category", sort=False)["base_amount"].sum()
+        )
+        self.card_rewards = _sum_into(
+            self.card_rewards, frame.groupby("card_used", sort=False)["reward"].sum()
+        )
+        self.month_card_rewards = _sum_into(
+            self.month_card_rewards,
+            frame.groupby(["month", "card_used"], sort=False)["reward"].sum(),
+        )
+
+        if self.cards:
+            self._update_missed(frame)
+
+    def _update_missed(self, frame: pd.DataFrame):
+        uncapped = reward_matrix(frame, self.cards)["uncapped"]
+        rows = np.arange(len(frame))
+        best = uncapped.argmax(axis=1)
+        best_value = uncapped[rows, best]
+
+        # Value of the card actually used; cards no longer in the wallet fall
+        # back to the reward that was recorded for the payment.
+        used = frame["card_used"].map(self._card_index).to_numpy(dtype=np.float64, na_value=-1)
+        used = used.astype(np.intp)
+        in_wallet = used >= 0
+        actual = frame["reward"].to_numpy(dtype=np.float64, na_value=0.0).copy()
+        actual[in_wallet] = uncapped[rows[in_wallet], used[in_wallet]]
+
+        lost = best_value - actual
+        mask = lost > 0.005
+        if not mask.any():
+            return
+        names = np.array([card["display_name"] for card in self.cards], dtype=object)
+        missed = pd.DataFrame({
+            "category": frame["category"].to_numpy()[mask],
+            "best_card": names[best[mask]],
+            "lost": lost[mask],
+        })
+        self.missed = _sum_into(
+            self.missed,
+            missed.groupby(["category", "best_card"], sort=False)["lost"].agg(["sum", "count"]),
+        )
+
+    def monthly_targets(self, month: str = None) -> list:
+        """
+        Reward earned this month on each wallet card against its monthly cap.
+
+        `month` defaults to the latest month in the history.
+        """
+        month = month or (max(self.months) if self.months else None)
+        earned = {}
+        if month and self.month_card_rewards is not None and month in self.month_card_rewards.index:
+            earned = self.month_card_rewards.loc[month].to_dict()
+
+        targets = []
+        for card in self.cards:
+            cap = float(card.get("monthly_cap") or 0)
+            if cap <= 0:
+                continue
+            value = float(earned.get(card["display_name"], 0.0))
+            targets.append({
+                "name": card["display_name"],
+                "card_id": card.get("id"),
+                "target": f"${cap:,.0f} reward cap",
+                "earned": round(value, 2),
+                "remaining": round(max(cap - value, 0.0), 2),
+                "progress": int(min(value / cap, 1.0) * 100),
+            })
+        return targets
+
+    def optimization_tips(self, limit: int = MAX_TIPS) -> list:
+        """Largest missed-reward patterns, as an average per month."""
+        if self.missed is None or self.missed.empty:
+            return []
+        n_months = max(len(self.months), 1)
+        top = self.missed.sort_values("sum", ascending=False).head(limit)
+        return [
+            {
+                "tip": f"Switch to {best_card} for {category.lower()}",
+                "category": category,
+                "card": best_card,
+                "transactions": int(row["count"]),
+                "missed_total": round(float(row["sum"]), 2),
+                "potential": round(float(row["sum"]) / n_months, 2),
+            }
+            for (category, best_card), row in top.iterrows()
+        ]
+
+    def result(self, month: str = None) -> dict:
+        """The insights payload rendered by the Insights and Home pages."""
+        def as_dict(series):
+            if series is None:
+                return {}
+            return {k: round(float(v), 2) for k, v in series.sort_values(ascending=False).items()}
+
+        return {
+            "spending_by_category": as_dict(self.category_spend),
+            "rewards_by_card": as_dict(self.card_rewards),
+            "optimization_tips": self.optimization_tips(),
+            "monthly_targets": self.monthly_targets(month),
+            "summary": {
+                "spend": self.spend,
+                "rewards": self.rewards,
+                "count": self.count,
+                "months": len(self.months),
+                "effective_rate": (self.rewards / self.spend) * 100 if self.spend else 0.0,
+            },
+        }
+
+
+def compute_insights(frames, cards: list, month: str = None) -> dict:
+    """
+    Insights from an iterable of history DataFrames (or a single DataFrame).
+
+    Args:
+        frames: DataFrame or iterable of DataFrame chunks
+        cards: The user's wallet, used to re-score past transactions
+        month: 'YYYY-MM' for monthly targets; defaults to the latest month
+
+    Returns:
+        Dict with spending_by_category, rewards_by_card, optimization_tips,
+        monthly_targets and summary
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    acc = InsightsAccumulator(cards)
+    for frame in frames:
+        acc.update(frame)
+    return acc.result(month)
+
+
+def history_frame(txns) -> pd.DataFrame:
+    """
+    Columnar history from transaction dicts (e.g. the bundled mock data), a
+    `TransactionArchive` or a `TransactionArray`. Everything goes through
+    TransactionArray, so archive columns are read without building dicts;
+    base_amount is converted at the current FX rates.
+    """
+    txns = TransactionArray.of(txns)
+    fx = get_fx_rates()
+    frame = txns.to_frame(["timestamp", "amount", "currency", "card_used", "reward", "category"])
+    codes = fx.encode_table(txns.dictionaries["currency"])[txns.column("currency")]
+    return pd.DataFrame({
+        "month": np.datetime_as_string(frame["timestamp"].to_numpy(), unit="M"),
+        "amount": frame["amount"],
+        "currency": frame["currency"].astype(object),
+        "base_amount": fx.convert(frame["amount"].to_numpy(), codes),
+        "card_used": frame["card_used"].astype(object),
+        "reward": frame["reward"],
+        "category": frame["category"].astype(object),
+    })
+
+
+def _wallet_key(cards: list) -> tuple:
+    """The card fields insights depend on: names and ids, caps, and tier spend."""
+    return tuple(
+        (card.get("id"), card.get("display_name"), card.get("monthly_cap"), card.get("spend_this_month"))
+        for card in cards
+    )
+
+
+def insights_for_user(cards: list, user_id: str = DEFAULT_USER, store=None,
+                      since: str = None, month: str = None, chunk_size: int = 50_000,
+                      use_cache: bool = True) -> dict:
+    """
+    Insights over a user's stored history, streamed in chunks.
+
+    With `use_cache`, the result is kept in INSIGHTS_CACHE until the user's
+    newest row id, the wallet, the rules or the FX rates change, so reruns
+    that do not follow a payment cost one index seek. Callers get their own
+    copy.
+    """
+    store = store or get_transaction_store()
+    key = None
+    if use_cache:
+        key = (store.path, user_id, store.last_id(user_id), since, month,
+               _wallet_key(cards), get_rules().version, get_fx_rates().version)
+        cached = INSIGHTS_CACHE.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+    frames = store.iter_frames(
+        user_id=user_id, since=since, chunk_size=chunk_size,
+        columns=("month", "amount", "currency", "base_amount", "card_used", "reward", "category"),
+        ordered=False,
+    )
+    insights = compute_insights(frames, cards, month)
+    if key is not None:
+        INSIGHTS_CACHE.put(key, copy.deepcopy(insights))
+    return insights
+
+
+def headline_insights(insights: dict, limit: int = 4) -> list:
+    """Short sentences for the Home dashboard."""
+    lines = []
+    summary = insights["summary"]
+    if summary["count"]:
+        lines.append(f"You are earning {summary['effective_rate']:.1f}% average back on your spending")
+
+    tips = insights["optimization_tips"]
+    if tips:
+        tip = tips[0]
+        lines.append(f"{tip['tip']}: about ${tip['potential']:.2f} more per month")
+
+    targets = insights["monthly_targets"]
+    if targets:
+        roomiest = max(targets, key=lambda t: t["remaining"])
+        lines.append(f"{roomiest['name']} has ${roomiest['remaining']:.2f} remaining in its reward cap")
+        nearly = [t for t in targets if t["progress"] >= 90]
+        if nearly:
+            lines.append(f"{nearly[0]['name']} is at {nearly[0]['progress']}% of its monthly cap")
+
+    if summary["count"] and insights["spending_by_category"]:
+        top_category = next(iter(insights["spending_by_category"]))
+        lines.append(f"{top_category} is your biggest spending category")
+    return lines[:limit]
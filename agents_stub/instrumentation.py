@@ -0,0 +1,280 @@
+"""
+Pipeline Instrumentation
+Timing spans, counters and pluggable exporters for the recommendation stages
+"""
+
+import io
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in microseconds (log-ish scale); the last
+# bucket catches everything slower.
+BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000,
+              10_000, 20_000, 50_000, 100_000, 200_000, 500_000, 1_000_000)
+
+
+def bucket_labels() -> list:
+    """Human-readable label for every histogram bucket."""
+    def fmt(us):
+        return f"{us / 1000:g}ms" if us >= 1000 else f"{us}us"
+    return [f"<={fmt(us)}" for us in BUCKETS_US] + [f">{fmt(BUCKETS_US[-1])}"]
+
+
+class LatencyStats:
+    """Fixed-bucket latency histogram with count/total/min/max; O(1) memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * (len(BUCKETS_US) + 1)
+
+    def add(self, duration_ns: int):
+        self.count += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[bisect_left(BUCKETS_US, duration_ns / 1000)] += 1
+
+    def percentile(self, q: float) -> float:
+        """Approximate percentile in milliseconds (bucket upper bound)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                upper_us = BUCKETS_US[i] if i < len(BUCKETS_US) else self.max_ns / 1000
+                return min(upper_us, self.max_ns / 1000) / 1000
+        return self.max_ns / 1e6
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "min_ms": (self.min_ns or 0) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": list(self.buckets),
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent span records in a bounded deque."""
+
+    def __init__(self, maxlen: int = 1000):
+        self.records = deque(maxlen=maxlen)
+
+    def export(self, record: dict):
+        self.records.append(record)
+
+    def clear(self):
+        self.records.clear()
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per span to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class CallbackExporter:
+    """Hands every span record to a user-supplied function."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def export(self, record: dict):
+        self.callback(record)
+
+
+class Instrumentation:
+    """
+    Collects spans and counters for the pipeline.
+
+    Spans always feed the per-stage latency histograms; full span records
+    are only built when at least one exporter is attached. `profile` wraps
+    the outermost span of each thread in cProfile and `trace_memory` records
+    each span's tracemalloc peak above the memory in use when it started.
+
+    tracemalloc is process-wide: it is started by the outermost traced span
+    (unless something else already started it) and stopped when the last
+    one ends, and allocations by other threads or coroutines count towards
+    a span's peak.
+    """
+
+    def __init__(self, exporters=None, enabled: bool = True,
+                 profile: bool = False, trace_memory: bool = False):
+        self.exporters = list(exporters or [])
+        self.enabled = enabled
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._memory_frames = []     # [baseline, peak] of traced spans open, in every thread
+        self._memory_owned = False   # tracemalloc was started by us
+
+    def configure(self, enabled: bool = None, profile: bool = None, trace_memory: bool = None):
+        """Change capture modes at runtime."""
+        if enabled is not None:
+            self.enabled = enabled
+        if profile is not None:
+            self.profile = profile
+        if trace_memory is not None:
+            self.trace_memory = trace_memory
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        return exporter
+
+    def remove_exporter(self, exporter):
+        if exporter in self.exporters:
+            self.exporters.remove(exporter)
+
+    def incr(self, name: str, value: int = 1):
+        """Increment a named counter."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block as stage `name`."""
+        if not self.enabled:
+            yield
+            return
+
+        local = self._local
+        profiler = None
+        if self.profile and not getattr(local, "profiling", False):
+            import cProfile
+
+            profiler = cProfile.Profile()
+            local.profiling = True
+        memory = self._memory_enter() if self.trace_memory else None
+
+        error = None
+        start_ns = time.perf_counter_ns()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+                local.profiling = False
+            duration_ns = time.perf_counter_ns() - start_ns
+            peak_kib = self._memory_exit(memory) if memory is not None else None
+            self._record(name, duration_ns, attrs, error, profiler, peak_kib)
+
+    def _memory_enter(self) -> list:
+        """
+        Start tracing for the outermost traced span and open a [baseline,
+        peak] frame for this one. The peak so far is saved into every open
+        frame, in any thread or coroutine, before the shared peak is reset.
+        """
+        import tracemalloc
+
+        with self._lock:
+            if not self._memory_frames and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._memory_owned = True
+            current, peak = tracemalloc.get_traced_memory()
+            for open_frame in self._memory_frames:
+                open_frame[1] = max(open_frame[1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            self._memory_frames.append(frame)
+        return frame
+
+    def _memory_exit(self, frame: list):
+        """Close a frame from `_memory_enter`; returns its peak in KiB above the baseline."""
+        import tracemalloc
+
+        with self._lock:
+            # Spans in interleaved coroutines or other threads need not
+            # close in the order they opened: remove this one by identity.
+            self._memory_frames.remove(frame)
+            peak_kib = None
+            if tracemalloc.is_tracing():
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                peak_kib = max(peak - frame[0], 0) // 1024
+
+            if not self._memory_frames and self._memory_owned:
+                self._memory_owned = False
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+        return peak_kib
+
+    def _record(self, name, duration_ns, attrs, error, profiler, peak_kib=None):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = LatencyStats()
+            stats.add(duration_ns)
+
+        if not self.exporters:
+            return
+
+        record = {
+            "span": name,
+            "ts": time.time(),
+            "duration_ms": duration_ns / 1e6,
+            "thread": threading.current_thread().name,
+        }
+        if attrs:
+            record["attrs"] = attrs
+        if error:
+            record["error"] = error
+        if peak_kib is not None:
+            record["peak_mem_kib"] = peak_kib
+        if profiler:
+            import pstats
+
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+            record["profile"] = out.getvalue()
+
+        for exporter in list(self.exporters):
+            exporter.export(record)
+
+    def snapshot(self) -> dict:
+        """Current per-stage latency stats and counters."""
+        with self._lock:
+            return {
+                "stages": {name: stats.as_dict() for name, stats in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+
+# Process-wide default used by the pipeline and the Streamlit sidebar.
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,394 @@
+"""
+Reward Cap Ledger
+Monthly reward and spend per card, kept by card id with per-card locks, an
+append-only event log and periodic snapshots
+
+A card's usage this month (reward counted against `monthly_cap`, spend for
+tiers and reward per category for sub-caps) is the sum of its events for
+the month in `cap_events`, a table in the transaction database. A payment
+appends one event; a card the ledger has not seen yet is opened with the
+usage in its wallet entry. Events are deltas, so writers never overwrite
+each other, and a new month starts every card from zero.
+
+A payment takes its card's lock, then one short write transaction that
+folds in events other workers appended for that card, clamps the reward to
+what is left under the caps and appends the event: payments on different
+cards do not wait for each other's accounting, and payments on the same
+card, in any process, never credit more than its cap between them.
+
+`record` can also run a caller's write in the same transaction, which is
+how a payment's transaction row (see `aggregates.record_payment`) and its
+cap event are committed together or not at all.
+
+Every `snapshot_every` events the folded state is written to
+`cap_snapshots`; a new process loads the latest snapshot and replays only
+the events after it.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .store import DEFAULT_DB_PATH, DEFAULT_USER
+
+SNAPSHOT_EVERY = 1000
+SNAPSHOTS_KEPT = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cap_events (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id   TEXT    NOT NULL,
+    card_id   TEXT    NOT NULL,
+    month     TEXT    NOT NULL,
+    kind      TEXT    NOT NULL,   -- 'open' (wallet balance) or 'payment'
+    reward    REAL    NOT NULL,
+    spend     REAL    NOT NULL,
+    category  TEXT,
+    ts        TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cap_events_card ON cap_events (user_id, card_id, seq);
+-- Every account folded up to event `seq`, as JSON.
+CREATE TABLE IF NOT EXISTS cap_snapshots (
+    seq       INTEGER PRIMARY KEY,
+    taken_at  TEXT    NOT NULL,
+    state     TEXT    NOT NULL
+);
+"""
+
+_EVENT_COLUMNS = "seq, month, reward, spend, category"
+
+
+class UnknownCard(LookupError):
+    """Raised when recording against a card the ledger has not opened."""
+
+
+def current_month() -> str:
+    return datetime.now().strftime("%Y-%m")
+
+
+class _Account:
+    """One card's usage for `month`, folded up to event `seq` (0: never opened)."""
+
+    __slots__ = ("month", "used", "spend", "category_used", "seq", "cap", "lock")
+
+    def __init__(self, month: str = "", used: float = 0.0, spend: float = 0.0,
+                 category_used: dict = None, seq: int = 0):
+        self.month = month
+        self.used = used
+        self.spend = spend
+        self.category_used = category_used or {}
+        self.seq = seq
+        self.cap = math.inf
+        self.lock = threading.Lock()
+
+    def apply(self, seq: int, month: str, reward: float, spend: float, category):
+        """Fold in one event; events already folded in are ignored."""
+        if seq <= self.seq:
+            return
+        self.seq = seq
+        if month < self.month:
+            return  # late event for a month that is over
+        if month > self.month:
+            self.month, self.used, self.spend, self.category_used = month, 0.0, 0.0, {}
+        self.used += reward
+        self.spend += spend
+        if category is not None:
+            self.category_used[category] = self.category_used.get(category, 0.0) + reward
+
+    def usage(self, month: str) -> dict:
+        """Card usage fields for `month`."""
+        if month != self.month:
+            return {"used_this_month": 0.0, "spend_this_month": 0.0, "category_used": {}}
+        return {
+            "used_this_month": self.used,
+            "spend_this_month": self.spend,
+            "category_used": dict(self.category_used),
+        }
+
+
+class CapLedger:
+    """
+    Card usage for every wallet in one database.
+
+    Connections are per thread, like the transaction store's. Caps are
+    remembered from the cards passed to `wallet`; a card whose cap the
+    ledger has not been given is not clamped.
+    """
+
+    def __init__(self, path=None, snapshot_every: int = SNAPSHOT_EVERY):
+        self.path = str(path or os.getenv("AURA_DB_PATH") or DEFAULT_DB_PATH)
+        self.snapshot_every = snapshot_every
+        self._local = threading.local()
+        self._accounts_lock = threading.Lock()   # creating accounts only
+        self._refresh_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._since_snapshot = 0
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._accounts, self._seen = self._load(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _load(conn) -> tuple:
+        """Accounts from the latest snapshot plus the events after it, and the last seq."""
+        accounts, seq = {}, 0
+        # One read transaction, so the snapshot and the events agree.
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT seq, state FROM cap_snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+            if row is not None:
+                seq = row[0]
+                for user_id, card_id, month, used, spend, category_used, account_seq in json.loads(row[1]):
+                    accounts[(user_id, card_id)] = _Account(month, used, spend, category_used, account_seq)
+            events = conn.execute(
+                f"SELECT user_id, card_id, {_EVENT_COLUMNS} FROM cap_events WHERE seq > ? ORDER BY seq",
+                (seq,),
+            )
+            for user_id, card_id, *event in events:
+                account = accounts.get((user_id, card_id))
+                if account is None:
+                    account = accounts[(user_id, card_id)] = _Account()
+                account.apply(*event)
+                seq = event[0]
+        finally:
+            conn.commit()
+        return accounts, seq
+
+    def _account(self, key: tuple) -> _Account:
+        account = self._accounts.get(key)
+        if account is None:
+            with self._accounts_lock:
+                account = self._accounts.setdefault(key, _Account())
+        return account
+
+    @staticmethod
+    def _catch_up(conn, key: tuple, account: _Account):
+        """Fold in this card's events appended by other workers."""
+        rows = conn.execute(
+            f"SELECT {_EVENT_COLUMNS} FROM cap_events WHERE user_id = ? AND card_id = ? AND seq > ? ORDER BY seq",
+            (*key, account.seq),
+        )
+        for row in rows:
+            account.apply(*row)
+
+    @staticmethod
+    def _append(conn, key: tuple, month: str, kind: str, reward: float, spend: float, category) -> int:
+        cur = conn.execute(
+            "INSERT INTO cap_events (user_id, card_id, month, kind, reward, spend, category, ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key, month, kind, reward, spend, category, datetime.now().isoformat()),
+        )
+        return cur.lastrowid
+
+    def _write(self, key: tuple, account: _Account, events, write=None) -> int:
+        """
+        Append events for one account, with its lock held: catch up, let
+        `events(account)` return (month, kind, reward, spend, category)
+        tuples, append them, run `write(conn)` if given, commit and fold
+        them in. Returns how many were appended.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._catch_up(conn, key, account)
+            appended = [(self._append(conn, key, *event), event) for event in events(account)]
+            if write is not None:
+                write(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        for seq, (month, _, reward, spend, category) in appended:
+            account.apply(seq, month, reward, spend, category)
+        return len(appended)
+
+    def _open(self, key: tuple, account: _Account, card: dict, month: str) -> int:
+        """Open a card at the usage in its wallet entry, unless some worker already has."""
+
+        def opening(account):
+            if account.seq:
+                return []
+            category_used = card.get("category_used") or {}
+            used = float(card.get("used_this_month", 0) or 0)
+            events = [(month, "open", used - sum(category_used.values()),
+                       float(card.get("spend_this_month", 0) or 0), None)]
+            events += [(month, "open", float(value), 0.0, category) for category, value in category_used.items()]
+            return events
+
+        return self._write(key, account, opening)
+
+    def refresh(self) -> int:
+        """Fold in events any worker appended since the last refresh; returns how many."""
+        with self._refresh_lock:
+            rows = self._conn().execute(
+                f"SELECT user_id, card_id, {_EVENT_COLUMNS} FROM cap_events WHERE seq > ? ORDER BY seq",
+                (self._seen,),
+            ).fetchall()
+            for user_id, card_id, *event in rows:
+                account = self._account((user_id, card_id))
+                with account.lock:
+                    account.apply(*event)
+            if rows:
+                self._seen = rows[-1][2]
+        return len(rows)
+
+    def wallet(self, cards: list, user_id: str = DEFAULT_USER, month: str = None) -> list:
+        """
+        The cards with their usage this month from the ledger.
+
+        Cards the ledger has not seen are opened with the usage in their own
+        entry, and every card's `monthly_cap` is remembered for clamping
+        payments. Cards without an id are copied unchanged.
+
+        Args:
+            cards: Wallet card dicts
+            user_id: Wallet owner
+            month: "YYYY-MM" (default: now)
+
+        Returns:
+            New card dicts; the inputs are not modified
+        """
+        month = month or current_month()
+        self.refresh()
+        wallet = []
+        opened = 0
+        for card in cards:
+            if card.get("id") is None:
+                wallet.append(dict(card))
+                continue
+            key = (user_id, card["id"])
+            account = self._account(key)
+            with account.lock:
+                if not account.seq:
+                    opened += self._open(key, account, card, month)
+                cap = card.get("monthly_cap")
+                account.cap = math.inf if cap is None else float(cap)
+                usage = account.usage(month)
+            wallet.append({**card, **usage})
+        if opened:
+            self._count_events(opened)
+        return wallet
+
+    def record(self, card_id: str, reward: float, spend: float = 0.0, category: str = None,
+               sub_cap: float = math.inf, user_id: str = DEFAULT_USER, month: str = None,
+               write=None) -> dict:
+        """
+        Count a confirmed payment against a card's caps.
+
+        The reward is clamped to what is left of the card's monthly cap and
+        the category's sub-cap when it is recorded, so payments confirmed at
+        the same time never credit more than the cap between them. If
+        `write` raises, the event is rolled back with it.
+
+        Args:
+            card_id: Card the payment was made with
+            reward: Reward the recommendation promised (SGD)
+            spend: Amount spent (SGD), for spend tiers
+            category: Rule category the reward counts against, for sub-caps
+            sub_cap: That category's sub-cap on this card (inf when none)
+            user_id: Wallet owner
+            month: "YYYY-MM" (default: now)
+            write: Called as write(conn, reward) with the reward credited,
+                on the ledger's connection inside the transaction that
+                appends the event
+
+        Returns:
+            Dict with the `reward` credited and the card's usage after it
+
+        Raises:
+            UnknownCard: if the card was never opened (see `wallet`)
+        """
+        month = month or current_month()
+        key = (user_id, card_id)
+        account = self._account(key)
+        credited = []
+
+        def payment(account):
+            if not account.seq:
+                raise UnknownCard(card_id)
+            usage = account.usage(month)
+            remaining = account.cap - usage["used_this_month"]
+            if category is not None and sub_cap != math.inf:
+                remaining = min(remaining, sub_cap - usage["category_used"].get(category, 0.0))
+            credited.append(min(max(reward, 0.0), max(remaining, 0.0)))
+            return [(month, "payment", credited[0], float(spend), category)]
+
+        with account.lock:
+            self._write(key, account, payment,
+                        None if write is None else lambda conn: write(conn, credited[0]))
+            result = {"reward": credited[0], **account.usage(month)}
+        self._count_events(1)
+        return result
+
+    def _count_events(self, n: int):
+        with self._snapshot_lock:
+            self._since_snapshot += n
+            due = self._since_snapshot >= self.snapshot_every
+            if due:
+                self._since_snapshot = 0
+        if due:
+            self.snapshot()
+
+    def snapshot(self) -> int:
+        """
+        Write the state of every account, folded from the log, to
+        cap_snapshots and drop all but the newest SNAPSHOTS_KEPT.
+
+        Returns:
+            Seq of the last event included (0 if the log is empty)
+        """
+        conn = self._conn()
+        # Built from the database rather than the live accounts, so no card
+        # lock is needed and the state is exactly the events up to `seq`.
+        accounts, seq = self._load(conn)
+        if not seq:
+            return 0
+        state = [
+            [user_id, card_id, a.month, a.used, a.spend, a.category_used, a.seq]
+            for (user_id, card_id), a in accounts.items()
+        ]
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO cap_snapshots (seq, taken_at, state) VALUES (?, ?, ?)",
+                (seq, datetime.now().isoformat(), json.dumps(state)),
+            )
+            conn.execute(
+                "DELETE FROM cap_snapshots WHERE seq NOT IN "
+                "(SELECT seq FROM cap_snapshots ORDER BY seq DESC LIMIT ?)",
+                (SNAPSHOTS_KEPT,),
+            )
+        return seq
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_cap_ledger() -> CapLedger:
+    """Process-wide ledger in the transaction database (AURA_DB_PATH or data/aura.db)."""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = CapLedger()
+    return _ledger
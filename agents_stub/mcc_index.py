@@ -0,0 +1,363 @@
+"""
+Merchant Reference Index
+Approximate merchant-name lookup against a local merchant -> MCC catalogue
+
+Names are reduced to their letters and digits ("Starbuck's" -> "starbucks",
+"DinTaiFung" -> "dintaifung") and indexed by character 4-gram in a
+compressed posting-list layout (numpy arrays, one sorted block per gram).
+A query gathers the postings of its rarest grams to pick a few dozen
+candidates, then re-ranks them with a bit-parallel (Myers) edit distance.
+
+Catalogue file: CSV with header `merchant,mcc,category`.
+"""
+
+import csv
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .reference import cached
+
+DEFAULT_CATALOGUE_PATH = Path(__file__).resolve().parent.parent / "data" / "merchant_mcc.csv"
+INDEX_SUFFIX = ".idx.npz"
+
+# a-z, 0-9 and the boundary pad; a gram of N codes has id sum(c_i * 37^(N-1-i)).
+_ALPHABET = 37
+_PAD = 36
+GRAM = 4
+_GRAM_SPACE = _ALPHABET ** GRAM
+_CHAR_CODES = np.full(256, 255, dtype=np.uint8)
+_CHAR_CODES[np.frombuffer(b"abcdefghijklmnopqrstuvwxyz", dtype=np.uint8)] = np.arange(26)
+_CHAR_CODES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(26, 36)
+_CHAR_CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)] = np.arange(26)
+
+# Candidates kept after the rare-gram union, and re-ranked by edit distance.
+PRESELECT = 64
+CANDIDATES = 8
+POSTINGS_BUDGET = 8_000
+MIN_SCORE = 0.8
+
+
+_NOT_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def compact(name) -> str:
+    """Lower-case ASCII letters and digits only; the form that is indexed and compared."""
+    return _NOT_ALNUM.sub("", str(name or "").lower())
+
+
+def _gram_ids(codes: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Ids of the GRAM-long windows of `codes` beginning at `starts`."""
+    ids = np.zeros(len(starts), dtype=np.int64)
+    for offset in range(GRAM):
+        ids = ids * _ALPHABET + codes[starts + offset]
+    return ids
+
+
+def _grams(key: str) -> np.ndarray:
+    """Distinct gram ids of a compacted key, padded once at both ends."""
+    codes = _CHAR_CODES[np.frombuffer(key.encode("ascii"), dtype=np.uint8)]
+    padded = np.concatenate(([_PAD], codes, [_PAD])).astype(np.int64)
+    return np.unique(_gram_ids(padded, np.arange(len(padded) - GRAM + 1)))
+
+
+def edit_distance(a: str, b: str, substring: bool = False) -> int:
+    """
+    Levenshtein distance between `a` and `b` (Myers' bit-vector algorithm).
+
+    With `substring`, `a` may match anywhere inside `b` (free leading and
+    trailing text in `b`), e.g. a catalogue name inside "Starbucks Raffles".
+    """
+    m = len(a)
+    if m == 0:
+        return 0 if substring else len(b)
+    peq = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    best = m
+    carry = 0 if substring else 1
+    for ch in b:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | carry) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < best:
+            best = score
+    return best if substring else score
+
+
+def similarity(name_key: str, query_key: str) -> float:
+    """
+    Score in [0, 1] of a catalogue name against a query (both compacted).
+
+    The better of whole-string similarity and the name appearing inside the
+    query, the latter discounted by how much of the query it explains so
+    short names do not win on any text that happens to contain them.
+    """
+    if not name_key or not query_key:
+        return 0.0
+    longest = max(len(name_key), len(query_key))
+    whole = 1 - edit_distance(name_key, query_key) / longest
+    if len(name_key) >= len(query_key):
+        return whole
+    inside = 1 - edit_distance(name_key, query_key, substring=True) / len(name_key)
+    coverage = len(name_key) / len(query_key)
+    return max(whole, inside * (0.75 + 0.25 * coverage))
+
+
+class MerchantIndex:
+    """
+    Character n-gram index over a merchant catalogue.
+
+    All per-merchant data is held in flat numpy arrays (keys as one byte
+    blob plus offsets), so a million-merchant catalogue costs tens of MB and
+    loads from its `.idx.npz` snapshot without rebuilding.
+    """
+
+    def __init__(self, names, keys, mccs, categories, category_names):
+        self.names = names                  # display names: utf-8 blob + offsets
+        self.keys = keys                    # compacted names: ascii blob + offsets
+        self.mccs = mccs
+        self.categories = categories        # codes into category_names
+        self.category_names = list(category_names)
+        self._build_postings()
+
+    @staticmethod
+    def _blob(strings, encoding):
+        encoded = [s.encode(encoding) for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build from (merchant, mcc, category) rows. Rows whose name has fewer
+        than two letters or digits are skipped; the first row wins for
+        duplicate keys.
+        """
+        names, keys, mccs, cats = [], [], [], []
+        seen = set()
+        category_index = {}
+        for merchant, mcc, category in rows:
+            key = compact(merchant)
+            if len(key) < 2 or key in seen:
+                continue
+            seen.add(key)
+            names.append(merchant.strip())
+            keys.append(key)
+            mccs.append(int(mcc))
+            cats.append(category_index.setdefault(category, len(category_index)))
+        return cls(
+            cls._blob(names, "utf-8"),
+            cls._blob(keys, "ascii"),
+            np.array(mccs, dtype=np.int32),
+            np.array(cats, dtype=np.int16),
+            list(category_index),
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            return cls.from_rows((row["merchant"], row["mcc"], row["category"]) for row in reader)
+
+    def __len__(self) -> int:
+        return len(self.mccs)
+
+    def _build_postings(self):
+        blob, offsets = self.keys
+        lengths = np.diff(offsets)
+        n = len(lengths)
+        # Lay every key out padded at both ends ("#key#") in one flat array;
+        # a key of length L then has L + 3 - GRAM windows.
+        starts = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths + 2, out=starts[1:])
+        codes = np.full(starts[-1], _PAD, dtype=np.int64)
+        owner = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        codes[starts[owner] + 1 + np.arange(len(blob), dtype=np.int64) - offsets[owner]] = _CHAR_CODES[blob]
+        windows = np.maximum(lengths + 3 - GRAM, 0)
+        window_owner = np.repeat(np.arange(n, dtype=np.int64), windows)
+        window_start = np.arange(len(window_owner), dtype=np.int64) - np.repeat(
+            np.cumsum(windows) - windows, windows
+        ) + starts[window_owner]
+        grams = _gram_ids(codes, window_start)
+
+        # Distinct (gram, merchant) pairs, sorted by gram then merchant.
+        width = max(n, 1)
+        pairs = np.unique(grams * width + window_owner)
+        gram_ids, merchant_ids = np.divmod(pairs, width)
+        self.postings = merchant_ids.astype(np.int32)
+        self.gram_offsets = np.zeros(_GRAM_SPACE + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_ids, minlength=_GRAM_SPACE), out=self.gram_offsets[1:])
+        self.gram_counts = np.bincount(merchant_ids, minlength=n).astype(np.int32)
+
+    def _string(self, blob_offsets, i: int, encoding: str) -> str:
+        blob, offsets = blob_offsets
+        return blob[offsets[i]:offsets[i + 1]].tobytes().decode(encoding)
+
+    def entry(self, i: int, score: float = None) -> dict:
+        result = {
+            "merchant": self._string(self.names, i, "utf-8"),
+            "mcc": int(self.mccs[i]),
+            "category": self.category_names[self.categories[i]],
+        }
+        if score is not None:
+            result["score"] = round(score, 4)
+        return result
+
+    def _candidates(self, grams: np.ndarray) -> np.ndarray:
+        starts = self.gram_offsets[grams]
+        ends = self.gram_offsets[grams + 1]
+        sizes = ends - starts
+        order = np.argsort(sizes, kind="stable").tolist()
+
+        # Union the postings of the rarest grams, within a budget.
+        taken = []
+        total = 0
+        for g in order:
+            size = int(sizes[g])
+            if size == 0:
+                continue
+            if taken and total + size > POSTINGS_BUDGET:
+                break
+            taken.append(self.postings[starts[g]:ends[g]])
+            total += size
+        if not taken:
+            return np.empty(0, dtype=np.int32)
+        ids, counts = np.unique(np.concatenate(taken), return_counts=True)
+        if len(ids) > PRESELECT:
+            ids = ids[np.argpartition(-counts, PRESELECT - 1)[:PRESELECT]]
+
+        # Exact gram overlap of the survivors with the whole query, by
+        # binary search in each gram's (merchant-sorted) posting block.
+        overlap = np.zeros(len(ids), dtype=np.int32)
+        for g in order:
+            block = self.postings[starts[g]:ends[g]]
+            if len(block):
+                pos = np.searchsorted(block, ids)
+                overlap += block[np.minimum(pos, len(block) - 1)] == ids
+        dice = overlap / (self.gram_counts[ids] + len(grams))
+        if len(ids) > CANDIDATES:
+            ids = ids[np.argpartition(-dice, CANDIDATES - 1)[:CANDIDATES]]
+        return ids
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> list:
+        """
+        Top-k catalogue entries for a merchant string.
+
+        Args:
+            query: Merchant name as typed or printed on a statement
+            k: Maximum number of candidates to return
+            min_score: Drop candidates scoring below this
+
+        Returns:
+            List of dicts with merchant, mcc, category and score, best first
+        """
+        key = compact(query)
+        if not key or not len(self):
+            return []
+        ids = self._candidates(_grams(key))
+        scored = []
+        for i in ids.tolist():
+            score = similarity(self._string(self.keys, i, "ascii"), key)
+            if score >= min_score:
+                scored.append((score, -i))
+        scored.sort(reverse=True)
+        return [self.entry(-neg_i, score) for score, neg_i in scored[:k]]
+
+    def best(self, query: str, min_score: float = MIN_SCORE):
+        """The single best entry scoring at least `min_score`, or None."""
+        hits = self.search(query, k=1, min_score=min_score)
+        return hits[0] if hits else None
+
+    def save(self, path):
+        """
+        Snapshot the index (including postings) to an .npz file. Every
+        array is plain numeric or fixed-width text, so `load` never unpickles.
+        """
+        np.savez(
+            path,
+            names_blob=self.names[0], names_offsets=self.names[1],
+            keys_blob=self.keys[0], keys_offsets=self.keys[1],
+            mccs=self.mccs, categories=self.categories,
+            category_names=np.array(self.category_names, dtype=str),
+            postings=self.postings, gram_offsets=self.gram_offsets, gram_counts=self.gram_counts,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a snapshot written by `save`.
+
+        Raises:
+            ValueError: if the file is not such a snapshot (including older
+                ones holding pickled object arrays, which are never loaded)
+            OSError: if the file cannot be read
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls.__new__(cls)
+            index.names = (data["names_blob"], data["names_offsets"])
+            index.keys = (data["keys_blob"], data["keys_offsets"])
+            index.mccs = data["mccs"]
+            index.categories = data["categories"]
+            index.category_names = data["category_names"].tolist()
+            index.postings = data["postings"]
+            index.gram_offsets = data["gram_offsets"]
+            index.gram_counts = data["gram_counts"]
+        return index
+
+
+def open_index(csv_path) -> MerchantIndex:
+    """
+    Index for a catalogue CSV, loaded from its `.idx.npz` snapshot when that
+    is newer than the CSV and readable, and rebuilt (and re-saved) otherwise.
+    """
+    csv_path = Path(csv_path)
+    snapshot = csv_path.with_suffix(INDEX_SUFFIX)
+    if snapshot.exists() and snapshot.stat().st_mtime >= csv_path.stat().st_mtime:
+        try:
+            return MerchantIndex.load(snapshot)
+        except (KeyError, ValueError, OSError):
+            pass  # older or damaged snapshot: rebuild it
+    index = MerchantIndex.from_csv(csv_path)
+    try:
+        tmp = snapshot.with_name(snapshot.name + f".{os.getpid()}.tmp.npz")
+        index.save(tmp)
+        os.replace(tmp, snapshot)
+    except OSError:
+        pass  # read-only checkout: just rebuild next time
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_merchant_index():
+    """
+    Process-wide index for AURA_MERCHANT_CATALOGUE or data/merchant_mcc.csv,
+    loaded on first use; None if the catalogue file does not exist.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = Path(os.getenv("AURA_MERCHANT_CATALOGUE") or DEFAULT_CATALOGUE_PATH)
+                _index = cached("merchant_index", path, open_index) if path.exists() else False
+    return _index or None
@@ -1,78 +1,407 @@
 """
-Merchant Classification Agent (Stub)
-TO BE REPLACED with real merchant classification logic
+Merchant Classification Agent
+Local model first, keyword rules and the merchant catalogue as fallback
 """
 
-def classify_merchant(merchant: str, location: dict = None) -> dict:
+from collections import deque
+
+import numpy as np
+
+from .geo_index import RADIUS_M, get_location_index
+from .mcc_index import MIN_SCORE, get_merchant_index
+from .merchant_model import get_merchant_model
+from .merchant_names import canonical_merchant
+
+# Keyword rules, consulted when the model is unsure or missing.
+# Order matters: when several categories match, the earliest category wins,
+# and within a category the earliest keyword is reported as evidence.
+CATEGORY_RULES = {
+    "dining": {
+        "keywords": ["restaurant", "cafe", "coffee", "food", "dining", "eat",
+                     "starbucks", "din tai fung", "mcdonald"],
+        "mcc": 5812,
+        "category": "Dining"
+    },
+    "grocery": {
+        "keywords": ["fairprice", "cold storage", "sheng siong", "grocery",
+                     "supermarket", "mart"],
+        "mcc": 5411,
+        "category": "Groceries"
+    },
+    "transport": {
+        "keywords": ["grab", "gojek", "taxi", "mrt", "bus", "comfort"],
+        "mcc": 4121,
+        "category": "Transport"
+    },
+    "retail": {
+        "keywords": ["shop", "store", "mall", "retail", "fashion", "uniqlo"],
+        "mcc": 5311,
+        "category": "Shopping"
+    }
+}
+
+
+class KeywordIndex:
     """
-    Classify merchant into category and predict MCC code.
-    
-    TODO: Replace this stub with real classification logic:
-    - Connect to MCC database
-    - Use NLP for merchant name parsing
-    - Incorporate location for better accuracy
-    
+    Aho-Corasick automaton over every category keyword.
+
+    Built once; `best_match` scans a merchant string in a single pass and
+    returns the highest-priority keyword hit, independent of how many
+    keywords or categories are indexed.
+    """
+
+    def __init__(self, rules: dict):
+        # Trie nodes as parallel lists: goto transitions, failure links and
+        # the best (lowest) priority of any keyword ending at the node.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+        self._entries = []
+
+        for cat_data in rules.values():
+            for keyword in cat_data["keywords"]:
+                self._add(keyword.lower(), (cat_data, keyword))
+
+        self._build_failure_links()
+
+    def _add(self, keyword: str, payload: tuple):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+            node = nxt
+
+        priority = len(self._entries)
+        self._entries.append(payload)
+        if self._out[node] is None or priority < self._out[node]:
+            self._out[node] = priority
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+
+                # Fold suffix outputs into the node so matching never has
+                # to walk the failure chain.
+                inherited = self._out[self._fail[child]]
+                if inherited is not None and (
+                    self._out[child] is None or inherited < self._out[child]
+                ):
+                    self._out[child] = inherited
+
+    def best_match(self, text: str):
+        """
+        Return the (category_rules, keyword) pair of the highest-priority
+        keyword found in `text`, or None if nothing matches.
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        node = 0
+        best = None
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = out[node]
+            if hit is not None and (best is None or hit < best):
+                best = hit
+                if best == 0:
+                    break
+
+        return None if best is None else self._entries[best]
+
+
+_KEYWORD_INDEX = KeywordIndex(CATEGORY_RULES)
+
+RESULT_COLUMNS = ["predicted_category", "predicted_mcc", "confidence", "evidence"]
+
+# Below this calibrated probability the model defers to the keyword rules.
+MODEL_MIN_CONFIDENCE = 0.8
+
+# Probabilities are clipped to [floor, 1 - floor] before taking odds.
+_P_FLOOR = 1e-6
+
+
+def normalize_merchant(merchant) -> str:
+    """Normalized form of a merchant string used for matching, dedup and cache keys."""
+    return canonical_merchant(merchant)
+
+
+def _nearby(key: str, location):
+    """
+    Closest known branch of the merchant within RADIUS_M of the location's
+    coordinates, or None (no coordinates, no locations file, no such branch).
+    """
+    if not location or location.get("lat") is None or location.get("lng") is None:
+        return None
+    index = get_location_index()
+    if index is None:
+        return None
+    return index.best(float(location["lat"]), float(location["lng"]), key)
+
+
+def _branch_label(near: dict) -> str:
+    return f"{near['merchant']} {near['branch']}".strip()
+
+
+def _match(key: str, prediction=None):
+    """
+    Category for a normalized merchant string: the model's prediction when
+    it is confident (with the keyword rule's MCC when the rules agree on
+    the category), else the keyword rules, else the closest
+    merchant-catalogue entry.
+
     Args:
-        merchant: Merchant name string
-        location: Optional location dict with city, area, lat, lng
-    
+        key: Normalized merchant string
+        prediction: (category, mcc, confidence) already computed for `key`
+            by a batch model call; computed here when omitted
+
     Returns:
-        Classification result with MCC, category, confidence, evidence
+        (category_rules, evidence, confidence) or None
     """
-    
-    # Mock classification rules
-    merchant_lower = merchant.lower()
-    
-    # Simple pattern matching (to be replaced with ML model)
-    classifications = {
-        "dining": {
-            "keywords": ["restaurant", "cafe", "coffee", "food", "dining", "eat", 
-                        "starbucks", "din tai fung", "mcdonald"],
-            "mcc": 5812,
-            "category": "Dining"
-        },
-        "grocery": {
-            "keywords": ["fairprice", "cold storage", "sheng siong", "grocery", 
-                        "supermarket", "mart"],
-            "mcc": 5411,
-            "category": "Groceries"
-        },
-        "transport": {
-            "keywords": ["grab", "gojek", "taxi", "mrt", "bus", "comfort"],
-            "mcc": 4121,
-            "category": "Transport"
-        },
-        "retail": {
-            "keywords": ["shop", "store", "mall", "retail", "fashion", "uniqlo"],
-            "mcc": 5311,
-            "category": "Shopping"
+    if prediction is None:
+        model = get_merchant_model()
+        prediction = model.predict_one(key) if model is not None else None
+    match = _KEYWORD_INDEX.best_match(key)
+    if prediction is not None and prediction[2] >= MODEL_MIN_CONFIDENCE:
+        category, mcc, confidence = prediction
+        if match is not None and match[0]["category"] == category:
+            # The rules name the MCC this merchant is known to post under;
+            # the model only confirms the category.
+            cat_data, keyword = match
+            return (
+                cat_data,
+                f"Model: {category} (p={confidence:.2f}); keyword '{keyword}' gives MCC {cat_data['mcc']}",
+                confidence,
+            )
+        return (
+            {"category": category, "mcc": mcc},
+            f"Model: {category}, MCC {mcc} (p={confidence:.2f})",
+            confidence,
+        )
+
+    if match is not None:
+        cat_data, keyword = match
+        return cat_data, f"Matched keyword: '{keyword}'", 0.85
+
+    index = get_merchant_index()
+    hit = index.best(key, MIN_SCORE) if index is not None else None
+    if hit is None:
+        return None
+    return (
+        {"category": hit["category"], "mcc": hit["mcc"]},
+        f"Fuzzy match: '{hit['merchant']}' (score {hit['score']:.2f})",
+        0.85 * hit["score"],
+    )
+
+
+def _odds(p: float) -> float:
+    p = min(max(p, _P_FLOOR), 1 - _P_FLOOR)
+    return p / (1 - p)
+
+
+def _combine(name_category, name_confidence: float, branch_category, branch_confidence: float) -> tuple:
+    """
+    Fold the name and nearby-branch evidence into one (category, confidence).
+
+    The two are treated as independent evidence: when they agree their odds
+    multiply, when they disagree the stronger one wins with its odds divided
+    by the weaker one's.
+    """
+    name_odds, branch_odds = _odds(name_confidence), _odds(branch_confidence)
+    if name_category == branch_category:
+        odds = name_odds * branch_odds
+        category = branch_category
+    elif name_odds > branch_odds:
+        odds = name_odds / branch_odds
+        category = name_category
+    else:
+        odds = branch_odds / name_odds
+        category = branch_category
+    return category, odds / (1 + odds)
+
+
+def _proximity_confidence(near: dict) -> float:
+    """Confidence of a nearby branch on its own; falls off with distance."""
+    return 0.85 + 0.10 * (1 - near["distance_m"] / RADIUS_M)
+
+
+def _build_result(match, location, near=None) -> dict:
+    """
+    Assemble the classification contract from a `_match` result, the
+    location and the nearby branch (if any) it resolved to.
+    """
+    if near is not None:
+        # A branch of this merchant at the reported coordinates is evidence
+        # in its own right, combined with the name match rather than
+        # replacing it; when the branch wins, its MCC is the one reported.
+        proximity = _proximity_confidence(near)
+        if match is None:
+            category, confidence = near["category"], proximity
+        else:
+            category, confidence = _combine(match[0]["category"], match[2],
+                                            near["category"], proximity)
+        mcc = near["mcc"] if category == near["category"] else match[0]["mcc"]
+        evidence = [
+            match[1] if match is not None
+            else f"Matched nearby branch: '{_branch_label(near)}'",
+            f"Location: {location.get('area', 'Unknown')}",
+            f"{_branch_label(near)} is {near['distance_m']:.0f} m away (p={proximity:.2f})",
+        ]
+        return {
+            "predicted_category": category,
+            "predicted_mcc": mcc,
+            "confidence": confidence,
+            "evidence": evidence,
         }
-    }
-    
-    # Find matching category
-    for cat_type, cat_data in classifications.items():
-        for keyword in cat_data["keywords"]:
-            if keyword in merchant_lower:
-                # Boost confidence if location matches known areas
-                confidence = 0.85
-                if location and location.get("area"):
-                    if location["area"].lower() in ["orchard", "cbd", "marina bay"]:
-                        confidence = 0.95
-                
-                return {
-                    "predicted_category": cat_data["category"],
-                    "predicted_mcc": cat_data["mcc"],
-                    "confidence": confidence,
-                    "evidence": [
-                        f"Matched keyword: '{keyword}'",
-                        f"Location: {location.get('area', 'Unknown')}" if location else "No location data"
-                    ]
-                }
-    
+
+    if match is not None:
+        cat_data, evidence, confidence = match
+
+        return {
+            "predicted_category": cat_data["category"],
+            "predicted_mcc": cat_data["mcc"],
+            "confidence": confidence,
+            "evidence": [
+                evidence,
+                f"Location: {location.get('area', 'Unknown')}" if location else "No location data"
+            ]
+        }
+
     # Default fallback
     return {
         "predicted_category": "General",
         "predicted_mcc": 0000,
         "confidence": 0.5,
         "evidence": ["No specific category matched"]
-    }
\ No newline at end of file
+    }
+
+
+def classify_merchant(merchant: str, location: dict = None) -> dict:
+    """
+    Classify merchant into category and predict MCC code.
+
+    Args:
+        merchant: Merchant name string
+        location: Optional location dict with city, area, lat, lng
+
+    Returns:
+        Classification result with MCC, category, confidence, evidence
+    """
+
+    key = normalize_merchant(merchant)
+    return _build_result(_match(key), location, _nearby(key, location))
+
+
+def _split_pairs(rows, locations):
+    """Turn the accepted batch inputs into parallel merchant/location lists."""
+    import pandas as pd
+
+    if isinstance(rows, pd.Series):
+        merchants = rows.tolist()
+    else:
+        merchants = []
+        pair_locations = []
+        for row in rows:
+            if isinstance(row, (tuple, list)):
+                merchants.append(row[0])
+                pair_locations.append(row[1] if len(row) > 1 else None)
+            else:
+                merchants.append(row)
+                pair_locations.append(None)
+        if locations is None:
+            locations = pair_locations
+
+    if locations is None:
+        locations = [None] * len(merchants)
+    elif isinstance(locations, pd.Series):
+        locations = locations.tolist()
+    else:
+        locations = list(locations)
+
+    if len(locations) != len(merchants):
+        raise ValueError("merchants and locations must have the same length")
+
+    return merchants, locations
+
+
+def classify_merchants(rows, locations=None) -> "pd.DataFrame":
+    """
+    Classify many merchants at once.
+
+    Distinct normalized merchant strings are scored by the model in one
+    batch (unsure ones fall back to the keyword index and catalogue), and
+    each distinct merchant/location pair is resolved against the branch
+    index once; results are then broadcast back to every input row, so
+    histories dominated by repeat merchants cost roughly one match per
+    distinct merchant.
+
+    Args:
+        rows: Iterable of (merchant, location) pairs, iterable of merchant
+            strings, or a pandas Series of merchant strings
+        locations: Optional locations aligned with `rows` (list or Series);
+            overrides locations given in the pairs
+
+    Returns:
+        DataFrame with one row per input (index preserved for a Series) and
+        columns merchant, predicted_category, predicted_mcc, confidence,
+        evidence
+    """
+    # pandas is only needed for batches; single lookups skip its import.
+    import pandas as pd
+
+    merchants, locations = _split_pairs(rows, locations)
+    index = rows.index if isinstance(rows, pd.Series) else None
+
+    if not merchants:
+        return pd.DataFrame(columns=["merchant"] + RESULT_COLUMNS, index=index)
+
+    codes, uniques = pd.factorize(pd.Series([normalize_merchant(m) for m in merchants], dtype=object))
+    # One model call for every distinct merchant; only the unsure ones go
+    # on to the keyword rules and catalogue.
+    model = get_merchant_model()
+    if model is not None:
+        pred = model.predict(uniques)
+        predictions = zip(pred["category"], pred["mcc"].tolist(), pred["confidence"].tolist())
+    else:
+        predictions = [None] * len(uniques)
+    matches = [_match(key, prediction) for key, prediction in zip(uniques, predictions)]
+
+    # The location only matters through its area text and coordinates;
+    # resolve each distinct (merchant, area, lat, lng) combination once.
+    results = {}
+    row_results = []
+    for code, loc in zip(codes, locations):
+        key = (code, None) if not loc else (code, loc.get("area", "Unknown"), loc.get("lat"), loc.get("lng"))
+        result = results.get(key)
+        if result is None:
+            result = _build_result(matches[code], loc, _nearby(uniques[code], loc))
+            results[key] = result
+        row_results.append(result)
+
+    return pd.DataFrame(
+        {
+            "merchant": merchants,
+            "predicted_category": np.array([r["predicted_category"] for r in row_results], dtype=object),
+            "predicted_mcc": np.fromiter((r["predicted_mcc"] for r in row_results), dtype=np.int64,
+                                         count=len(row_results)),
+            "confidence": np.fromiter((r["confidence"] for r in row_results), dtype=float,
+                                      count=len(row_results)),
+            "evidence": [list(r["evidence"]) for r in row_results],
+        },
+        index=index,
+    )
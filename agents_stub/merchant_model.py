@@ -0,0 +1,416 @@
+"""
+Merchant Category Model
+Hashed character n-gram features and a linear softmax model over MCCs
+
+Canonical merchant strings (see merchant_names) are padded, cut into
+character 3- and 4-grams and hashed into a fixed number of buckets. The model
+is one weight row per bucket and one column per MCC, so scoring a batch is a
+sparse-times-dense product: gather the rows of every gram, sum them per
+string (numpy reduceat) and add the bias. Probabilities are
+temperature-calibrated on held-out data; a category's confidence is the
+summed probability of its MCCs.
+
+The labels hold many spelling variants of each merchant, so the holdout is
+drawn by merchant group (near-duplicate names of one class), not by row:
+a row-level split scores the model on variants of names it was trained on
+and overstates both accuracy and calibration on names it has never seen.
+
+Model file: .npz with weights, bias, temperature and the MCC/category of
+each class.
+
+Usage:
+    python -m agents_stub.merchant_model train data/merchant_labels.csv
+    python -m agents_stub.merchant_model eval data/merchant_labels.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .mcc_index import compact, similarity
+from .merchant_names import canonical_merchant
+from .reference import cached
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / "data" / "merchant_model.npz"
+DEFAULT_LABELS_PATH = Path(__file__).resolve().parent.parent / "data" / "merchant_labels.csv"
+
+BITS = 14
+NGRAMS = (3, 4)
+# Leading pad makes every string, even "", yield at least one gram of each
+# length, so per-string sums never see an empty segment.
+_HEAD = "^" * (max(NGRAMS) - 1)
+_TAIL = "$"
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MASK64 = (1 << 64) - 1
+
+# Rows scored per gather/reduce pass; keeps the gathered block in cache.
+CHUNK = 4096
+
+# Two labelled names of one class at least this similar (mcc_index.similarity
+# on compacted keys) are variants of the same merchant for the holdout split.
+GROUP_SIMILARITY = 0.8
+
+
+def _encode(keys) -> tuple:
+    """Padded byte blob of many strings plus each string's start and length."""
+    encoded = [f"{_HEAD}{key}{_TAIL}".encode("ascii", "ignore") for key in keys]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    starts = np.zeros(len(encoded), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    return blob, starts, lengths
+
+
+def hashed_features(keys) -> list:
+    """
+    Hashed n-gram buckets for a batch of canonical strings.
+
+    Returns:
+        One (buckets, segment_starts) pair per n-gram length: `buckets`
+        lists every gram of every string in order, and string i owns
+        buckets[segment_starts[i]:segment_starts[i + 1]]
+    """
+    blob, starts, lengths = _encode(keys)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    ends = starts + lengths
+    features = []
+    for n in NGRAMS:
+        positions = np.arange(len(blob) - n + 1)
+        valid = positions + n <= ends[owner[: len(positions)]]
+        value = np.full(len(positions), np.uint64(n) << np.uint64(56), dtype=np.uint64)
+        for j in range(n):
+            value |= blob[j: j + len(positions)] << np.uint64(8 * j)
+        buckets = ((value[valid] * _GOLDEN) >> np.uint64(64 - BITS)).astype(np.intp)
+        counts = lengths - n + 1
+        segments = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=segments[1:])
+        features.append((buckets, segments))
+    return features
+
+
+def key_buckets(key: str) -> list:
+    """Every bucket `hashed_features` yields for one string, in plain Python (no array setup cost)."""
+    data = f"{_HEAD}{key}{_TAIL}".encode("ascii", "ignore")
+    golden, shift = int(_GOLDEN), 64 - BITS
+    buckets = []
+    for n in NGRAMS:
+        salt = n << 56
+        buckets.extend(
+            ((int.from_bytes(data[p: p + n], "little") | salt) * golden & _MASK64) >> shift
+            for p in range(len(data) - n + 1)
+        )
+    return buckets
+
+
+def _logits(weights: np.ndarray, bias: np.ndarray, features: list) -> np.ndarray:
+    out = None
+    for buckets, segments in features:
+        part = np.add.reduceat(weights[buckets], segments, axis=0)
+        out = part if out is None else out + part
+    return out + bias
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+
+class MerchantModel:
+    """
+    Linear classifier over hashed n-grams.
+
+    Classes are MCCs; `class_categories[j]` is the spending category of
+    class j and `category_names` the distinct categories.
+    """
+
+    def __init__(self, weights, bias, temperature, class_mccs, class_categories, labels_digest=""):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.temperature = float(temperature)
+        self.class_mccs = np.asarray(class_mccs, dtype=np.int64)
+        self.class_categories = np.asarray(class_categories, dtype=str)
+        self.labels_digest = labels_digest
+
+        self.category_names = np.array(sorted(set(self.class_categories.tolist())), dtype=object)
+        lookup = {name: i for i, name in enumerate(self.category_names)}
+        # class -> category membership, for summing MCC probabilities
+        self._membership = np.zeros((len(self.class_mccs), len(self.category_names)), dtype=np.float32)
+        self._membership[np.arange(len(self.class_mccs)), [lookup[c] for c in self.class_categories]] = 1.0
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            weights=self.weights, bias=self.bias, temperature=np.float64(self.temperature),
+            class_mccs=self.class_mccs, class_categories=self.class_categories,
+            bits=np.int64(BITS), ngrams=np.array(NGRAMS), labels_digest=np.array(self.labels_digest),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["bits"]) != BITS or tuple(data["ngrams"].tolist()) != NGRAMS:
+                raise ValueError(f"{path} was trained with different feature settings")
+            return cls(
+                data["weights"], data["bias"], float(data["temperature"]),
+                data["class_mccs"], data["class_categories"], str(data["labels_digest"]),
+            )
+
+    def probabilities(self, keys) -> np.ndarray:
+        """Calibrated class (MCC) probabilities, one row per canonical string."""
+        out = np.empty((len(keys), len(self.class_mccs)), dtype=np.float32)
+        for lo in range(0, len(keys), CHUNK):
+            chunk = keys[lo: lo + CHUNK]
+            z = _logits(self.weights, self.bias, hashed_features(chunk))
+            out[lo: lo + len(chunk)] = _softmax(z / self.temperature)
+        return out
+
+    def predict(self, keys) -> dict:
+        """
+        Score a batch of canonical merchant strings.
+
+        Args:
+            keys: Sequence of canonical merchant strings
+
+        Returns:
+            Dict of aligned arrays: category, mcc and confidence (the
+            calibrated probability of the predicted category)
+        """
+        keys = list(keys)
+        if not keys:
+            return {"category": np.array([], dtype=object), "mcc": np.array([], dtype=np.int64),
+                    "confidence": np.array([], dtype=np.float64)}
+        return self._decide(self.probabilities(keys))
+
+    def predict_one(self, key: str) -> tuple:
+        """(category, mcc, confidence) for one canonical string."""
+        # Agrees with `predict` up to float32 summation order.
+        z = self.weights[key_buckets(key)].sum(axis=0) + self.bias
+        pred = self._decide(_softmax(z[None, :] / self.temperature))
+        return pred["category"][0], int(pred["mcc"][0]), float(pred["confidence"][0])
+
+    def _decide(self, probs: np.ndarray) -> dict:
+        by_category = probs @ self._membership
+        best = by_category.argmax(axis=1)
+        # Most likely MCC within the chosen category.
+        masked = np.where(self._membership[:, best].T > 0, probs, -1.0)
+        return {
+            "category": self.category_names[best],
+            "mcc": self.class_mccs[masked.argmax(axis=1)],
+            "confidence": by_category[np.arange(len(probs)), best].astype(np.float64),
+        }
+
+
+def read_labels(path) -> tuple:
+    """Canonical merchant strings, MCCs and categories from a labels CSV."""
+    keys, mccs, categories = [], [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            keys.append(canonical_merchant(row["merchant"]))
+            mccs.append(int(row["mcc"]))
+            categories.append(row["category"])
+    return keys, mccs, categories
+
+
+def _fit(features, targets, n_classes, epochs, learning_rate, l2):
+    """Softmax regression by full-batch Adam; returns (weights, bias)."""
+    # The loss is convex, so zero init is fine, and buckets no training
+    # string hits stay exactly zero (the saved file compresses well).
+    n = len(targets)
+    weights = np.zeros((1 << BITS, n_classes), dtype=np.float32)
+    bias = np.zeros(n_classes, dtype=np.float32)
+    onehot = np.zeros((n, n_classes), dtype=np.float32)
+    onehot[np.arange(n), targets] = 1.0
+
+    # Per n-gram length: the owning string of each gram, grouped by bucket,
+    # so the weight gradient is one sorted reduceat instead of a scatter-add.
+    scatter = []
+    for buckets, segments in features:
+        owner = np.repeat(np.arange(n), np.diff(np.append(segments, len(buckets))))
+        order = np.argsort(buckets, kind="stable")
+        touched, group_starts = np.unique(buckets[order], return_index=True)
+        scatter.append((touched, group_starts, owner[order]))
+
+    params = [weights, bias]
+    moments = [(np.zeros_like(p), np.zeros_like(p)) for p in params]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for step in range(1, epochs + 1):
+        delta = (_softmax(_logits(weights, bias, features)) - onehot) / n
+        grad_w = l2 * weights
+        for touched, group_starts, owner in scatter:
+            grad_w[touched] += np.add.reduceat(delta[owner], group_starts, axis=0)
+        grads = [grad_w, delta.sum(axis=0)]
+        for p, g, (m, v) in zip(params, grads, moments):
+            m *= beta1
+            m += (1 - beta1) * g
+            v *= beta2
+            v += (1 - beta2) * g * g
+            p -= learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+    return weights, bias
+
+
+def _fit_temperature(logits: np.ndarray, targets: np.ndarray) -> float:
+    """Temperature minimizing held-out negative log-likelihood (golden-section search)."""
+    def nll(t):
+        p = _softmax(logits / t)
+        return -np.log(p[np.arange(len(targets)), targets] + 1e-12).mean()
+
+    lo, hi = 0.05, 20.0
+    ratio = (5 ** 0.5 - 1) / 2
+    for _ in range(60):
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        if nll(a) < nll(b):
+            hi = b
+        else:
+            lo = a
+    return (lo + hi) / 2
+
+
+def evaluate(model: MerchantModel, keys, categories, bins: int = 10) -> dict:
+    """Category accuracy and expected calibration error of a model on labelled data."""
+    pred = model.predict(keys)
+    correct = pred["category"] == np.asarray(categories, dtype=object)
+    conf = pred["confidence"]
+    edges = np.linspace(0, 1, bins + 1)
+    which = np.clip(np.digitize(conf, edges) - 1, 0, bins - 1)
+    ece = sum(
+        abs(correct[which == b].mean() - conf[which == b].mean()) * (which == b).mean()
+        for b in range(bins) if (which == b).any()
+    )
+    return {"rows": len(keys), "accuracy": float(correct.mean()), "ece": float(ece)}
+
+
+def merchant_groups(keys, targets, min_similarity: float = GROUP_SIMILARITY) -> np.ndarray:
+    """
+    Group id per labelled row: rows of one class whose names are identical
+    or at least `min_similarity` alike fall in the same group (transitively).
+
+    Args:
+        keys: Canonical merchant strings
+        targets: Class index per row
+        min_similarity: Threshold on mcc_index.similarity of compacted names
+
+    Returns:
+        int array, one group id per row
+    """
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first = {}
+    for i, key in enumerate(keys):
+        j = first.setdefault((key, targets[i]), i)
+        if j != i:
+            parent[find(i)] = find(j)
+
+    by_class = {}
+    for (key, target), i in first.items():
+        by_class.setdefault(target, []).append((compact(key), i))
+    for members in by_class.values():
+        for a, (key_a, i_a) in enumerate(members):
+            for key_b, i_b in members[:a]:
+                shorter, longer = sorted((key_a, key_b), key=len)
+                if similarity(shorter, longer) >= min_similarity:
+                    parent[find(i_a)] = find(i_b)
+    return np.array([find(i) for i in range(len(keys))], dtype=np.int64)
+
+
+def train(labels_path=DEFAULT_LABELS_PATH, holdout: float = 0.2, epochs: int = 300,
+          learning_rate: float = 0.05, l2: float = 1e-5, seed: int = 0) -> tuple:
+    """
+    Train on a labels CSV (`merchant,mcc,category`).
+
+    A `holdout` fraction of each class's merchant groups (see
+    merchant_groups) is set aside to fit the temperature and report held-out
+    metrics. The weights are not refit on every row afterwards: the
+    temperature is only valid for the weights it was fitted against.
+
+    Returns:
+        (model, report) with report holding holdout accuracy/ECE
+    """
+    keys, mccs, categories = read_labels(labels_path)
+    classes = sorted(set(zip(mccs, categories)))
+    class_index = {c: j for j, c in enumerate(classes)}
+    targets = np.array([class_index[c] for c in zip(mccs, categories)])
+    groups = merchant_groups(keys, targets)
+
+    rng = np.random.default_rng(seed)
+    is_holdout = np.zeros(len(keys), dtype=bool)
+    for j in range(len(classes)):
+        members = np.unique(groups[targets == j])
+        rng.shuffle(members)
+        is_holdout[np.isin(groups, members[: int(round(len(members) * holdout))])] = True
+    train_idx, hold_idx = np.flatnonzero(~is_holdout), np.flatnonzero(is_holdout)
+
+    def subset(idx):
+        return [keys[i] for i in idx]
+
+    weights, bias = _fit(hashed_features(subset(train_idx)), targets[train_idx], len(classes),
+                         epochs, learning_rate, l2)
+    hold_logits = _logits(weights, bias, hashed_features(subset(hold_idx)))
+    temperature = _fit_temperature(hold_logits, targets[hold_idx])
+
+    with open(labels_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    class_mccs = [m for m, _ in classes]
+    class_categories = [c for _, c in classes]
+    model = MerchantModel(weights, bias, temperature, class_mccs, class_categories, digest)
+    heldout = evaluate(model, subset(hold_idx), [categories[i] for i in hold_idx])
+    return model, {"classes": len(classes), "temperature": temperature, "holdout": heldout}
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_merchant_model():
+    """
+    Process-wide model from AURA_MERCHANT_MODEL or data/merchant_model.npz,
+    loaded on first use; None if the file does not exist.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                path = Path(os.getenv("AURA_MERCHANT_MODEL") or DEFAULT_MODEL_PATH)
+                _model = cached("merchant_model", path, MerchantModel.load) if path.exists() else False
+    return _model or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or evaluate the merchant category model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit = sub.add_parser("train", help="labels CSV -> model file")
+    fit.add_argument("labels_path", nargs="?", default=str(DEFAULT_LABELS_PATH))
+    fit.add_argument("--out", default=str(DEFAULT_MODEL_PATH))
+    fit.add_argument("--epochs", type=int, default=300)
+    fit.add_argument("--seed", type=int, default=0)
+    check = sub.add_parser("eval", help="score a model against a labels CSV")
+    check.add_argument("labels_path", nargs="?", default=str(DEFAULT_LABELS_PATH))
+    check.add_argument("--model", default=str(DEFAULT_MODEL_PATH))
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model, report = train(args.labels_path, epochs=args.epochs, seed=args.seed)
+        model.save(args.out)
+        held = report["holdout"]
+        print(f"{report['classes']} classes, T={report['temperature']:.3f}, "
+              f"holdout accuracy {held['accuracy']:.3f}, ECE {held['ece']:.3f} -> {args.out}")
+    else:
+        keys, _, categories = read_labels(args.labels_path)
+        result = evaluate(MerchantModel.load(args.model), keys, categories)
+        print(f"{result['rows']} rows, accuracy {result['accuracy']:.3f}, ECE {result['ece']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Merchant Name Normalization
+Canonical merchant strings for matching, batch dedup and cache keys
+
+"Din Tai Fung ION Orchard", "DIN TAI FUNG (Raffles City)" and "DTF #B1-12"
+all reduce to "din tai fung": unicode is folded to plain lower-case text,
+payment-processor prefixes, unit numbers, branch/location suffixes and
+company-form noise are stripped, and known aliases are mapped to one name.
+
+Each distinct raw string is normalized once; results live in a bounded
+interning table (an LRU over raw strings whose values are interned), so
+repeat merchants cost a dict lookup.
+
+Rules file: JSON with aliases, prefixes, noise and locations.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+from .reference import cached
+
+DEFAULT_NAMES_PATH = Path(__file__).resolve().parent.parent / "data" / "merchant_names.json"
+
+# Distinct raw strings remembered by the interning table.
+INTERN_SIZE = 100_000
+
+# Longest location phrase (in tokens) tried when stripping suffixes.
+_MAX_PHRASE = 4
+
+_PAREN = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_UNIT_NO = re.compile(r"#\s*[\w-]+")
+_BRANCH_SEP = re.compile(r"\s+[-–—|]\s+|\s*@\s*")
+_APOSTROPHE = re.compile(r"['‘’`]")
+_NOT_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _fold(text: str) -> str:
+    """Case-folded text with compatibility forms and accents removed."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+class MerchantNormalizer:
+    """
+    Raw merchant string -> canonical form.
+
+    Built from the rules file; `canonical` is memoized per instance.
+    """
+
+    def __init__(self, aliases: dict = None, prefixes=(), noise=(), locations=(),
+                 intern_size: int = INTERN_SIZE):
+        """
+        Args:
+            aliases: Canonical-form alias -> canonical name
+            prefixes: Payment-processor prefixes written before a `*`
+            noise: Trailing tokens to drop (company forms, "branch", ...)
+            locations: Trailing area/mall phrases to drop
+            intern_size: Bound on the memo table
+        """
+        self.aliases = {self._clean(k): self._clean(v) for k, v in (aliases or {}).items()}
+        self.prefixes = frozenset(self._clean(p) for p in prefixes)
+        self.noise = frozenset(self._clean(n) for n in noise)
+        self.locations = frozenset(self._clean(loc) for loc in locations)
+        self.intern_size = intern_size
+        self.canonical = lru_cache(maxsize=intern_size)(self._canonical)
+
+    def __getstate__(self):
+        # The memo table is per process; pickles carry only the rules.
+        state = self.__dict__.copy()
+        del state["canonical"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.canonical = lru_cache(maxsize=self.intern_size)(self._canonical)
+
+    @classmethod
+    def from_json(cls, path, intern_size: int = INTERN_SIZE):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            aliases=data.get("aliases"),
+            prefixes=data.get("prefixes", ()),
+            noise=data.get("noise", ()),
+            locations=data.get("locations", ()),
+            intern_size=intern_size,
+        )
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        """Folded, apostrophe-free, single-spaced lower-case words."""
+        text = _APOSTROPHE.sub("", _fold(text))
+        return _NOT_WORD.sub(" ", text).strip()
+
+    def _strip_suffixes(self, tokens: list) -> list:
+        # Always keep at least one token: "Marina Bay Sands" is a merchant.
+        while len(tokens) > 1:
+            for k in range(min(_MAX_PHRASE, len(tokens) - 1), 0, -1):
+                tail = " ".join(tokens[-k:])
+                if tail in self.locations or (k == 1 and (tail in self.noise or tail.isdigit())):
+                    del tokens[-k:]
+                    break
+            else:
+                break
+        return tokens
+
+    def _canonical(self, raw: str) -> str:
+        text = _fold(raw)
+
+        head, star, tail = text.partition("*")
+        if star and self._clean(head) in self.prefixes and tail.strip():
+            text = tail
+        text = text.replace("*", " ")
+
+        text = _UNIT_NO.sub(" ", _PAREN.sub(" ", text))
+        head = _BRANCH_SEP.split(text, maxsplit=1)[0]
+        if self._clean(head):
+            text = head
+
+        tokens = self._clean(text).split()
+        name = " ".join(self._strip_suffixes(tokens))
+        return sys.intern(self.aliases.get(name, name))
+
+    def cache_info(self):
+        """Hit/miss/size statistics of the interning table."""
+        return self.canonical.cache_info()
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def get_normalizer() -> MerchantNormalizer:
+    """
+    Process-wide normalizer for AURA_MERCHANT_NAMES or
+    data/merchant_names.json; plain case/punctuation folding if the file
+    does not exist.
+    """
+    global _normalizer
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                path = Path(os.getenv("AURA_MERCHANT_NAMES") or DEFAULT_NAMES_PATH)
+                _normalizer = (
+                    cached("merchant_names", path, MerchantNormalizer.from_json)
+                    if path.exists() else MerchantNormalizer()
+                )
+    return _normalizer
+
+
+def canonical_merchant(merchant) -> str:
+    """
+    Canonical form of a raw merchant string.
+
+    Args:
+        merchant: Merchant name as entered or printed on a statement
+
+    Returns:
+        Lower-case words without branch/location noise, e.g.
+        "Starbucks Raffles Place" -> "starbucks"
+    """
+    return get_normalizer().canonical(str(merchant or ""))
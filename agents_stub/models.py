@@ -0,0 +1,384 @@
+"""
+Data Models
+Slotted Card, Transaction, Classification and Recommendation records and an
+array-backed transaction collection, with converters to the JSON shapes
+
+The app, the store and the HTTP contract keep exchanging plain dicts; the
+engines convert at their boundary (`as_cards`, `as_transaction`) so missing
+keys are defaulted once instead of on every lookup, and hand dicts back out
+with `to_dict`. `TransactionArray` holds bulk history column-wise, with the
+same layout as the on-disk archive, at a few dozen bytes per transaction.
+"""
+
+import math
+
+import numpy as np
+
+from .archive import (
+    MISSING_CODE,
+    MISSING_MCC,
+    NUMERIC_COLUMNS,
+    STRING_COLUMNS,
+    ColumnEncoder,
+    TransactionArchive,
+    columns_frame,
+    format_timestamps,
+    parse_timestamp,
+)
+from .card_rules import as_mcc
+
+# Card keys the model owns; anything else in `extra` rides along to `to_dict`.
+_CARD_FIELDS = frozenset(("id", "bank", "display_name", "last4", "monthly_cap", "used_this_month",
+                          "spend_this_month", "category_used"))
+
+
+class Card:
+    """One card in a wallet, with its usage this month."""
+
+    __slots__ = ("id", "bank", "display_name", "last4", "monthly_cap", "used_this_month",
+                 "spend_this_month", "category_used", "extra")
+
+    def __init__(self, display_name: str, bank: str, monthly_cap: float, used_this_month: float = 0.0,
+                 id: str = None, last4: str = None, spend_this_month: float = 0.0,
+                 category_used: dict = None, extra: dict = None):
+        self.id = id
+        self.bank = bank
+        self.display_name = display_name
+        self.last4 = last4
+        self.monthly_cap = monthly_cap
+        self.used_this_month = used_this_month
+        self.spend_this_month = spend_this_month
+        self.category_used = category_used or {}
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Card":
+        """
+        Args:
+            data: Card dict as in mock_user_cards.json; display_name, bank,
+                monthly_cap and used_this_month are required
+
+        Raises:
+            KeyError: if a required key is missing
+        """
+        # Positional, and the source dict kept as is for its other keys:
+        # wallets are converted on every scoring call.
+        return cls(data["display_name"], data["bank"], data["monthly_cap"], data["used_this_month"],
+                   data.get("id"), data.get("last4"), data.get("spend_this_month") or 0.0,
+                   data.get("category_used"), data)
+
+    def to_dict(self) -> dict:
+        """Card dict in the input shape; usage fields only when set."""
+        data = {
+            "id": self.id,
+            "bank": self.bank,
+            "display_name": self.display_name,
+            "last4": self.last4,
+            **{k: v for k, v in self.extra.items() if k not in _CARD_FIELDS},
+            "monthly_cap": self.monthly_cap,
+            "used_this_month": self.used_this_month,
+        }
+        if self.spend_this_month:
+            data["spend_this_month"] = self.spend_this_month
+        if self.category_used:
+            data["category_used"] = dict(self.category_used)
+        return data
+
+    def remaining_cap(self, sub_cap: float = math.inf, category: str = None) -> float:
+        """Reward still available this month: overall cap, then a category sub-cap."""
+        remaining = self.monthly_cap - self.used_this_month
+        if sub_cap != math.inf:
+            remaining = min(remaining, sub_cap - self.category_used.get(category, 0))
+        return remaining
+
+    def __repr__(self):
+        return f"Card({self.display_name!r}, id={self.id!r})"
+
+
+class Transaction:
+    """One purchase; reward and card fields are set once it has been paid."""
+
+    __slots__ = ("id", "timestamp", "merchant", "amount", "currency", "category", "mcc",
+                 "location", "card_used", "card_id", "reward")
+
+    def __init__(self, merchant: str, amount: float, currency: str = "SGD", category: str = None,
+                 mcc: int = None, location: dict = None, timestamp: str = None, id=None,
+                 card_used: str = None, card_id: str = None, reward: float = 0.0):
+        self.id = id
+        self.timestamp = timestamp
+        self.merchant = merchant
+        self.amount = amount
+        self.currency = currency
+        self.category = category
+        self.mcc = mcc
+        self.location = location
+        self.card_used = card_used
+        self.card_id = card_id
+        self.reward = reward
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Transaction":
+        """
+        Args:
+            data: Transaction dict in the store, mock-history or scoring
+                shape (`reward` or `reward_earned`)
+        """
+        return cls(
+            merchant=data.get("merchant", ""),
+            amount=data.get("amount", 0) or 0,
+            currency=data.get("currency") or "SGD",
+            category=data.get("category"),
+            mcc=as_mcc(data.get("mcc")),
+            location=data.get("location") or None,
+            timestamp=data.get("timestamp"),
+            id=data.get("id"),
+            card_used=data.get("card_used"),
+            card_id=data.get("card_id"),
+            reward=data.get("reward", data.get("reward_earned", 0)) or 0.0,
+        )
+
+    def to_dict(self) -> dict:
+        """Transaction dict in the store's shape."""
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "merchant": self.merchant,
+            "amount": self.amount,
+            "currency": self.currency,
+            "card_used": self.card_used,
+            "card_id": self.card_id,
+            "reward": self.reward,
+            "category": self.category,
+            "mcc": self.mcc,
+            "location": dict(self.location) if self.location else {},
+        }
+
+    def __repr__(self):
+        return f"Transaction({self.merchant!r}, {self.amount!r} {self.currency})"
+
+
+class Classification:
+    """Merchant classifier output."""
+
+    __slots__ = ("predicted_category", "predicted_mcc", "confidence", "evidence")
+
+    def __init__(self, predicted_category: str, predicted_mcc: int, confidence: float, evidence=()):
+        self.predicted_category = predicted_category
+        self.predicted_mcc = predicted_mcc
+        self.confidence = confidence
+        self.evidence = list(evidence)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Classification":
+        return cls(data["predicted_category"], data["predicted_mcc"], data["confidence"],
+                   data.get("evidence", ()))
+
+    def to_dict(self) -> dict:
+        return {
+            "predicted_category": self.predicted_category,
+            "predicted_mcc": self.predicted_mcc,
+            "confidence": self.confidence,
+            "evidence": list(self.evidence),
+        }
+
+    def __repr__(self):
+        return f"Classification({self.predicted_category!r}, mcc={self.predicted_mcc!r})"
+
+
+class Recommendation:
+    """One ranked card for a transaction, as returned by the scoring agent."""
+
+    __slots__ = ("card", "bank", "reward", "rate", "rate_unit", "calc_trace", "matched_rule",
+                 "capped", "last4", "card_id")
+
+    def __init__(self, card: str, bank: str, reward: float, rate: float, rate_unit: str,
+                 calc_trace: str, matched_rule: str, capped: bool, last4: str = "0000",
+                 card_id: str = None):
+        self.card = card
+        self.bank = bank
+        self.reward = reward
+        self.rate = rate
+        self.rate_unit = rate_unit
+        self.calc_trace = calc_trace
+        self.matched_rule = matched_rule
+        self.capped = capped
+        self.last4 = last4
+        self.card_id = card_id
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Recommendation":
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def to_dict(self) -> dict:
+        """Recommendation dict of the API contract."""
+        return {
+            "card": self.card,
+            "bank": self.bank,
+            "reward": self.reward,
+            "rate": self.rate,
+            "rate_unit": self.rate_unit,
+            "calc_trace": self.calc_trace,
+            "matched_rule": self.matched_rule,
+            "capped": self.capped,
+            "last4": self.last4,
+            "card_id": self.card_id,
+        }
+
+    def __repr__(self):
+        return f"Recommendation({self.card!r}, reward={self.reward!r})"
+
+
+def as_cards(cards) -> list:
+    """Card models for a wallet given as Card objects and/or card dicts."""
+    return [card if isinstance(card, Card) else Card.from_dict(card) for card in cards]
+
+
+def as_transaction(txn) -> Transaction:
+    """Transaction model for a Transaction or transaction dict."""
+    return txn if isinstance(txn, Transaction) else Transaction.from_dict(txn)
+
+
+# The archive's columns plus the card id recorded at payment time.
+ARRAY_STRING_COLUMNS = STRING_COLUMNS + ("card_id",)
+
+
+class TransactionArray:
+    """
+    Transactions stored column-wise in numpy arrays.
+
+    Numeric fields are fixed-width columns and string fields int32 codes
+    into per-column tables, the same layout as `archive.TransactionArchive`
+    (plus `card_id`); location keeps city, area, lat and lng. Indexing
+    returns a `Transaction`, slicing a `TransactionArray` sharing the
+    columns, and `records` rebuilds dicts for the JSON/API shape.
+    """
+
+    __slots__ = ("_columns", "dictionaries", "_length")
+
+    def __init__(self, columns: dict, dictionaries: dict):
+        self._columns = columns
+        self.dictionaries = dictionaries
+        self._length = len(columns["amount"])
+
+    @classmethod
+    def from_records(cls, txns) -> "TransactionArray":
+        """
+        Args:
+            txns: Iterable of Transaction objects or transaction dicts
+        """
+        encoders = {name: ColumnEncoder() for name in ARRAY_STRING_COLUMNS}
+        numeric = {name: [] for name in NUMERIC_COLUMNS}
+        for txn in txns:
+            txn = as_transaction(txn)
+            location = txn.location or {}
+            encoders["id"].add(txn.id)
+            encoders["merchant"].add(txn.merchant)
+            encoders["card_used"].add(txn.card_used)
+            encoders["card_id"].add(txn.card_id)
+            encoders["category"].add(txn.category)
+            encoders["currency"].add(txn.currency)
+            encoders["city"].add(location.get("city"))
+            encoders["area"].add(location.get("area"))
+            numeric["timestamp"].append(parse_timestamp(txn.timestamp))
+            numeric["amount"].append(float(txn.amount))
+            numeric["reward"].append(float(txn.reward))
+            numeric["mcc"].append(MISSING_MCC if txn.mcc is None else txn.mcc)
+            lat, lng = location.get("lat"), location.get("lng")
+            numeric["lat"].append(np.nan if lat is None else float(lat))
+            numeric["lng"].append(np.nan if lng is None else float(lng))
+
+        columns = {name: np.array(numeric[name], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        columns.update((name, np.array(e.codes, dtype=np.int32)) for name, e in encoders.items())
+        return cls(columns, {name: e.values for name, e in encoders.items()})
+
+    @classmethod
+    def from_archive(cls, archive, start: int = 0, stop: int = None) -> "TransactionArray":
+        """Rows [start, stop) of a TransactionArchive, as views of its memory-mapped columns."""
+        window = slice(start, stop)
+        columns = {name: archive.column(name)[window] for name in NUMERIC_COLUMNS}
+        columns.update((name, archive.column(name)[window]) for name in STRING_COLUMNS)
+        columns["card_id"] = np.full(len(columns["amount"]), MISSING_CODE, dtype=np.int32)
+        return cls(columns, {**archive.dictionaries, "card_id": []})
+
+    @classmethod
+    def of(cls, txns) -> "TransactionArray":
+        """`txns` as a TransactionArray: kept, read from an archive, or built from records."""
+        if isinstance(txns, TransactionArray):
+            return txns
+        if isinstance(txns, TransactionArchive):
+            return cls.from_archive(txns)
+        return cls.from_records(txns)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column: values for numeric columns, int32 codes for string ones."""
+        return self._columns[name]
+
+    def strings(self, name: str) -> list:
+        """Decode a string column to a list of str/None."""
+        table = self.dictionaries[name]
+        return [table[c] if c >= 0 else None for c in self._columns[name].tolist()]
+
+    def to_frame(self, columns) -> "pd.DataFrame":
+        """DataFrame of the requested columns, strings as categoricals (see archive.columns_frame)."""
+        return columns_frame(self, columns)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns (string tables not included)."""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return TransactionArray({name: col[key] for name, col in self._columns.items()}, self.dictionaries)
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError(key)
+        return next(self._iter(key, key + 1))
+
+    def __iter__(self):
+        return self._iter(0, self._length)
+
+    def _iter(self, start: int, stop: int):
+        window = slice(start, stop)
+        strings = {
+            name: [table[c] if c >= 0 else None for c in self._columns[name][window].tolist()]
+            for name, table in self.dictionaries.items()
+        }
+        timestamps = format_timestamps(self._columns["timestamp"][window])
+        amount = self._columns["amount"][window].tolist()
+        reward = self._columns["reward"][window].tolist()
+        mcc = self._columns["mcc"][window].tolist()
+        lat = self._columns["lat"][window].tolist()
+        lng = self._columns["lng"][window].tolist()
+
+        for i in range(stop - start):
+            location = {}
+            if strings["city"][i] is not None:
+                location["city"] = strings["city"][i]
+            if strings["area"][i] is not None:
+                location["area"] = strings["area"][i]
+            if lat[i] == lat[i]:
+                location["lat"] = lat[i]
+            if lng[i] == lng[i]:
+                location["lng"] = lng[i]
+            yield Transaction(
+                merchant=strings["merchant"][i],
+                amount=amount[i],
+                currency=strings["currency"][i],
+                category=strings["category"][i],
+                mcc=None if mcc[i] == MISSING_MCC else mcc[i],
+                location=location or None,
+                timestamp=timestamps[i],
+                id=strings["id"][i],
+                card_used=strings["card_used"][i],
+                card_id=strings["card_id"][i],
+                reward=reward[i],
+            )
+
+    def records(self) -> list:
+        """Transaction dicts in the store's shape."""
+        return [txn.to_dict() for txn in self]
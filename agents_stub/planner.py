@@ -0,0 +1,215 @@
+"""
+Wallet Planner
+Assigns cards across a stream of transactions while respecting monthly caps
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .merchant_agent import classify_merchants
+from .scoring_engine import reward_matrix
+
+# Above this many (transaction x card) cells in one month the exchange search
+# is skipped and the per-transaction greedy plan is returned as is.
+MAX_SEARCH_CELLS = 2_000_000
+MAX_SEARCH_MOVES = 50_000
+_EPS = 1e-9
+
+
+def _month_key(txn: dict) -> str:
+    timestamp = txn.get("timestamp") or ""
+    return timestamp[:7]
+
+
+def _with_categories(txns: list) -> list:
+    """Fill in missing categories with the batch classifier."""
+    missing = [i for i, t in enumerate(txns) if not t.get("category")]
+    if not missing:
+        return txns
+    classified = classify_merchants(
+        [(txns[i].get("merchant", ""), txns[i].get("location")) for i in missing]
+    )
+    txns = list(txns)
+    for i, category in zip(missing, classified["predicted_category"].tolist()):
+        txns[i] = {**txns[i], "category": category}
+    return txns
+
+
+def _realized_rewards(uncapped: np.ndarray, assign: np.ndarray, caps: np.ndarray) -> np.ndarray:
+    """Per-transaction reward when each card's cap is consumed in order."""
+    chosen = uncapped[np.arange(len(assign)), assign]
+    realized = np.empty_like(chosen)
+    for j in range(len(caps)):
+        rows = np.flatnonzero(assign == j)
+        if len(rows) == 0:
+            continue
+        before = np.concatenate(([0.0], np.cumsum(chosen[rows])[:-1]))
+        realized[rows] = np.clip(caps[j] - before, 0, None).clip(max=chosen[rows])
+    return realized
+
+
+def greedy_assignment(uncapped: np.ndarray, caps: np.ndarray) -> np.ndarray:
+    """
+    Per-transaction choice as made today: each transaction, in order, takes
+    the card with the best reward given what is left of each cap.
+    """
+    remaining = caps.astype(np.float64).tolist()
+    n_cards = len(remaining)
+    assign = np.empty(uncapped.shape[0], dtype=np.intp)
+    for i, row in enumerate(uncapped.tolist()):
+        best_j, best_value = 0, -1.0
+        for j in range(n_cards):
+            value = row[j] if row[j] <= remaining[j] else max(remaining[j], 0.0)
+            if value > best_value:
+                best_j, best_value = j, value
+        assign[i] = best_j
+        remaining[best_j] -= best_value
+    return assign
+
+
+def exchange_assignment(uncapped: np.ndarray, caps: np.ndarray, start: np.ndarray = None,
+                        max_moves: int = MAX_SEARCH_MOVES) -> np.ndarray:
+    """
+    Cap-aware assignment by local search.
+
+    Starts from `start` (default: every transaction on its best uncapped
+    card), then repeatedly applies the single move (transaction to another
+    card) with the largest gain in total capped reward until no move helps.
+    Only transactions on over-cap cards are ever worth moving, which keeps
+    each step small.
+    """
+    n_txns, n_cards = uncapped.shape
+    rows = np.arange(n_txns)
+    assign = uncapped.argmax(axis=1) if start is None else start.copy()
+    load = np.bincount(assign, weights=uncapped[rows, assign], minlength=n_cards)
+
+    for _ in range(max_moves):
+        over = load > caps + _EPS
+        if not over.any():
+            break
+
+        cand = np.flatnonzero(over[assign])
+        src = assign[cand]
+        u_src = uncapped[cand, src]
+
+        # Reward lost on the source card and gained on every target card.
+        loss = np.minimum(load[src], caps[src]) - np.minimum(load[src] - u_src, caps[src])
+        gain = np.minimum(load + uncapped[cand], caps) - np.minimum(load, caps)
+        delta = gain - loss[:, None]
+        delta[np.arange(len(cand)), src] = -np.inf
+
+        flat = int(delta.argmax())
+        r, k = divmod(flat, n_cards)
+        if delta[r, k] <= _EPS:
+            break
+
+        i, j = cand[r], src[r]
+        load[j] -= uncapped[i, j]
+        load[k] += uncapped[i, k]
+        assign[i] = k
+
+    return assign
+
+
+def plan_month(txns: list, cards: list, use_current_usage: bool = True) -> dict:
+    """
+    Assign cards to one month of transactions to maximize total reward.
+
+    Args:
+        txns: Ordered transactions with amount and category (missing
+            categories are classified from the merchant)
+        cards: Wallet cards with monthly_cap and used_this_month
+        use_current_usage: Start from each card's used_this_month; when
+            False every cap starts empty (e.g. a past or future month)
+
+    Returns:
+        Plan with per-transaction assignments, totals and the gain over the
+        per-transaction greedy choice
+    """
+    txns = _with_categories(list(txns))
+    if not txns or not cards:
+        return {
+            "assignments": [],
+            "total_reward": 0.0,
+            "greedy_total_reward": 0.0,
+            "gain": 0.0,
+            "method": "empty",
+        }
+
+    scored = reward_matrix(txns, cards)
+    uncapped = scored["uncapped"]
+    caps = np.array([card["monthly_cap"] for card in cards], dtype=np.float64)
+    if use_current_usage:
+        caps -= np.array([card.get("used_this_month", 0) or 0 for card in cards], dtype=np.float64)
+    caps = caps.clip(min=0)
+
+    greedy = greedy_assignment(uncapped, caps)
+    greedy_rewards = _realized_rewards(uncapped, greedy, caps)
+
+    assign, rewards, method = greedy, greedy_rewards, "greedy"
+    if uncapped.size <= MAX_SEARCH_CELLS:
+        # Search from both the uncapped optimum and the greedy plan; keep the
+        # better one, and never report a plan worse than the baseline.
+        for start in (None, greedy):
+            candidate = exchange_assignment(uncapped, caps, start=start)
+            candidate_rewards = _realized_rewards(uncapped, candidate, caps)
+            if candidate_rewards.sum() > rewards.sum() + _EPS:
+                assign, rewards, method = candidate, candidate_rewards, "exchange_search"
+
+    total = float(rewards.sum())
+    greedy_total = float(greedy_rewards.sum())
+    assignments = [
+        {
+            "id": txn.get("id", f"t{i + 1}"),
+            "merchant": txn.get("merchant"),
+            "amount": txn.get("amount", 0),
+            "category": txn.get("category"),
+            "card": cards[j]["display_name"],
+            "card_id": cards[j].get("id"),
+            "reward": round(reward, 2),
+            "greedy_card": cards[g]["display_name"],
+        }
+        for i, (txn, j, g, reward) in enumerate(zip(txns, assign.tolist(), greedy.tolist(), rewards.tolist()))
+    ]
+
+    return {
+        "assignments": assignments,
+        "total_reward": round(total, 2),
+        "greedy_total_reward": round(greedy_total, 2),
+        "gain": round(total - greedy_total, 2),
+        "method": method,
+    }
+
+
+def plan_wallet(txns: list, cards: list) -> dict:
+    """
+    Plan a multi-month stream of transactions month by month.
+
+    Caps reset every calendar month (taken from each transaction's
+    timestamp). The earliest month starts from the cards' current
+    used_this_month; later months start with empty caps.
+
+    Args:
+        txns: Ordered transactions with timestamp, amount and category
+        cards: Wallet cards with monthly_cap and used_this_month
+
+    Returns:
+        Per-month plans plus overall totals and gain over greedy
+    """
+    months = OrderedDict()
+    for txn in txns:
+        months.setdefault(_month_key(txn), []).append(txn)
+
+    plans = OrderedDict()
+    for n, (month, month_txns) in enumerate(sorted(months.items())):
+        plans[month] = plan_month(month_txns, cards, use_current_usage=(n == 0))
+
+    total = sum(plan["total_reward"] for plan in plans.values())
+    greedy_total = sum(plan["greedy_total_reward"] for plan in plans.values())
+    return {
+        "months": plans,
+        "total_reward": round(total, 2),
+        "greedy_total_reward": round(greedy_total, 2),
+        "gain": round(total - greedy_total, 2),
+    }
@@ -0,0 +1,376 @@
+"""
+Reference Data Snapshot
+Cards, rule tables and merchant indexes precompiled into one binary file for
+fast cold starts
+
+Every reference object the app loads on first use (the mock wallet, the
+compiled card rules, the FX rates, the merchant catalogue and branch
+indexes, the name normalizer and the merchant model) is pickled into one
+snapshot file, with its numpy arrays stored out of band and memory-mapped
+on load. Reading the snapshot costs a few pickle opcodes per object instead
+of parsing JSON/CSV or decompressing .npz files, and the arrays are shared
+through the page cache by every worker on the host.
+
+Startup-optimization mode is opt-in with AURA_FAST_START=1. Each object is
+taken from the snapshot only if its source file still has the path, mtime
+and size it was built from; anything else (a missing or stale snapshot, an
+edited rule file, a different Python/numpy) loads from the source as usual.
+The pickles name this package's classes, so the snapshot also records a
+digest of the package's source and is ignored as a whole once any module
+changes: an object pickled under the old code is never revived under the
+new.
+
+Unpickling runs code, so nothing in the file is unpickled until it is
+authenticated. The metadata is a JSON block, checked first; the file then
+carries an HMAC-SHA256 of everything after its fixed header, keyed by
+AURA_SNAPSHOT_KEY, and the payload is only unpickled once that matches.
+Without the key no snapshot is written or read. Build the snapshot as part
+of the deploy, with the same key in the app's environment:
+
+    AURA_SNAPSHOT_KEY=... python -m agents_stub.reference build
+    AURA_SNAPSHOT_KEY=... python -m agents_stub.reference check
+
+Paths resolve relative to this package, never the working directory.
+"""
+
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import pickle
+import platform
+import struct
+import sys
+import threading
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DEFAULT_SNAPSHOT_PATH = DATA_DIR / "reference.snapshot"
+DEFAULT_CARDS_PATH = DATA_DIR / "mock_user_cards.json"
+
+# Format 2: JSON meta block and an HMAC in the header (format 1 pickled the meta).
+FORMAT = 2
+_MAGIC = b"AURAREF\0"
+_HEADER = struct.Struct("<8sQQ32s")  # magic, meta length, payload length, HMAC-SHA256
+_ALIGN = 64
+
+
+def fast_start() -> bool:
+    """True when AURA_FAST_START asks for the snapshot."""
+    return os.getenv("AURA_FAST_START", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def snapshot_path() -> Path:
+    return Path(os.getenv("AURA_SNAPSHOT_PATH") or DEFAULT_SNAPSHOT_PATH)
+
+
+def snapshot_key():
+    """HMAC key for the snapshot (AURA_SNAPSHOT_KEY as UTF-8), or None if unset."""
+    key = os.getenv("AURA_SNAPSHOT_KEY")
+    return key.encode("utf-8") if key else None
+
+
+def _stamp(path) -> list:
+    """[resolved path, mtime_ns, size] of a source file (a list, as it reads back from JSON)."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return [str(path), stat.st_mtime_ns, stat.st_size]
+
+
+def _runtime() -> str:
+    import numpy as np
+
+    return f"python {'.'.join(platform.python_version_tuple()[:2])}, numpy {np.__version__}"
+
+
+def _mac(key: bytes, data) -> bytes:
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+
+_code_digest = None
+
+
+def code_digest() -> str:
+    """Digest of every module in this package, computed once per process."""
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha1()
+        for module in sorted(Path(__file__).resolve().parent.glob("*.py")):
+            digest.update(module.name.encode())
+            digest.update(b"\0")
+            digest.update(module.read_bytes())
+        _code_digest = digest.hexdigest()[:16]
+    return _code_digest
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sources() -> dict:
+    """Snapshot entry -> (source path, loader), honouring the same overrides as the accessors."""
+    from .card_rules import DEFAULT_RULES_PATH, load_rules
+    from .fx import DEFAULT_RATES_PATH, load_rates
+    from .geo_index import DEFAULT_LOCATIONS_PATH, LocationIndex
+    from .mcc_index import DEFAULT_CATALOGUE_PATH, open_index
+    from .merchant_model import DEFAULT_MODEL_PATH, MerchantModel
+    from .merchant_names import DEFAULT_NAMES_PATH, MerchantNormalizer
+
+    def source(env, default):
+        return Path(os.getenv(env) or default)
+
+    return {
+        "cards": (source("AURA_CARDS_PATH", DEFAULT_CARDS_PATH), _read_json),
+        "rules": (source("AURA_RULES_PATH", DEFAULT_RULES_PATH), load_rules),
+        "fx_rates": (source("AURA_FX_RATES", DEFAULT_RATES_PATH), load_rates),
+        "merchant_index": (source("AURA_MERCHANT_CATALOGUE", DEFAULT_CATALOGUE_PATH), open_index),
+        "locations": (source("AURA_MERCHANT_LOCATIONS", DEFAULT_LOCATIONS_PATH), LocationIndex.from_csv),
+        "merchant_names": (source("AURA_MERCHANT_NAMES", DEFAULT_NAMES_PATH), MerchantNormalizer.from_json),
+        "merchant_model": (source("AURA_MERCHANT_MODEL", DEFAULT_MODEL_PATH), MerchantModel.load),
+    }
+
+
+def write_snapshot(objects: dict, stamps: dict, path, key: bytes = None) -> int:
+    """
+    Write a snapshot atomically.
+
+    Args:
+        objects: Entry name -> picklable object
+        stamps: Entry name -> source stamp the object was built from
+        path: Output file
+        key: HMAC key (default: `snapshot_key()`)
+
+    Returns:
+        Size of the file in bytes
+
+    Raises:
+        ValueError: if there is no key
+    """
+    key = key or snapshot_key()
+    if not key:
+        raise ValueError("AURA_SNAPSHOT_KEY must be set to write a reference snapshot")
+    buffers = []
+    payload = pickle.dumps(objects, protocol=5, buffer_callback=buffers.append)
+    raws = [buf.raw() for buf in buffers]
+
+    # Lay the out-of-band buffers out after the payload, each aligned so
+    # arrays mapped from them are aligned too.
+    def layout(start):
+        spans, offset = [], start
+        for raw in raws:
+            offset = -(-offset // _ALIGN) * _ALIGN
+            spans.append([offset, raw.nbytes])
+            offset += raw.nbytes
+        return spans
+
+    # The buffer offsets depend on the size of the meta block that records
+    # them; iterate until the layout stops moving.
+    meta = {"format": FORMAT, "runtime": _runtime(), "code": code_digest(), "stamps": stamps,
+            "buffers": None}
+    while True:
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        spans = layout(_HEADER.size + len(meta_bytes) + len(payload))
+        if spans == meta["buffers"]:
+            break
+        meta["buffers"] = spans
+
+    path = Path(path)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(tmp, "w+b") as f:
+        f.write(_HEADER.pack(_MAGIC, len(meta_bytes), len(payload), bytes(32)))
+        f.write(meta_bytes)
+        f.write(payload)
+        for (offset, _), raw in zip(meta["buffers"], raws):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(raw)
+        size = f.tell()
+        f.flush()
+        # Sign everything after the header, as read back from the file.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as written:
+            mac = _mac(key, memoryview(written)[_HEADER.size:])
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, len(meta_bytes), len(payload), mac))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return size
+
+
+def _read_meta(mapped) -> tuple:
+    """(meta, payload length, mac) from a mapped snapshot's header and JSON block, or None."""
+    if len(mapped) < _HEADER.size:
+        return None
+    magic, meta_len, payload_len, mac = _HEADER.unpack_from(mapped)
+    if magic != _MAGIC or _HEADER.size + meta_len + payload_len > len(mapped):
+        return None
+    try:
+        meta = json.loads(bytes(mapped[_HEADER.size: _HEADER.size + meta_len]).decode("utf-8"))
+    except ValueError:
+        return None
+    if not isinstance(meta, dict):
+        return None
+    return meta, payload_len, mac
+
+
+def read_snapshot(path, key: bytes = None):
+    """
+    Map a snapshot, authenticate it and unpickle it.
+
+    Nothing is unpickled unless the JSON meta block matches this format,
+    runtime and package version and the HMAC over the file matches `key`.
+
+    Args:
+        path: Snapshot file
+        key: HMAC key (default: `snapshot_key()`)
+
+    Returns:
+        (objects, stamps), or None if there is no key, or the file is
+        missing, malformed, fails authentication or was written by a
+        different format, Python or numpy version, or by another version of
+        this package (see code_digest)
+    """
+    key = key or snapshot_key()
+    if not key:
+        return None
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        header = _read_meta(mapped)
+        if header is None:
+            return None
+        meta, payload_len, mac = header
+        if (meta.get("format") != FORMAT or meta.get("runtime") != _runtime()
+                or meta.get("code") != code_digest()):
+            return None
+        view = memoryview(mapped)
+        if not hmac.compare_digest(mac, _mac(key, view[_HEADER.size:])):
+            return None
+        start = _HEADER.size + _HEADER.unpack_from(mapped)[1]
+        buffers = [view[offset: offset + size] for offset, size in meta["buffers"]]
+        objects = pickle.loads(view[start: start + payload_len], buffers=buffers)
+    except Exception:
+        return None
+    # The arrays are read-only views of the mapping, which stays open for
+    # as long as any of them is alive.
+    return objects, meta["stamps"]
+
+
+def build(path=None) -> dict:
+    """
+    Load every reference source that exists and snapshot it.
+
+    Args:
+        path: Output file (AURA_SNAPSHOT_PATH or data/reference.snapshot)
+
+    Returns:
+        Entry name -> source stamp for everything written
+    """
+    objects, stamps = {}, {}
+    for name, (source, loader) in _sources().items():
+        if source.exists():
+            stamps[name] = _stamp(source)
+            objects[name] = loader(source)
+    write_snapshot(objects, stamps, path or snapshot_path())
+    return stamps
+
+
+_loaded = None
+_loaded_lock = threading.Lock()
+
+
+def _snapshot():
+    global _loaded
+    if _loaded is None:
+        with _loaded_lock:
+            if _loaded is None:
+                _loaded = read_snapshot(snapshot_path()) or ({}, {})
+    return _loaded
+
+
+def cached(name: str, source, loader):
+    """
+    Reference object `name` built from `source`: from the snapshot in
+    startup-optimization mode when it is fresh for that file, else
+    `loader(source)`.
+
+    Args:
+        name: Snapshot entry
+        source: Source file path
+        loader: Callable building the object from the source path
+
+    Returns:
+        The loaded object
+    """
+    if fast_start():
+        objects, stamps = _snapshot()
+        stamp = stamps.get(name)
+        if stamp is not None:
+            try:
+                fresh = _stamp(source) == stamp
+            except OSError:
+                fresh = False
+            if fresh:
+                return objects[name]
+    return loader(source)
+
+
+def load_cards(path=None) -> list:
+    """
+    The mock wallet (AURA_CARDS_PATH or data/mock_user_cards.json).
+
+    Returns a private copy: callers update card usage in place.
+    """
+    path = Path(path or os.getenv("AURA_CARDS_PATH") or DEFAULT_CARDS_PATH)
+    return copy.deepcopy(cached("cards", path, _read_json))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or check the reference data snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    make = sub.add_parser("build", help="snapshot every reference source")
+    make.add_argument("--out", default=None, help="output file (default: data/reference.snapshot)")
+    check = sub.add_parser("check", help="report which snapshot entries are stale")
+    check.add_argument("path", nargs="?", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        out = Path(args.out) if args.out else snapshot_path()
+        try:
+            stamps = build(out)
+        except ValueError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        print(f"{out}: {', '.join(stamps)} ({out.stat().st_size / 1e6:.1f} MB)")
+        return 0
+
+    path = Path(args.path) if args.path else snapshot_path()
+    snapshot = read_snapshot(path)
+    if snapshot is None:
+        print(f"{path}: missing, not signed with AURA_SNAPSHOT_KEY, or unreadable by this runtime "
+              "or package version")
+        return 1
+    _, stamps = snapshot
+    stale = 0
+    for name, (source, _) in _sources().items():
+        stamp = stamps.get(name)
+        if not source.exists():
+            state = "no source"
+        elif stamp is None:
+            state = "not in snapshot"
+        else:
+            state = "ok" if _stamp(source) == stamp else "stale"
+        stale += state in ("stale", "not in snapshot")
+        print(f"{name:<16}{state:<18}{source}")
+    return 1 if stale else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
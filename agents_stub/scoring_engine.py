@@ -1,108 +1,392 @@
 """
-Scoring Engine Agent (Stub)
-TO BE REPLACED with real scoring and optimization logic
+Scoring Engine Agent
+Ranks a wallet's cards for each transaction by the reward it would earn
+
+Earning rules come from the compiled rule file (`card_rules`): MCC
+overrides, overseas rates, spend tiers and category rates, clamped to each
+card's remaining monthly cap and category sub-cap. Foreign-currency amounts
+are converted to the base currency first (`fx`).
+
+`score_best_card` scores one transaction. `reward_matrix` computes the
+rewards for N transactions on M cards as NumPy arrays in one vectorized
+pass, against rate tables compiled once per wallet. `score_batch` ranks
+that matrix with `top_k_cards` and builds recommendation dicts only for
+the top cards of each transaction; its results match `score_best_card`,
+and both return the API contract's scoring dicts (the stand-in agent
+server answers /score with `score_best_card`).
 """
 
+import numpy as np
+
+from .card_rules import as_mcc, get_rules
+from .fx import get_fx_rates
+from .models import Recommendation, TransactionArray, as_cards, as_transaction
+
+MAX_CARDS = 5
+CALCULATION_METHOD = "rule_engine"
+
+
+def _describe(label: str, amount: float, rule, reward_value: float, mile_value: float,
+              fx_trace: str = ""):
+    """Build the (calc_trace, matched_rule) strings for one card."""
+    if rule.is_mile:
+        calc_trace = (
+            f"${amount:.2f} x {rule.rate:.1f} miles x ${mile_value:.2f} = ${reward_value:.2f}"
+        )
+        matched_rule = f"{label} {rule.rate:.1f} miles per dollar"
+    else:
+        calc_trace = f"${amount:.2f} x {rule.rate * 100:.1f}% = ${reward_value:.2f}"
+        matched_rule = f"{label} {rule.rate * 100:.1f}% cashback"
+    return fx_trace + calc_trace, matched_rule + rule.note
+
+
+def _recommendation(card, category: str, amount: float, rule, mile_value: float,
+                    uncapped_value: float, reward_value: float, capped: bool,
+                    fx_trace: str = "") -> dict:
+    """Recommendation dict of the API contract for a Card model."""
+    calc_trace, matched_rule = _describe(
+        rule.label or category, amount, rule, uncapped_value, mile_value, fx_trace
+    )
+    return Recommendation(
+        card.display_name,
+        card.bank,
+        round(reward_value, 2),
+        rule.rate,
+        rule.unit,
+        calc_trace,
+        matched_rule + (" (cap reached)" if capped else ""),
+        capped,
+        card.last4 or "0000",
+        card.id,
+    ).to_dict()
+
+
+def _fx(fx, currency: str, amount: float, base_amount: float):
+    """(`fx` entry of a scoring result, calc_trace prefix) for a foreign-currency amount."""
+    code = fx.codes[fx.index(currency)]
+    detail = {
+        "currency": code,
+        "amount": amount,
+        "rate": fx.rate(code),
+        "base_currency": fx.base,
+        "base_amount": round(base_amount, 2),
+        "rates_as_of": fx.as_of,
+    }
+    return detail, f"{code} {amount:,.2f} = ${base_amount:.2f}; "
+
+
 def score_best_card(txn: dict, user_cards: list) -> dict:
     """
     Score and rank credit cards for a transaction.
-    
-    TODO: Replace with real scoring logic:
-    - Load actual card T&Cs and rules
-    - Calculate precise cashback/miles
-    - Consider caps and tier bonuses
-    - Apply user preferences
-    
+
+    Each card's earning rule comes from the compiled rule file (MCC
+    override, overseas rate, spend tier or category rate); see
+    `card_rules`. Amounts in a foreign currency are converted to the base
+    currency first (see `fx`), since caps, tiers and rewards are in it.
+
     Args:
-        txn: Transaction dict with merchant, amount, category, etc.
+        txn: Transaction dict with merchant, amount, currency, category, mcc, etc.
         user_cards: List of user's credit cards
-    
+
     Returns:
-        Scoring result with top recommendations and calculations
+        Scoring result with top recommendations and calculations, plus an
+        `fx` entry when the amount was converted
+
+    Raises:
+        FxError: if the rates file has no rate for the currency
     """
-    
-    amount = txn.get("amount", 0)
-    category = txn.get("category", "General")
-    
-    # Mock scoring rules (to be replaced with rule engine)
-    MILE_TO_SGD = 0.02
-    category_rates = {
-        "Dining": {
-            "Citi Cash Back+": {"rate": 0.08, "unit": "sgd"},
-            "DBS Altitude": {"rate": 3.0, "unit": "mile"},
-            "UOB One": {"rate": 0.05, "unit": "sgd"},
-            "OCBC 365": {"rate": 0.06, "unit": "sgd"},
-            "StanChart Unlimited": {"rate": 0.015, "unit": "sgd"}
-        },
-        "Groceries": {
-            "Citi Cash Back+": {"rate": 0.08, "unit": "sgd"},
-            "DBS Altitude": {"rate": 1.2, "unit": "mile"},
-            "UOB One": {"rate": 0.10, "unit": "sgd"},
-            "OCBC 365": {"rate": 0.03, "unit": "sgd"},
-            "StanChart Unlimited": {"rate": 0.015, "unit": "sgd"}
-        },
-        "Transport": {
-            "Citi Cash Back+": {"rate": 0.08, "unit": "sgd"},
-            "DBS Altitude": {"rate": 2.0, "unit": "mile"},
-            "UOB One": {"rate": 0.03, "unit": "sgd"},
-            "OCBC 365": {"rate": 0.03, "unit": "sgd"},
-            "StanChart Unlimited": {"rate": 0.03, "unit": "sgd"}
-        },
-        "General": {
-            "Citi Cash Back+": {"rate": 0.015, "unit": "sgd"},
-            "DBS Altitude": {"rate": 1.2, "unit": "mile"},
-            "UOB One": {"rate": 0.01, "unit": "sgd"},
-            "OCBC 365": {"rate": 0.006, "unit": "sgd"},
-            "StanChart Unlimited": {"rate": 0.015, "unit": "sgd"}
-        }
-    }
-    
-    # Calculate rewards for each card
-    recommendations = []
-    rates = category_rates.get(category, category_rates["General"])
-
-    for card in user_cards[:5]:  # Limit to user's cards
-        card_name = card["display_name"]
-        rate_info = rates.get(card_name) or {"rate": 0.01, "unit": "sgd"}
-        rate = rate_info["rate"]
-        unit = rate_info.get("unit", "sgd")
-
-        if unit == "mile":
-            reward_value = amount * rate * MILE_TO_SGD
-            calc_trace = (
-                f"${amount:.2f} x {rate:.1f} miles x ${MILE_TO_SGD:.2f} = ${reward_value:.2f}"
-            )
-            matched_rule = f"{category} {rate:.1f} miles per dollar"
+
+    rules = get_rules()
+    fx = get_fx_rates()
+    txn = as_transaction(txn)
+    overseas = fx.is_foreign(txn.currency)
+    amount = fx.to_base(txn.amount, txn.currency)
+    fx_detail, fx_trace = _fx(fx, txn.currency, txn.amount, amount) if overseas else (None, "")
+    category = txn.category if txn.category is not None else "General"
+    mcc = txn.mcc
+    category_index = rules.category_index(category)
+    rule_category = rules.categories[category_index]
+    mile_value = rules.mile_value
+
+    # Reward on every card first; only the top three are formatted.
+    scored = []
+    for card in as_cards(user_cards[:MAX_CARDS]):  # Limit to user's cards
+        program = rules.program(card.display_name)
+        rule = program.lookup(category_index, mcc, card.spend_this_month, overseas)
+
+        if rule.is_mile:
+            reward_value = amount * rule.rate * mile_value
         else:
-            reward_value = amount * rate
-            calc_trace = f"${amount:.2f} x {rate * 100:.1f}% = ${reward_value:.2f}"
-            matched_rule = f"{category} {rate * 100:.1f}% cashback"
+            reward_value = amount * rule.rate
+        uncapped_value = reward_value
 
         # Check monthly cap
-        remaining_cap = card["monthly_cap"] - card["used_this_month"]
+        remaining_cap = card.remaining_cap(program.sub_caps[category_index], rule_category)
         if reward_value > remaining_cap:
             reward_value = max(remaining_cap, 0)
             capped = True
         else:
             capped = False
 
-        recommendations.append({
-            "card": card_name,
-            "bank": card["bank"],
-            "reward": round(reward_value, 2),
-            "rate": rate,
-            "rate_unit": unit,
-            "calc_trace": calc_trace,
-            "matched_rule": matched_rule + (" (cap reached)" if capped else ""),
-            "capped": capped,
-            "last4": card.get("last4", "0000"),
-            "card_id": card.get("id"),
-        })
-    
-    # Sort by reward amount
-    recommendations.sort(key=lambda x: x["reward"], reverse=True)
-    
+        scored.append((round(reward_value, 2), card, rule, uncapped_value, reward_value, capped))
+
+    # Sort by reward amount (stable, so earlier cards win ties)
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    result = {
+        "recommendations": [  # Top 3
+            _recommendation(card, category, amount, rule, mile_value, uncapped, reward, capped, fx_trace)
+            for _, card, rule, uncapped, reward, capped in scored[:3]
+        ],
+        "calculation_method": CALCULATION_METHOD,
+        "rules_version": rules.version,
+    }
+    if fx_detail is not None:
+        result["fx"] = fx_detail
+    return result
+
+
+def _txn_columns(txns, fx):
+    """
+    Extract amount, category, MCC and currency columns from transactions, a
+    TransactionArray or a DataFrame. Currencies come back as `fx` rate-table
+    indexes, or None when a DataFrame has no currency column.
+    """
+    if isinstance(txns, TransactionArray):
+        amounts = np.asarray(txns.column("amount"), dtype=np.float64)
+        categories = [c if c is not None else "General" for c in txns.strings("category")]
+        mccs = np.asarray(txns.column("mcc"), dtype=np.int64)
+        currencies = fx.encode_table(txns.dictionaries["currency"])[txns.column("currency")]
+    elif hasattr(txns, "columns"):
+        amounts = txns["amount"].to_numpy(dtype=np.float64, na_value=0.0)
+        categories = (
+            txns["category"].fillna("General").tolist()
+            if "category" in txns.columns else ["General"] * len(txns)
+        )
+        mccs = (
+            np.array([as_mcc(m) or -1 for m in txns["mcc"].tolist()], dtype=np.int64)
+            if "mcc" in txns.columns else None
+        )
+        currencies = None
+        if "currency" in txns.columns:
+            codes, values = txns["currency"].factorize()
+            currencies = fx.encode_table(values.tolist())[codes]
+    else:
+        txns = [as_transaction(t) for t in txns]
+        amounts = np.fromiter((t.amount for t in txns), dtype=np.float64, count=len(txns))
+        categories = [t.category if t.category is not None else "General" for t in txns]
+        mccs = np.fromiter((t.mcc or -1 for t in txns), dtype=np.int64, count=len(txns))
+        currencies = fx.encode([t.currency for t in txns])
+    return amounts, categories, mccs, currencies
+
+
+def reward_matrix(txns, cards: list):
+    """
+    Rewards for every transaction on every card, in one vectorized pass.
+
+    Each transaction is evaluated independently against the cards' current
+    remaining cap (and category sub-caps), exactly as `score_best_card` does.
+    Amounts are converted to the base currency with one multiply over the
+    whole column.
+
+    Args:
+        txns: Transactions (dicts or models), a TransactionArray, or a
+            DataFrame with amount, category and optionally mcc and currency
+        cards: Cards to score (all of them, in order), as dicts or models
+
+    Returns:
+        Dict of N x M arrays: `reward` (capped, SGD), `uncapped`, `capped`
+        (bool), plus `rate` and `is_mile`, the per-row `categories` list,
+        `category_index` and `mccs` arrays, `amounts` (base currency),
+        `original_amounts`, `currencies` (rate-table indexes, 0 = base, or
+        None), and the `rules` and `fx` rates used
+
+    Raises:
+        FxError: if the rates file has no rate for a currency
+    """
+    rules = get_rules()
+    fx = get_fx_rates()
+    original_amounts, categories, mccs, currencies = _txn_columns(txns, fx)
+    amounts = original_amounts if currencies is None else fx.convert(original_amounts, currencies)
+    cards = as_cards(cards)
+    names = tuple(card.display_name for card in cards)
+    programs = [rules.program(name) for name in names]
+    levels = tuple(p.tier_level(card.spend_this_month) for p, card in zip(programs, cards))
+    rates, is_mile, sub_caps = rules.wallet_tables(names, levels)
+
+    cat_idx = np.fromiter(
+        (rules.category_index(c) for c in categories),
+        dtype=np.intp,
+        count=len(categories),
+    )
+    row_rates = rates[cat_idx]
+    row_is_mile = is_mile[cat_idx]
+
+    # Foreign-currency spend earns the overseas rate on cards that have one.
+    if currencies is not None and rules.has_overseas:
+        patch = rules.overseas_patch(names)
+        rows = np.flatnonzero(currencies)
+        if patch is not None and rows.size:
+            cols, patch_rates, patch_mile = patch
+            row_rates[np.ix_(rows, cols)] = patch_rates
+            row_is_mile[np.ix_(rows, cols)] = patch_mile
+
+    # MCC overrides replace either rate for the cards that define them.
+    if mccs is not None and rules.mcc_codes:
+        for code, (cols, patch_rates, patch_mile) in rules.mcc_patches(names).items():
+            rows = np.flatnonzero(mccs == code)
+            if rows.size:
+                row_rates[np.ix_(rows, cols)] = patch_rates
+                row_is_mile[np.ix_(rows, cols)] = patch_mile
+
+    remaining = np.array([card.remaining_cap() for card in cards], dtype=np.float64)
+    if np.isfinite(sub_caps).any():
+        used = np.array(
+            [[card.category_used.get(cat, 0) for card in cards] for cat in rules.categories],
+            dtype=np.float64,
+        )
+        row_remaining = np.minimum(remaining[None, :], sub_caps - used)[cat_idx]
+    else:
+        row_remaining = remaining[None, :]
+
+    uncapped = amounts[:, None] * row_rates
+    uncapped = np.where(row_is_mile, uncapped * rules.mile_value, uncapped)
+    capped = uncapped > row_remaining
+    reward = np.where(capped, np.maximum(row_remaining, 0), uncapped)
+
     return {
-        "recommendations": recommendations[:3],  # Top 3
-        "calculation_method": "category_based_rates"
+        "reward": reward,
+        "uncapped": uncapped,
+        "capped": capped,
+        "rate": row_rates,
+        "is_mile": row_is_mile,
+        "categories": categories,
+        "category_index": cat_idx,
+        "mccs": mccs,
+        "amounts": amounts,
+        "original_amounts": original_amounts,
+        "currencies": currencies,
+        "rules": rules,
+        "fx": fx,
     }
+
+
+def top_k_cards(reward: np.ndarray, k: int = 3) -> np.ndarray:
+    """
+    Column indices of the k best cards per row, best first.
+
+    Ranks on rewards rounded to the cent and breaks ties by card order, so
+    the result matches the stable sort in `score_best_card`.
+    """
+    n_rows, n_cards = reward.shape
+    k = min(k, n_cards)
+    if k == 0:
+        return np.empty((n_rows, 0), dtype=np.intp)
+
+    # Unique integer key per cell: cents first, earlier card wins ties.
+    # Values sitting on a half cent are re-rounded with Python's round() so
+    # the ranking agrees with the rounded "reward" field exactly.
+    scaled = reward * 100
+    cents = np.rint(scaled)
+    halfway = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if halfway.any():
+        cents[halfway] = [round(round(v, 2) * 100) for v in reward[halfway].tolist()]
+    cents = cents.astype(np.int64)
+    key = cents * n_cards + (n_cards - 1 - np.arange(n_cards))
+
+    if k < n_cards:
+        part = np.argpartition(-key, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n_cards), (n_rows, n_cards))
+    order = np.argsort(-np.take_along_axis(key, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def score_batch(txns, cards: list, top_k: int = 3, max_cards: int = MAX_CARDS) -> list:
+    """
+    Score many transactions against a wallet in one vectorized pass.
+
+    Rewards for all N x M (transaction, card) pairs are computed with NumPy
+    against rate tables compiled once per wallet from the rule file; only
+    the top-k cards per transaction are turned into recommendation dicts.
+
+    Args:
+        txns: Transactions (dicts or models), a TransactionArray, or a
+            DataFrame with amount and category
+        cards: User's credit cards, as dicts or models
+        top_k: Number of recommendations to return per transaction
+        max_cards: Only score the first `max_cards` cards, like
+            `score_best_card`; None scores every card
+
+    Returns:
+        One scoring result per transaction, same shape as `score_best_card`
+    """
+    cards = as_cards(cards if max_cards is None else cards[:max_cards])
+    n_txns = len(txns)
+    if n_txns == 0:
+        return []
+    if not cards:
+        version = get_rules().version
+        return [
+            {"recommendations": [], "calculation_method": CALCULATION_METHOD, "rules_version": version}
+            for _ in range(n_txns)
+        ]
+
+    scored = reward_matrix(txns, cards)
+    best = top_k_cards(scored["reward"], top_k)
+    rules = scored["rules"]
+    programs = [rules.program(card.display_name) for card in cards]
+
+    # Gather only the selected cells and hand them to Python as plain lists,
+    # so rule lookup and string formatting are the only per-row work left.
+    def pick(name):
+        return np.take_along_axis(scored[name], best, axis=1).tolist()
+
+    sel_reward = pick("reward")
+    sel_uncapped = pick("uncapped")
+    sel_capped = pick("capped")
+    categories = scored["categories"]
+    cat_idx = scored["category_index"].tolist()
+    mccs = scored["mccs"].tolist() if scored["mccs"] is not None else [None] * n_txns
+    amounts = scored["amounts"].tolist()
+    currencies = scored["currencies"].tolist() if scored["currencies"] is not None else [0] * n_txns
+    original_amounts = scored["original_amounts"]
+    fx = scored["fx"]
+    best = best.tolist()
+
+    results = []
+    for i in range(n_txns):
+        category = categories[i]
+        amount = amounts[i]
+        c = cat_idx[i]
+        mcc = mccs[i] if mccs[i] != -1 else None
+        overseas = currencies[i] != 0
+        fx_detail, fx_trace = (
+            _fx(fx, fx.codes[currencies[i]], float(original_amounts[i]), amount) if overseas else (None, "")
+        )
+        rewards_i = sel_reward[i]
+        uncapped_i = sel_uncapped[i]
+        capped_i = sel_capped[i]
+        recommendations = [
+            _recommendation(
+                cards[j],
+                category,
+                amount,
+                programs[j].lookup(c, mcc, cards[j].spend_this_month, overseas),
+                rules.mile_value,
+                uncapped_i[r],
+                rewards_i[r],
+                capped_i[r],
+                fx_trace,
+            )
+            for r, j in enumerate(best[i])
+        ]
+        result = {
+            "recommendations": recommendations,
+            "calculation_method": CALCULATION_METHOD,
+            "rules_version": rules.version,
+        }
+        if fx_detail is not None:
+            result["fx"] = fx_detail
+        results.append(result)
+    return results
@@ -0,0 +1,133 @@
+"""
+Local Stand-in Agent Server
+Serves /classify and /score from the stub agents so live mode can run offline
+
+Usage:
+    python -m agents_stub.server --port 8000
+    AURA_API_BASE=http://localhost:8000 streamlit run app.py
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .merchant_agent import classify_merchant
+from .scoring_engine import score_best_card
+
+
+def _classify(payload: dict) -> dict:
+    if not isinstance(payload.get("merchant"), str):
+        raise ValueError("'merchant' must be a string")
+    return classify_merchant(payload["merchant"], payload.get("location"))
+
+
+def _score(payload: dict) -> dict:
+    if not isinstance(payload.get("txn"), dict) or not isinstance(payload.get("cards"), list):
+        raise ValueError("'txn' must be an object and 'cards' a list")
+    return score_best_card(payload["txn"], payload["cards"])
+
+
+ROUTES = {
+    "/classify": _classify,
+    "/score": _score,
+}
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between calls.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # second write waits on the client's delayed ACK (~40 ms per call).
+    disable_nagle_algorithm = True
+    server_version = "AuraStubAgent/1.0"
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        handler = ROUTES.get(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if handler is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        latency = getattr(self.server, "latency", 0.0)
+        if latency:
+            time.sleep(latency)
+        try:
+            payload = json.loads(raw or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("request body must be a JSON object")
+            result = handler(payload)
+        except ValueError as exc:
+            self._send_json(400, {"error": str(exc)})
+            return
+        except Exception as exc:  # surface stub bugs as 500s, keep serving
+            self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000, verbose: bool = False,
+                latency: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Create (but don't start) a threaded stand-in agent server. `latency`
+    adds a fixed delay in seconds to every agent call to mimic a network hop.
+    """
+    server = ThreadingHTTPServer((host, port), AgentRequestHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.latency = latency
+    return server
+
+
+def serve_in_background(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start a server on a daemon thread and return it; port 0 picks a free
+    port (see `server.server_address`). Stop it with `server.shutdown()`.
+    """
+    server = make_server(host, port, latency=latency)
+    thread = threading.Thread(target=server.serve_forever, name="aura-stub-agent", daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the stub agents over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated network latency added to every agent call")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, verbose=args.verbose, latency=args.latency_ms / 1000)
+    print(f"Stub agents listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Transaction Store
+Persistent per-user transaction history in SQLite (WAL mode)
+
+`amount` is kept in the currency the purchase was made in; `base_amount`
+is the same spend in the wallet's base currency (the converted amount the
+caps were charged with) and is what the rollups, dashboard aggregates and
+insights sum.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .fx import FxError, get_fx_rates
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "aura.db"
+DEFAULT_USER = "demo"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id        INTEGER PRIMARY KEY,
+    user_id   TEXT    NOT NULL,
+    ts        TEXT    NOT NULL,
+    merchant  TEXT    NOT NULL,
+    amount    REAL    NOT NULL,
+    currency  TEXT    NOT NULL DEFAULT 'SGD',
+    base_amount REAL,
+    card      TEXT,
+    card_id   TEXT,
+    reward    REAL    NOT NULL DEFAULT 0,
+    category  TEXT,
+    mcc       INTEGER,
+    location  TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_txn_user_ts ON transactions (user_id, ts);
+-- (user_id, rowid): id-ordered resumable scans of one user's history.
+CREATE INDEX IF NOT EXISTS ix_txn_user ON transactions (user_id);
+CREATE INDEX IF NOT EXISTS ix_txn_user_card ON transactions (user_id, card, ts);
+CREATE INDEX IF NOT EXISTS ix_txn_user_category ON transactions (user_id, category, ts);
+-- Running totals per (user, month, card, category), maintained on insert.
+-- Card/category are stored as '' rather than NULL so the key stays unique.
+CREATE TABLE IF NOT EXISTS txn_rollups (
+    user_id   TEXT    NOT NULL,
+    month     TEXT    NOT NULL,
+    card      TEXT    NOT NULL,
+    category  TEXT    NOT NULL,
+    spend     REAL    NOT NULL,
+    reward    REAL    NOT NULL,
+    count     INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, card, category)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_ROLLUP = """
+INSERT INTO txn_rollups (user_id, month, card, category, spend, reward, count)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id, month, card, category) DO UPDATE SET
+    spend = spend + excluded.spend,
+    reward = reward + excluded.reward,
+    count = count + excluded.count
+"""
+
+_REBUILD_ROLLUPS = """
+INSERT INTO txn_rollups (user_id, month, card, category, spend, reward, count)
+SELECT user_id, substr(ts, 1, 7), COALESCE(card, ''), COALESCE(category, ''),
+       SUM(base_amount), SUM(reward), COUNT(*)
+FROM transactions
+GROUP BY user_id, substr(ts, 1, 7), COALESCE(card, ''), COALESCE(category, '')
+"""
+
+_COLUMNS = ("ts", "merchant", "amount", "currency", "card", "card_id", "reward", "category", "mcc", "location",
+            "base_amount")
+
+_INSERT = (
+    f"INSERT INTO transactions (user_id, {', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})"
+)
+
+
+def _base_rate(rates, currency) -> float:
+    """Base-currency value of one unit; 1 for a currency the rates file does not quote."""
+    try:
+        return rates.rate(currency)
+    except FxError:
+        return 1.0
+
+
+def base_amount(txn: dict, rates=None) -> float:
+    """
+    A transaction's spend in the base currency: its `base_amount` when set,
+    else its amount converted with `rates` (the current FX rates by default).
+    """
+    value = txn.get("base_amount")
+    if value is not None:
+        return float(value)
+    amount = float(txn.get("amount", 0) or 0)
+    return amount * _base_rate(rates or get_fx_rates(), txn.get("currency") or "SGD")
+
+
+def _to_row(user_id: str, txn: dict, rates) -> tuple:
+    location = txn.get("location")
+    return (
+        user_id,
+        txn.get("timestamp") or datetime.now().isoformat(),
+        txn.get("merchant", ""),
+        float(txn.get("amount", 0) or 0),
+        txn.get("currency") or "SGD",
+        txn.get("card_used"),
+        txn.get("card_id"),
+        float(txn.get("reward", txn.get("reward_earned", 0)) or 0),
+        txn.get("category"),
+        txn.get("mcc"),
+        json.dumps(location) if location else None,
+        base_amount(txn, rates),
+    )
+
+
+def _rollup_key(row: tuple) -> tuple:
+    """(user, month, card, category) for a row built by _to_row."""
+    return (row[0], row[1][:7], row[5] or "", row[8] or "")
+
+
+def _rollup_params(rows: list) -> list:
+    """Collapse a batch of rows into one rollup delta per key."""
+    deltas = {}
+    for row in rows:
+        key = _rollup_key(row)
+        spend, reward, count = deltas.get(key, (0.0, 0.0, 0))
+        deltas[key] = (spend + row[11], reward + row[7], count + 1)
+    return [key + delta for key, delta in deltas.items()]
+
+
+def _from_row(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "timestamp": row["ts"],
+        "merchant": row["merchant"],
+        "amount": row["amount"],
+        "currency": row["currency"],
+        "base_amount": row["base_amount"],
+        "card_used": row["card"],
+        "card_id": row["card_id"],
+        "reward": row["reward"],
+        "category": row["category"],
+        "mcc": row["mcc"],
+        "location": json.loads(row["location"]) if row["location"] else {},
+    }
+
+
+class TransactionStore:
+    """
+    Repository over the transactions table.
+
+    Connections are per thread (Streamlit runs each session's script on its
+    own thread); WAL lets readers proceed while a payment is being written.
+    Transactions use the same dict shape the pages already build, with
+    `card_used` and `reward`; a transaction without `base_amount` is
+    converted with the current FX rates.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or os.getenv("AURA_DB_PATH") or DEFAULT_DB_PATH)
+        self._local = threading.local()
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # Databases created before rollups or base_amount existed: migrate
+        # once. IMMEDIATE so two workers starting together cannot both do it.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(transactions)")}
+            if "base_amount" not in columns:
+                self._add_base_amount(conn)
+                conn.execute("DELETE FROM txn_rollups")
+            if conn.execute("SELECT 1 FROM txn_rollups LIMIT 1").fetchone() is None:
+                conn.execute(_REBUILD_ROLLUPS)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _add_base_amount(conn):
+        """
+        Add the base_amount column, converting existing rows with the
+        current FX rates (the rate of the day is not known for them).
+        """
+        conn.execute("ALTER TABLE transactions ADD COLUMN base_amount REAL")
+        rates = get_fx_rates()
+        currencies = [row[0] for row in conn.execute("SELECT DISTINCT currency FROM transactions")]
+        conn.executemany(
+            "UPDATE transactions SET base_amount = amount * ? WHERE currency = ?",
+            [(_base_rate(rates, currency), currency) for currency in currencies],
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
+
+    def add(self, txn: dict, user_id: str = DEFAULT_USER) -> int:
+        """Insert one transaction (and its rollup delta) and return its row id."""
+        conn = self._conn()
+        with conn:
+            return self.insert(conn, txn, user_id)
+
+    @staticmethod
+    def insert(conn: sqlite3.Connection, txn: dict, user_id: str = DEFAULT_USER) -> int:
+        """
+        Insert one transaction and its rollup delta on `conn` without
+        committing, so it can share a write transaction with other tables in
+        this database (see `ledger.CapLedger.record`).
+
+        Args:
+            conn: Open connection to this store's database, inside a transaction
+            txn: Transaction dict
+            user_id: Owner
+
+        Returns:
+            The new row id
+        """
+        row = _to_row(user_id, txn, get_fx_rates())
+        row_id = conn.execute(_INSERT, row).lastrowid
+        conn.execute(_UPSERT_ROLLUP, _rollup_params([row])[0])
+        return row_id
+
+    def add_many(self, txns, user_id: str = DEFAULT_USER, batch_size: int = 10_000) -> int:
+        """Insert an iterable of transactions in batched commits; returns the count."""
+        conn = self._conn()
+        rates = get_fx_rates()
+        total = 0
+        batch = []
+        for txn in txns:
+            batch.append(_to_row(user_id, txn, rates))
+            if len(batch) >= batch_size:
+                self._insert_batch(conn, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self._insert_batch(conn, batch)
+            total += len(batch)
+        return total
+
+    @staticmethod
+    def _insert_batch(conn, batch):
+        with conn:
+            conn.executemany(_INSERT, batch)
+            conn.executemany(_UPSERT_ROLLUP, _rollup_params(batch))
+
+    def recent(self, limit: int = 5, user_id: str = DEFAULT_USER) -> list:
+        """Newest transactions first."""
+        rows = self._conn().execute(
+            "SELECT * FROM transactions WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def frequent_merchants(self, limit: int = 20, user_id: str = DEFAULT_USER,
+                           window: int = 5000) -> list:
+        """
+        A user's most visited merchants among their last `window`
+        transactions: distinct (merchant, location) with a count, most
+        frequent (then most recent) first.
+        """
+        rows = self._conn().execute(
+            """
+            SELECT merchant, location, COUNT(*) AS n, MAX(id) AS last_id
+            FROM (SELECT * FROM transactions WHERE user_id = ? ORDER BY id DESC LIMIT ?)
+            GROUP BY merchant, location
+            ORDER BY n DESC, last_id DESC
+            LIMIT ?
+            """,
+            (user_id, window, limit),
+        ).fetchall()
+        return [
+            {
+                "merchant": row["merchant"],
+                "location": json.loads(row["location"]) if row["location"] else {},
+                "count": row["n"],
+            }
+            for row in rows
+        ]
+
+    def _rollup_query(self, select: str, month: str, user_id: str, group_by: str = None):
+        sql = f"SELECT {select} FROM txn_rollups WHERE user_id = ?"
+        params = [user_id]
+        if month:
+            sql += " AND month = ?"
+            params.append(month)
+        if group_by:
+            sql += f" GROUP BY {group_by}"
+        return self._conn().execute(sql, params)
+
+    def totals(self, month: str = None, user_id: str = DEFAULT_USER) -> dict:
+        """Spend, rewards and count for a month ('YYYY-MM') or all time."""
+        spend, rewards, count = self._rollup_query(
+            "COALESCE(SUM(spend), 0), COALESCE(SUM(reward), 0), COALESCE(SUM(count), 0)",
+            month, user_id,
+        ).fetchone()
+        return {"spend": spend, "rewards": rewards, "count": count}
+
+    def _grouped(self, column: str, month: str, user_id: str) -> dict:
+        rows = self._rollup_query(
+            f"{column}, SUM(spend), SUM(reward), SUM(count)", month, user_id, group_by=column
+        )
+        return {
+            key or None: {"spend": spend, "rewards": rewards, "count": count}
+            for key, spend, rewards, count in rows
+        }
+
+    def by_category(self, month: str = None, user_id: str = DEFAULT_USER) -> dict:
+        return self._grouped("category", month, user_id)
+
+    def by_card(self, month: str = None, user_id: str = DEFAULT_USER) -> dict:
+        return self._grouped("card", month, user_id)
+
+    def rollups(self, user_id: str = DEFAULT_USER) -> list:
+        """Every (month, card, category, spend, reward, count) rollup row for a user."""
+        return [
+            (month, card or None, category or None, spend, reward, count)
+            for month, card, category, spend, reward, count in self._conn().execute(
+                "SELECT month, card, category, spend, reward, count FROM txn_rollups WHERE user_id = ?",
+                (user_id,),
+            )
+        ]
+
+    def last_id(self, user_id: str = None, before: int = None) -> int:
+        """
+        Highest row id written by any process, for one user when `user_id`
+        is given, and below `before` when that is given; 0 if none. One
+        b-tree seek (the rowid, or the (user_id, rowid) index).
+        """
+        sql = "SELECT COALESCE(MAX(id), 0) FROM transactions"
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def count(self, user_id: str = DEFAULT_USER) -> int:
+        return self.totals(user_id=user_id)["count"]
+
+    def iter_transactions(self, user_id: str = DEFAULT_USER, since: str = None, chunk_size: int = 10_000):
+        """Stream a user's history oldest first without loading it all."""
+        sql = "SELECT * FROM transactions WHERE user_id = ?"
+        params = [user_id]
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        cur = self._conn().execute(sql + " ORDER BY ts, id", params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _from_row(row)
+
+    def iter_chunks(self, user_id: str = DEFAULT_USER, after_id: int = 0, since: str = None,
+                    chunk_size: int = 10_000):
+        """
+        Stream a user's history in row-id order as lists of at most
+        `chunk_size` transactions, starting after row `after_id`. The last id
+        of a chunk is a resume point for the next call.
+        """
+        sql = "SELECT * FROM transactions WHERE user_id = ? AND id > ?"
+        params = [user_id, after_id]
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        cur = self._conn().execute(sql + " ORDER BY id", params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [_from_row(row) for row in rows]
+
+    def user_counts(self, since: str = None) -> dict:
+        """Transactions per user from the rollups (by month, so `since` is month-granular)."""
+        sql = "SELECT user_id, SUM(count) FROM txn_rollups"
+        params = []
+        if since:
+            sql += " WHERE month >= ?"
+            params.append(since[:7])
+        return dict(self._conn().execute(sql + " GROUP BY user_id", params).fetchall())
+
+    # Column name in iter_frames -> SQL expression.
+    _FRAME_COLUMNS = {
+        "timestamp": "ts",
+        "month": "substr(ts, 1, 7)",
+        "merchant": "merchant",
+        "amount": "amount",
+        "base_amount": "base_amount",
+        "currency": "currency",
+        "card_used": "card",
+        "card_id": "card_id",
+        "reward": "reward",
+        "category": "category",
+        "mcc": "mcc",
+    }
+
+    def iter_frames(self, user_id: str = DEFAULT_USER, since: str = None, chunk_size: int = 50_000,
+                    columns=("timestamp", "merchant", "amount", "card_used", "reward", "category"),
+                    ordered: bool = True):
+        """
+        Stream a user's history as pandas DataFrames of at most `chunk_size`
+        rows. Ask only for the `columns` you need (see `_FRAME_COLUMNS`);
+        aggregations can pass `ordered=False` to skip sorting by time.
+        """
+        import pandas as pd
+
+        columns = list(columns)
+        select = ", ".join(self._FRAME_COLUMNS[c] for c in columns)
+        sql = f"SELECT {select} FROM transactions WHERE user_id = ?"
+        params = [user_id]
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if ordered:
+            sql += " ORDER BY ts, id"
+        cur = self._conn().cursor()
+        cur.row_factory = None
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    def users(self) -> list:
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT user_id FROM transactions")]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_transaction_store() -> TransactionStore:
+    """Process-wide store (AURA_DB_PATH or data/aura.db), created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TransactionStore()
+    return _store
@@ -3,36 +3,193 @@ Utility functions and main optimization logic
 Combines all agents to provide recommendations
 """
 
-from .merchant_agent import classify_merchant
-from .scoring_engine import score_best_card
+import asyncio
 
-def optimize_one(merchant: str, amount: float, currency: str, 
-                 location: dict, user_cards: list, mock_mode: bool = True) -> dict:
+from .agent_client import AgentUnavailable, get_agent_client
+from .cache import ResultCache
+from .instrumentation import INSTRUMENTATION
+from .merchant_agent import classify_merchant, classify_merchants, normalize_merchant
+from .card_rules import get_rules
+from .geo_index import cache_cell
+from .scoring_engine import score_batch, score_best_card
+
+# Shared across sessions. Classification depends only on the merchant and
+# where it is, never on the amount or the wallet, so it is the stage worth
+# caching; scoring is cheap and always runs against the current card state.
+CLASSIFICATION_CACHE = ResultCache(maxsize=4096, ttl=600)
+
+
+def classification_key(merchant: str, location: dict, mock_mode: bool = True) -> tuple:
+    """
+    Cache key for a merchant classification.
+
+    The area is kept verbatim because it is echoed in the evidence; the
+    coordinates are reduced to a `geo_index.cache_cell`, since branch
+    proximity only moves by a few metres within one.
+    """
+    if not location:
+        return normalize_merchant(merchant), None, None, mock_mode
+    return (
+        normalize_merchant(merchant),
+        location.get("area", "Unknown"),
+        cache_cell(location.get("lat"), location.get("lng")),
+        mock_mode,
+    )
+
+
+def _copy_classification(classification: dict) -> dict:
+    """Copy of a classification that callers may modify without touching the cache."""
+    return {**classification, "evidence": list(classification["evidence"])}
+
+
+def _cached_classification(key):
+    """Cached classification for `key` (a copy), or None on a miss or without a key."""
+    if key is None:
+        return None
+    cached = CLASSIFICATION_CACHE.get(key)
+    if cached is None:
+        INSTRUMENTATION.incr("cache.miss")
+        return None
+    INSTRUMENTATION.incr("cache.hit")
+    return _copy_classification(cached)
+
+
+def _per_txn(txn_id: str, merchant: str, classification: dict, scoring: dict) -> dict:
+    """One `per_txn` entry of the API contract."""
+    top = scoring["recommendations"][0] if scoring["recommendations"] else None
+    entry = {
+        "id": txn_id,
+        "merchant": merchant,
+        "predicted_mcc": classification["predicted_mcc"],
+        "predicted_category": classification["predicted_category"],
+        "best_card": top["card"] if top else "None",
+        "expected_reward": top["reward"] if top else 0,
+        "confidence": classification["confidence"],
+        "explain": {
+            "matched_rule": top["matched_rule"] if top else "",
+            "calc_trace": top["calc_trace"] if top else "",
+            "recommendations": scoring["recommendations"],
+            "evidence": classification["evidence"]
+        }
+    }
+    if "fx" in scoring:
+        entry["explain"]["fx"] = scoring["fx"]
+    return entry
+
+
+def _format_response(merchant: str, currency: str, classification: dict, scoring: dict) -> dict:
+    """Format classification and scoring output per API contract."""
+    entry = _per_txn("t1", merchant, classification, scoring)
+    return {
+        "summary": {
+            "total_expected_reward": entry["expected_reward"],
+            # Rewards are in the base currency whatever the purchase currency.
+            "unit": scoring["fx"]["base_currency"] if "fx" in scoring else currency
+        },
+        "per_txn": [entry]
+    }
+
+
+def _classify_uncached(merchant: str, location: dict, mock_mode: bool) -> tuple:
+    """
+    Classify with the stub agent, or the live agent with stub fallback.
+    Returns (classification, fell_back).
+    """
+    if not mock_mode:
+        try:
+            return get_agent_client().classify(merchant, location), False
+        except AgentUnavailable:
+            INSTRUMENTATION.incr("live.fallback.classify")
+            return classify_merchant(merchant, location), True
+    return classify_merchant(merchant, location), False
+
+
+def _classify(merchant: str, location: dict, mock_mode: bool, use_cache: bool = True) -> tuple:
+    """
+    Classify from CLASSIFICATION_CACHE, else with the stub agent, or the
+    live agent with stub fallback. Returns (classification, fell_back).
+    """
+    key = classification_key(merchant, location, mock_mode) if use_cache else None
+    classification = _cached_classification(key)
+    if classification is not None:
+        return classification, False
+
+    classification, fell_back = _classify_uncached(merchant, location, mock_mode)
+    # Fallback answers are not cached so live results resume as soon as
+    # the agent recovers.
+    if key is not None and not fell_back:
+        CLASSIFICATION_CACHE.put(key, _copy_classification(classification))
+    return classification, fell_back
+
+
+def warm_classifications(pairs, mock_mode: bool = True) -> int:
+    """
+    Fill CLASSIFICATION_CACHE for merchant/location pairs ahead of use.
+
+    Pairs already cached are left alone (their TTL is not extended), so a
+    repeated warm-up only classifies what has expired or is new. Checking
+    for them does not count as a cache hit or miss.
+
+    Args:
+        pairs: Iterable of (merchant, location) pairs
+        mock_mode: Pipeline the classifications are cached for
+
+    Returns:
+        Number of pairs classified
+    """
+    classified = 0
+    for merchant, location in pairs:
+        key = classification_key(merchant, location, mock_mode)
+        if key not in CLASSIFICATION_CACHE:
+            classification, fell_back = _classify_uncached(merchant, location, mock_mode)
+            if not fell_back:
+                CLASSIFICATION_CACHE.put(key, _copy_classification(classification))
+            classified += 1
+    return classified
+
+
+def _score(txn: dict, user_cards: list, mock_mode: bool) -> dict:
+    """
+    Score with the stub agent, or the live agent with stub fallback.
+    Returns (scoring, fell_back).
+    """
+    if not mock_mode:
+        try:
+            return get_agent_client().score(txn, user_cards), False
+        except AgentUnavailable:
+            INSTRUMENTATION.incr("live.fallback.score")
+            return score_best_card(txn, user_cards), True
+    return score_best_card(txn, user_cards), False
+
+
+def optimize_one(merchant: str, amount: float, currency: str,
+                 location: dict, user_cards: list, mock_mode: bool = True,
+                 use_cache: bool = True) -> dict:
     """
     Main optimization function that orchestrates all agents.
-    
-    TODO: When integrating real agents:
-    1. Import real agent modules from /agents/ folder
-    2. Replace mock calls with real API/function calls
-    3. Add error handling and fallbacks
-    4. Implement caching for frequent queries
-    
+
+    In live mode the agents are called over HTTP through the shared
+    AgentClient (AURA_API_BASE); if an agent is unreachable or its circuit
+    is open, the local stub agent answers instead.
+
     Args:
         merchant: Merchant name
         amount: Transaction amount
         currency: Currency code
         location: Location data dict
         user_cards: User's credit cards
-        mock_mode: If True, use mock data; if False, call real agents
-    
+        mock_mode: If True, use stub agents; if False, call real agents
+        use_cache: If True, reuse the merchant's classification from
+            CLASSIFICATION_CACHE; the transaction is always scored
+
     Returns:
         Complete recommendation result following API contract
     """
-    
-    if mock_mode:
-        # Use stub agents
-        classification = classify_merchant(merchant, location)
-        
+
+    with INSTRUMENTATION.span("optimize_one"):
+        with INSTRUMENTATION.span("classification"):
+            classification, _ = _classify(merchant, location, mock_mode, use_cache)
+
         txn = {
             "merchant": merchant,
             "amount": amount,
@@ -40,47 +197,288 @@ def optimize_one(merchant: str, amount: float, currency: str,
             "category": classification["predicted_category"],
             "mcc": classification["predicted_mcc"]
         }
-        
-        scoring = score_best_card(txn, user_cards)
-        
-        # Format response per API contract
-        return {
-            "summary": {
-                "total_expected_reward": scoring["recommendations"][0]["reward"] if scoring["recommendations"] else 0,
-                "unit": currency
-            },
-            "per_txn": [
-                {
-                    "id": "t1",
-                    "merchant": merchant,
-                    "predicted_mcc": classification["predicted_mcc"],
-                    "predicted_category": classification["predicted_category"],
-                    "best_card": scoring["recommendations"][0]["card"] if scoring["recommendations"] else "None",
-                    "expected_reward": scoring["recommendations"][0]["reward"] if scoring["recommendations"] else 0,
-                    "confidence": classification["confidence"],
-                    "explain": {
-                        "matched_rule": scoring["recommendations"][0]["matched_rule"] if scoring["recommendations"] else "",
-                        "calc_trace": scoring["recommendations"][0]["calc_trace"] if scoring["recommendations"] else "",
-                        "recommendations": scoring["recommendations"],
-                        "evidence": classification["evidence"]
+
+        with INSTRUMENTATION.span("scoring"):
+            scoring, _ = _score(txn, user_cards, mock_mode)
+
+        with INSTRUMENTATION.span("response"):
+            return _format_response(merchant, currency, classification, scoring)
+
+
+def chunked(iterable, size: int):
+    """Group an iterable into lists of at most `size` items, lazily."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def optimize_many(txns, user_cards: list, chunk_size: int = 1000, mock_mode: bool = True):
+    """
+    Recommend cards for a stream of transactions.
+
+    Transactions are consumed lazily in chunks of `chunk_size`; each chunk
+    goes through the batch classifier (one match per distinct merchant) and
+    the vectorized scorer, and results are yielded as they are ready, so
+    memory stays bounded by the chunk size however long the input is.
+    Every transaction is scored against the same wallet state, as
+    `optimize_one` would for each of them.
+
+    Args:
+        txns: Iterable of dicts with merchant, amount, currency, location
+            and optionally id
+        user_cards: User's credit cards
+        chunk_size: Transactions processed per batch
+        mock_mode: If True, use the batch stub agents; if False, send each
+            chunk concurrently through the live agents
+
+    Yields:
+        One `per_txn` contract entry per input transaction, in input order;
+        ids come from the transaction's "id" or default to t1, t2, ...
+
+    Raises:
+        RuntimeError: in live mode, when called from a running event loop
+            (await `optimize_many_async` there instead)
+    """
+    if not mock_mode:
+        yield from _optimize_many_live(txns, user_cards, chunk_size)
+        return
+
+    position = 0
+    for chunk in chunked(txns, max(1, chunk_size)):
+        ids = _chunk_ids(chunk, position)
+        position += len(chunk)
+
+        with INSTRUMENTATION.span("classification_batch"):
+            classified = classify_merchants(
+                [(txn["merchant"], txn.get("location") or {}) for txn in chunk]
+            )
+        categories = classified["predicted_category"].tolist()
+        mccs = classified["predicted_mcc"].tolist()
+        confidences = classified["confidence"].tolist()
+        evidence = classified["evidence"].tolist()
+
+        with INSTRUMENTATION.span("scoring_batch"):
+            scorings = score_batch(
+                [
+                    {
+                        "merchant": txn["merchant"],
+                        "amount": txn.get("amount", 0),
+                        "currency": txn.get("currency", "SGD"),
+                        "category": category,
+                        "mcc": mcc,
                     }
-                }
-            ]
-        }
+                    for txn, category, mcc in zip(chunk, categories, mccs)
+                ],
+                user_cards,
+            )
+
+        for i, txn in enumerate(chunk):
+            classification = {
+                "predicted_category": categories[i],
+                "predicted_mcc": mccs[i],
+                "confidence": confidences[i],
+                "evidence": evidence[i],
+            }
+            yield _per_txn(ids[i], txn["merchant"], classification, scorings[i])
+
+
+def _chunk_ids(chunk: list, position: int) -> list:
+    """Transaction ids for a chunk starting at `position` in the stream."""
+    return [txn.get("id") or f"t{position + i + 1}" for i, txn in enumerate(chunk)]
+
+
+def _optimize_many_live(txns, user_cards: list, chunk_size: int):
+    """Live `optimize_many`: every chunk runs on one event loop kept for the whole stream."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
     else:
-        # TODO: Call real agents via API
-        # Example:
-        # import requests
-        # API_BASE = os.getenv("AURA_API_BASE", "http://localhost:8000")
-        # 
-        # classification = requests.post(
-        #     f"{API_BASE}/classify",
-        #     json={"merchant": merchant, "location": location}
-        # ).json()
-        #
-        # scoring = requests.post(
-        #     f"{API_BASE}/score",
-        #     json={"txn": txn, "cards": user_cards}
-        # ).json()
-        
-        raise NotImplementedError("Live mode not yet implemented. Please use mock mode.")
\ No newline at end of file
+        raise RuntimeError(
+            "optimize_many(mock_mode=False) blocks, so it cannot run inside an event loop; "
+            "await optimize_many_async instead"
+        )
+
+    position = 0
+    with asyncio.Runner() as runner:
+        for chunk in chunked(txns, max(1, chunk_size)):
+            ids = _chunk_ids(chunk, position)
+            position += len(chunk)
+            results = runner.run(optimize_many_async(chunk, user_cards, mock_mode=False))
+            for txn_id, result in zip(ids, results):
+                yield {**result["per_txn"][0], "id": txn_id}
+
+
+async def _resolve_cards(user_cards):
+    """Card state may be given directly or as a (sync or async) loader."""
+    if callable(user_cards):
+        user_cards = user_cards()
+    if asyncio.iscoroutine(user_cards):
+        user_cards = await user_cards
+    return list(user_cards)
+
+
+def _candidate_categories(merchant: str, location: dict, limit: int) -> list:
+    """
+    Categories worth scoring before the live classifier answers: the local
+    keyword guess first, then the fallback category, then the rest.
+    """
+    guess = classify_merchant(merchant, location)["predicted_category"]
+    ordered = dict.fromkeys([guess, "General", *get_rules().categories])
+    return list(ordered)[:limit]
+
+
+async def _settle(task, fallback):
+    """Await an agent task, answering from the stub if the agent is unavailable."""
+    try:
+        return await task, False
+    except AgentUnavailable:
+        return fallback(), True
+
+
+async def optimize_one_async(merchant: str, amount: float, currency: str,
+                             location: dict, user_cards, mock_mode: bool = True,
+                             use_cache: bool = True, speculate: int = 2) -> dict:
+    """
+    Async `optimize_one` that overlaps the two live agent hops.
+
+    A classification cached in CLASSIFICATION_CACHE is used without calling
+    the classifier, leaving only the scoring hop. Otherwise card state is
+    resolved while the classifier runs, and scoring is started
+    speculatively for the `speculate` most plausible categories.
+    When classification returns, the matching speculative score is used and
+    the others are cancelled, so latency is roughly the slower of the two
+    hops rather than their sum. Cancelled calls already in flight finish in
+    the background and are discarded.
+
+    Args:
+        merchant, amount, currency, location: As for `optimize_one`
+        user_cards: Card list, or a sync/async callable returning it
+        mock_mode: If True, run the local stub pipeline
+        use_cache: If True, reuse and store classifications in
+            CLASSIFICATION_CACHE
+        speculate: Number of categories to score speculatively (0 disables)
+
+    Returns:
+        Complete recommendation result following API contract
+    """
+
+    if mock_mode:
+        cards = await _resolve_cards(user_cards)
+        return optimize_one(merchant, amount, currency, location, cards,
+                            mock_mode=True, use_cache=use_cache)
+
+    client = get_agent_client()
+    with INSTRUMENTATION.span("optimize_one_async"):
+        # A cached classification skips the classifier hop altogether.
+        key = classification_key(merchant, location, mock_mode) if use_cache else None
+        classification = _cached_classification(key)
+        classify_task = None
+        if classification is None:
+            classify_task = asyncio.ensure_future(client.aclassify(merchant, location))
+        classify_fallback = False
+        speculative = {}
+        try:
+            with INSTRUMENTATION.span("card_state"):
+                cards = await _resolve_cards(user_cards)
+
+            def txn_for(category, mcc=None):
+                return {
+                    "merchant": merchant,
+                    "amount": amount,
+                    "currency": currency,
+                    "category": category,
+                    "mcc": mcc,
+                }
+
+            if classify_task is not None:
+                if speculate > 0:
+                    for category in _candidate_categories(merchant, location, speculate):
+                        speculative[category] = asyncio.ensure_future(client.ascore(txn_for(category), cards))
+
+                with INSTRUMENTATION.span("classification"):
+                    classification, classify_fallback = await _settle(
+                        classify_task, lambda: classify_merchant(merchant, location)
+                    )
+
+            txn = txn_for(classification["predicted_category"], classification["predicted_mcc"])
+            winner = speculative.pop(txn["category"], None)
+            if winner is not None and get_rules().has_mcc_override(txn["mcc"]):
+                # Speculative scores were computed without the MCC, which
+                # changes the rule for at least one card here.
+                winner.cancel()
+                winner = None
+            if winner is not None:
+                INSTRUMENTATION.incr("speculation.hit")
+            else:
+                if classify_task is not None:
+                    INSTRUMENTATION.incr("speculation.miss")
+                winner = asyncio.ensure_future(client.ascore(txn, cards))
+
+            with INSTRUMENTATION.span("scoring"):
+                scoring, score_fallback = await _settle(winner, lambda: score_best_card(txn, cards))
+        finally:
+            for task in [classify_task, *speculative.values()]:
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # mark losers' errors as retrieved
+
+        if classify_fallback:
+            INSTRUMENTATION.incr("live.fallback.classify")
+        if score_fallback:
+            INSTRUMENTATION.incr("live.fallback.score")
+
+        # Fallback answers are not cached so live results resume as soon as
+        # the agent recovers.
+        if key is not None and classify_task is not None and not classify_fallback:
+            CLASSIFICATION_CACHE.put(key, _copy_classification(classification))
+
+        with INSTRUMENTATION.span("response"):
+            return _format_response(merchant, currency, classification, scoring)
+
+
+async def optimize_many_async(txns, user_cards, mock_mode: bool = True,
+                              concurrency: int = 16, use_cache: bool = True,
+                              speculate: int = 2) -> list:
+    """
+    Run `optimize_one_async` for many transactions concurrently.
+
+    At most `concurrency` transactions are in flight at once. Card state is
+    resolved once and shared by every transaction.
+
+    Args:
+        txns: Iterable of dicts with merchant, amount, currency, location
+        user_cards: Card list, or a sync/async callable returning it
+        mock_mode: If True, run the local stub pipeline
+        concurrency: Maximum transactions in flight
+        use_cache: As for `optimize_one_async`
+        speculate: Categories scored speculatively per transaction
+
+    Returns:
+        Results in input order
+    """
+    cards = await _resolve_cards(user_cards)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(txn):
+        async with semaphore:
+            return await optimize_one_async(
+                txn["merchant"],
+                txn.get("amount", 0),
+                txn.get("currency", "SGD"),
+                txn.get("location") or {},
+                cards,
+                mock_mode=mock_mode,
+                use_cache=use_cache,
+                speculate=speculate,
+            )
+
+    return await asyncio.gather(*(run(txn) for txn in txns))
@@ -0,0 +1,137 @@
+"""
+Classification Warm-up
+Precompute merchant classifications for likely purchases in the background
+
+At app start, when the mode toggle switches pipeline, and after every
+confirmed payment, the merchants the user visits most (with the location
+they visit them at) and the sidebar quick examples are classified on a
+daemon thread into CLASSIFICATION_CACHE. The pass after a payment picks up
+newly frequent merchants and re-classifies entries whose TTL ran out since
+the last one; entries still cached are skipped. Classification does not
+depend on the amount or the wallet, so one entry per merchant and place
+serves every later purchase there: the Streamlit script thread only
+scores, which is cheap. The first pass also loads the model and reference
+indexes off the script thread.
+"""
+
+import threading
+
+from .instrumentation import INSTRUMENTATION
+from .store import DEFAULT_USER, get_transaction_store
+from .utils import classification_key, warm_classifications
+
+# Merchant/location pairs taken from the user's history per warm-up.
+TOP_N = 20
+
+# Location the Transactions page reports for "Use current location".
+CURRENT_LOCATION = {"city": "Singapore", "area": "Orchard", "lat": 1.3048, "lng": 103.8318}
+
+# Sidebar quick examples, with the exact inputs the form submits for them.
+QUICK_EXAMPLES = [
+    {"name": "Din Tai Fung", "amount": 58.20, "currency": "SGD",
+     "location": {"city": "Singapore", "area": "Orchard"}},
+    {"name": "Starbucks", "amount": 12.50, "currency": "SGD",
+     "location": {"city": "Singapore", "area": "CBD"}},
+    {"name": "FairPrice", "amount": 145.30, "currency": "SGD",
+     "location": {"city": "Singapore", "area": "Tampines"}},
+    {"name": "Grab", "amount": 23.40, "currency": "SGD", "location": CURRENT_LOCATION},
+]
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def warm_queries(user_id: str = DEFAULT_USER, top_n: int = TOP_N, store=None,
+                 mock_mode: bool = True) -> list:
+    """
+    Merchants worth classifying ahead of time: the user's `top_n` most
+    visited (merchant, location) pairs, then the quick examples, one per
+    classification cache key.
+
+    Args:
+        user_id: Whose history to read
+        top_n: Number of history pairs to include
+        store: TransactionStore to read (process-wide store by default)
+        mock_mode: Pipeline the cache keys are computed for
+
+    Returns:
+        List of (merchant, location) pairs
+    """
+    store = store or get_transaction_store()
+    pairs = [
+        (p["merchant"], p["location"])
+        for p in store.frequent_merchants(top_n, user_id=user_id)
+    ] if top_n > 0 else []
+    pairs += [(ex["name"], ex["location"]) for ex in QUICK_EXAMPLES]
+
+    seen = set()
+    queries = []
+    for merchant, location in pairs:
+        key = classification_key(merchant, location, mock_mode)
+        if key not in seen:
+            seen.add(key)
+            queries.append((merchant, location))
+    return queries
+
+
+def warm_cache(user_id: str = DEFAULT_USER, mock_mode: bool = True, top_n: int = TOP_N,
+               store=None) -> int:
+    """
+    Classify `warm_queries` into CLASSIFICATION_CACHE synchronously.
+
+    Args:
+        user_id: Whose history to read
+        mock_mode: Pipeline the classifications are cached for
+        top_n: Number of history pairs to include
+        store: TransactionStore to read (process-wide store by default)
+
+    Returns:
+        Number of pairs classified (already cached ones are skipped)
+    """
+    queries = warm_queries(user_id, top_n, store, mock_mode)
+    with INSTRUMENTATION.span("warmup"):
+        classified = warm_classifications(queries, mock_mode)
+    INSTRUMENTATION.incr("warmup.queries", classified)
+    return classified
+
+
+def _run(signature, top_n):
+    try:
+        warm_cache(*signature, top_n)
+    except Exception:
+        # Warm-up is best effort; the script thread computes on demand.
+        INSTRUMENTATION.incr("warmup.error")
+    finally:
+        with _running_lock:
+            _running.discard(signature)
+
+
+def start_warmup(user_id: str = DEFAULT_USER, mock_mode: bool = True, top_n: int = TOP_N):
+    """
+    Warm the classification cache on a daemon thread and return at once.
+
+    A warm-up already running for the same user and mode is not started
+    twice.
+
+    Args:
+        user_id: Whose history to read
+        mock_mode: Pipeline the classifications are cached for
+        top_n: Number of history pairs to include
+
+    Returns:
+        The started thread, or None if an identical warm-up is running
+    """
+    signature = (user_id, mock_mode)
+    with _running_lock:
+        if signature in _running:
+            return None
+        _running.add(signature)
+
+    thread = threading.Thread(
+        target=_run,
+        args=(signature, top_n),
+        name="aura-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
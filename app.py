@@ -3,11 +3,16 @@ AURA: Adaptive User Rewards Agent
 Main Streamlit App Entry Point
 """
 
-import json
-from pathlib import Path
-
 import streamlit as st
 
+from agents_stub.agent_client import CircuitBreaker, get_agent_client
+from agents_stub.instrumentation import INSTRUMENTATION, bucket_labels
+from agents_stub.aggregates import get_aggregates
+from agents_stub.archive import open_transactions
+from agents_stub.reference import DATA_DIR, load_cards
+from agents_stub.store import DEFAULT_USER
+from agents_stub.warmup import start_warmup
+
 
 st.set_page_config(
     page_title="AURA Wallet",
@@ -20,25 +25,24 @@ st.set_page_config(
 
 if "mock_mode" not in st.session_state:
     st.session_state.mock_mode = True
-if "transaction_history" not in st.session_state:
-    st.session_state.transaction_history = []
+if "user_id" not in st.session_state:
+    st.session_state.user_id = DEFAULT_USER
 if "user_cards" not in st.session_state:
     st.session_state.user_cards = []
 if "selected_card" not in st.session_state:
     st.session_state.selected_card = None
 
 
-@st.cache_data
-def load_mock_data():
-    data_path = Path("data")
-
-    with open(data_path / "mock_user_cards.json", "r", encoding="utf-8") as f:
-        cards = json.load(f)
+@st.cache_resource
+def load_transaction_archive():
+    # Parsed from JSON once, then memory-mapped; shared by every session.
+    return open_transactions(DATA_DIR / "mock_transactions.json")
 
-    with open(data_path / "mock_transactions.json", "r", encoding="utf-8") as f:
-        transactions = json.load(f)
 
-    return cards, transactions
+def load_mock_data():
+    # Paths are relative to the package, not the working directory; with
+    # AURA_FAST_START=1 the cards come from the reference snapshot.
+    return load_cards(), load_transaction_archive()
 
 
 if not st.session_state.user_cards:
@@ -60,28 +64,68 @@ with st.sidebar:
     if st.session_state.mock_mode:
         st.info("Using mock data")
     else:
-        st.warning("Live mode (agents not connected)")
+        client = get_agent_client()
+        if client.breaker.state == CircuitBreaker.CLOSED:
+            st.info(f"Live mode via {client.base_url}")
+        else:
+            st.warning("Live mode (agents unreachable, using local stubs)")
+
+    with st.expander("Pipeline latency"):
+        snapshot = INSTRUMENTATION.snapshot()
+        if not snapshot["stages"]:
+            st.caption("No recommendations timed yet")
+
+        import pandas as pd
+
+        labels = bucket_labels()
+        for stage, stats in snapshot["stages"].items():
+            st.caption(
+                f"**{stage}** · n={stats['count']} · "
+                f"p50 {stats['p50_ms']:.3f} ms · p95 {stats['p95_ms']:.3f} ms"
+            )
+            filled = [i for i, n in enumerate(stats["buckets"]) if n]
+            lo, hi = filled[0], filled[-1] + 1
+            st.bar_chart(
+                pd.DataFrame({
+                    "latency": pd.Categorical(labels[lo:hi], categories=labels[lo:hi], ordered=True),
+                    "calls": stats["buckets"][lo:hi],
+                }),
+                x="latency",
+                y="calls",
+                height=140,
+            )
+
+        if snapshot["counters"]:
+            st.json(snapshot["counters"], expanded=False)
 
     st.divider()
     st.caption("Use the navigation to explore other pages")
 
 
+if st.session_state.get("warmup_mode") != st.session_state.mock_mode:
+    # Classify the user's usual merchants and the quick examples in the
+    # background, again whenever the mode toggle changes the pipeline.
+    start_warmup(st.session_state.user_id, st.session_state.mock_mode)
+    st.session_state.warmup_mode = st.session_state.mock_mode
+
+
 st.title("🎯 AURA Wallet")
 st.subheader("Adaptive User Rewards Agent")
 
 col1, col2, col3 = st.columns(3)
 
+totals = get_aggregates(st.session_state.user_id).totals()
+
 with col1:
     st.metric("Active Cards", len(st.session_state.user_cards), help="Cards in your wallet")
 
 with col2:
-    total_rewards = sum(t.get("reward", 0) for t in st.session_state.transaction_history)
-    st.metric("Total Rewards", f"${total_rewards:.2f}", help="Cashback earned to date")
+    st.metric("Total Rewards", f"${totals['rewards']:.2f}", help="Cashback earned to date")
 
 with col3:
     st.metric(
         "Transactions",
-        len(st.session_state.transaction_history),
+        totals["count"],
         help="Optimized transactions processed",
     )
 
@@ -0,0 +1,272 @@
+"""
+Recommendation Pipeline Benchmarks
+Throughput, latency percentiles and peak memory per stage, saved as JSON
+
+Usage:
+    python -m benchmarks.run --txns 10,1000,100000 --cards 5,50,500 --out bench.json
+    python -m benchmarks.run --txns 1000 --compare bench.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas  # noqa: F401  (imported lazily by the batch stages; keep it out of their timings)
+
+from agents_stub.merchant_agent import classify_merchant, classify_merchants
+from agents_stub.scoring_engine import score_batch, score_best_card
+from agents_stub.utils import CLASSIFICATION_CACHE, chunked, optimize_many, optimize_one
+
+from .workloads import make_cards, make_transactions
+
+DEFAULT_TXNS = [10, 1_000, 100_000]
+DEFAULT_CARDS = [5, 50, 500]
+
+
+# Each stage is (mode, setup, run). "call" stages are timed per transaction;
+# "batch" stages are timed per chunk. `setup` runs once per workload before
+# timing starts.
+def _classify_one(txn, cards):
+    classify_merchant(txn["merchant"], txn["location"])
+
+
+def _classify_batch(chunk, cards):
+    classify_merchants([(t["merchant"], t["location"]) for t in chunk])
+
+
+def _score_one(txn, cards):
+    score_best_card(txn, cards)
+
+
+def _score_batch(chunk, cards):
+    score_batch(chunk, cards, max_cards=None)
+
+
+def _optimize_one(txn, cards):
+    optimize_one(txn["merchant"], txn["amount"], txn["currency"], txn["location"], cards)
+
+
+def _optimize_one_uncached(txn, cards):
+    optimize_one(txn["merchant"], txn["amount"], txn["currency"], txn["location"], cards,
+                 use_cache=False)
+
+
+def _optimize_many(chunk, cards):
+    for _ in optimize_many(chunk, cards, chunk_size=len(chunk)):
+        pass
+
+
+STAGES = {
+    "classify_merchant": ("call", None, _classify_one),
+    "classify_merchants": ("batch", None, _classify_batch),
+    "score_best_card": ("call", None, _score_one),
+    "score_batch": ("batch", None, _score_batch),
+    "optimize_one": ("call", CLASSIFICATION_CACHE.invalidate, _optimize_one),
+    "optimize_one_uncached": ("call", None, _optimize_one_uncached),
+    "optimize_many": ("batch", None, _optimize_many),
+}
+
+
+def _percentiles(samples_ns: list) -> dict:
+    if not samples_ns:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(samples_ns, dtype=np.float64) / 1e6, [50, 95, 99])
+    return {"p50_ms": round(p50, 6), "p95_ms": round(p95, 6), "p99_ms": round(p99, 6)}
+
+
+def _units(mode: str, n_txns: int, args):
+    """Stream of work units for one pass: single transactions or chunks."""
+    options = {"seed": args.seed, "foreign_share": args.foreign_share}
+    if mode == "call":
+        return make_transactions(min(n_txns, args.max_calls), **options)
+    return chunked(make_transactions(n_txns, **options), args.chunk_size)
+
+
+def _timed_pass(run, setup, mode, n_txns, cards, args):
+    if setup:
+        setup()
+    samples = []
+    items = 0
+    clock = time.perf_counter_ns
+    gc.collect()
+    started = clock()
+    for unit in _units(mode, n_txns, args):
+        t0 = clock()
+        run(unit, cards)
+        samples.append(clock() - t0)
+        items += len(unit) if mode == "batch" else 1
+    wall = (clock() - started) / 1e9
+    busy = sum(samples) / 1e9
+    return items, wall, busy, samples
+
+
+def _memory_pass(run, setup, mode, n_txns, cards, args) -> int:
+    """Peak traced allocation for one pass over a bounded sample, in KiB."""
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for unit in _units(mode, min(n_txns, args.memory_sample), args):
+            run(unit, cards)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def bench_stage(name: str, n_txns: int, n_cards: int, args) -> dict:
+    mode, setup, run = STAGES[name]
+    cards = make_cards(n_cards, seed=args.seed)
+
+    items, wall, busy, samples = _timed_pass(run, setup, mode, n_txns, cards, args)
+    result = {
+        "stage": name,
+        "mode": mode,
+        "txns": n_txns,
+        "cards": n_cards,
+        "items": items,
+        "seconds": round(busy, 6),
+        "throughput_per_s": round(items / busy, 1) if busy else None,
+        "wall_seconds": round(wall, 6),
+        "latency_unit": "txn" if mode == "call" else f"chunk<={args.chunk_size}",
+        **_percentiles(samples),
+    }
+    if not args.no_memory:
+        result["peak_mem_kib"] = _memory_pass(run, setup, mode, n_txns, cards, args)
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _int_list(text: str) -> list:
+    return [int(float(v)) for v in text.split(",") if v.strip()]
+
+
+_HEADER = (
+    f"{'stage':<24}{'txns':>10}{'cards':>7}{'items/s':>14}"
+    f"{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'peak KiB':>10}"
+)
+
+
+def _print_row(r: dict, stream=sys.stdout):
+    print(
+        f"{r['stage']:<24}{r['txns']:>10}{r['cards']:>7}"
+        f"{r['throughput_per_s'] or 0:>14,.0f}"
+        f"{r['p50_ms'] or 0:>11.4f}{r['p95_ms'] or 0:>11.4f}{r['p99_ms'] or 0:>11.4f}"
+        f"{r.get('peak_mem_kib', ''):>10}",
+        file=stream,
+        flush=True,
+    )
+
+
+def compare(current: list, baseline_path: str, threshold: float, stream=sys.stdout) -> int:
+    """
+    Print throughput and p95 ratios against a saved run.
+
+    Returns the number of stages whose throughput dropped by more than
+    `threshold` (a fraction), so CI can fail on regressions.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = {(r["stage"], r["txns"], r["cards"]): r for r in baseline["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('commit', '?')})", file=stream)
+    for r in current:
+        old = base.get((r["stage"], r["txns"], r["cards"]))
+        if not old or not old.get("throughput_per_s") or not r.get("throughput_per_s"):
+            continue
+        speedup = r["throughput_per_s"] / old["throughput_per_s"]
+        p95 = (r["p95_ms"] / old["p95_ms"]) if old.get("p95_ms") else float("nan")
+        flag = ""
+        if speedup < 1 - threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(
+            f"{r['stage']:<24}{r['txns']:>10}{r['cards']:>7}"
+            f"  throughput x{speedup:.2f}  p95 x{p95:.2f}{flag}",
+            file=stream,
+        )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline")
+    parser.add_argument("--txns", type=_int_list, default=DEFAULT_TXNS,
+                        help="comma-separated transaction counts (up to 10M)")
+    parser.add_argument("--cards", type=_int_list, default=DEFAULT_CARDS,
+                        help="comma-separated wallet sizes")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="comma-separated stages to run")
+    parser.add_argument("--chunk-size", type=int, default=10_000,
+                        help="transactions per batch-stage call")
+    parser.add_argument("--max-calls", type=int, default=100_000,
+                        help="cap on timed calls for per-transaction stages")
+    parser.add_argument("--memory-sample", type=int, default=100_000,
+                        help="transactions replayed under tracemalloc")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak-memory pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--foreign-share", type=float, default=0.0,
+                        help="fraction of transactions in a foreign currency")
+    parser.add_argument("--out", help="write results JSON to this path")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="throughput drop treated as a regression")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+
+    print(_HEADER)
+    print("-" * len(_HEADER))
+    results = []
+    for n_txns in args.txns:
+        for n_cards in args.cards:
+            for stage in stages:
+                result = bench_stage(stage, n_txns, n_cards, args)
+                results.append(result)
+                _print_row(result)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
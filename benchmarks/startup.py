@@ -0,0 +1,218 @@
+"""
+Cold Start Benchmarks
+Import and first-use times of the app and its pages, each measured in fresh
+interpreters with and without the reference snapshot
+
+Usage (AURA_SNAPSHOT_KEY set for both the build and the timed runs):
+    python -m agents_stub.reference build
+    python -m benchmarks.startup --repeat 5 --out startup.json
+    python -m benchmarks.startup --compare startup.json
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .run import _git_commit
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = ["app.py", *sorted(str(p.relative_to(ROOT)) for p in (ROOT / "pages").glob("*.py"))]
+
+# Every reference object the app loads on first use.
+_LOAD_REFERENCE = """
+from agents_stub.card_rules import get_rules
+from agents_stub.geo_index import get_location_index
+from agents_stub.mcc_index import get_merchant_index
+from agents_stub.merchant_model import get_merchant_model
+from agents_stub.merchant_names import get_normalizer
+from agents_stub.reference import load_cards
+load_cards(); get_rules(); get_merchant_index(); get_location_index(); get_normalizer(); get_merchant_model()
+"""
+
+_FIRST_RECOMMENDATION = """
+from agents_stub.reference import load_cards
+from agents_stub.utils import optimize_one
+optimize_one("Din Tai Fung", 58.20, "SGD", {"city": "Singapore", "area": "Orchard"}, load_cards())
+"""
+
+_TIMED = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({code!r}, "<scenario>", "exec"))
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": len(sys.modules)}}))
+"""
+
+
+def script_imports(path) -> str:
+    """The top-level import statements of a script, as source."""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    return "\n".join(
+        ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def scenarios() -> dict:
+    """Scenario name -> code timed in a fresh interpreter."""
+    found = {f"import {script}": script_imports(ROOT / script) for script in SCRIPTS}
+    found["load reference data"] = _LOAD_REFERENCE
+    found["first recommendation"] = _FIRST_RECOMMENDATION
+    return found
+
+
+def _env(fast_start: bool) -> dict:
+    env = dict(os.environ)
+    env["AURA_FAST_START"] = "1" if fast_start else "0"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+
+def run_once(code: str, fast_start: bool) -> dict:
+    """Time `code` in a new interpreter; returns seconds and modules loaded."""
+    out = subprocess.run(
+        [sys.executable, "-c", _TIMED.format(code=code)],
+        capture_output=True, text=True, check=True, cwd=ROOT, env=_env(fast_start),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _import_times(code: str, fast_start: bool) -> list:
+    """(cumulative ms, module) for each top-level import `code` triggers (-X importtime)."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True, cwd=ROOT, env=_env(fast_start),
+    )
+    times = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports are not indented under another module.
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            times.append((int(cumulative) / 1000, name.strip()))
+    return times
+
+
+def heaviest_imports(code: str, fast_start: bool, limit: int = 5) -> list:
+    """
+    The `limit` top-level modules with the largest cumulative import time,
+    leaving out what the interpreter imports before running any code.
+    """
+    startup = {name for _, name in _import_times("pass", fast_start)}
+    top = sorted((t for t in _import_times(code, fast_start) if t[1] not in startup), reverse=True)
+    return [{"module": name, "ms": round(ms, 1)} for ms, name in top[:limit]]
+
+
+def bench_scenario(name: str, code: str, fast_start: bool, repeat: int) -> dict:
+    runs = [run_once(code, fast_start) for _ in range(repeat)]
+    ms = [r["seconds"] * 1000 for r in runs]
+    return {
+        "scenario": name,
+        "fast_start": fast_start,
+        "runs": repeat,
+        "median_ms": round(statistics.median(ms), 2),
+        "min_ms": round(min(ms), 2),
+        "max_ms": round(max(ms), 2),
+        "modules": runs[-1]["modules"],
+        "heaviest": heaviest_imports(code, fast_start),
+    }
+
+
+_HEADER = f"{'scenario':<36}{'fast':>6}{'median ms':>12}{'min ms':>10}{'max ms':>10}{'modules':>9}  heaviest"
+
+
+def _print_row(r: dict, stream=sys.stdout):
+    heaviest = ", ".join(f"{h['module']} {h['ms']:.0f}" for h in r["heaviest"][:3])
+    print(
+        f"{r['scenario']:<36}{'on' if r['fast_start'] else 'off':>6}"
+        f"{r['median_ms']:>12.1f}{r['min_ms']:>10.1f}{r['max_ms']:>10.1f}{r['modules']:>9}  {heaviest}",
+        file=stream,
+        flush=True,
+    )
+
+
+def compare(current: list, baseline_path: str, threshold: float, stream=sys.stdout) -> int:
+    """
+    Print median ratios against a saved run.
+
+    Returns the number of scenarios more than `threshold` (a fraction)
+    slower than the baseline.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    base = {(r["scenario"], r["fast_start"]): r for r in baseline["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('commit', '?')})", file=stream)
+    for r in current:
+        old = base.get((r["scenario"], r["fast_start"]))
+        if not old or not old.get("median_ms"):
+            continue
+        ratio = r["median_ms"] / old["median_ms"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{r['scenario']:<36}{'on' if r['fast_start'] else 'off':>6}  median x{ratio:.2f}{flag}",
+              file=stream)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import and load times")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per scenario")
+    parser.add_argument("--scenarios", default=None,
+                        help="comma-separated substrings selecting scenarios (default: all)")
+    parser.add_argument("--fast-start", choices=["off", "on", "both"], default="both",
+                        help="run with AURA_FAST_START off, on or both")
+    parser.add_argument("--out", help="write results JSON to this path")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="median slowdown treated as a regression")
+    args = parser.parse_args(argv)
+
+    selected = scenarios()
+    if args.scenarios:
+        wanted = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+        selected = {name: code for name, code in selected.items() if any(w in name for w in wanted)}
+        if not selected:
+            parser.error(f"no scenario matches {args.scenarios!r} (choose from {', '.join(scenarios())})")
+    modes = {"off": [False], "on": [True], "both": [False, True]}[args.fast_start]
+
+    print(_HEADER)
+    print("-" * len(_HEADER))
+    results = []
+    for name, code in selected.items():
+        for fast_start in modes:
+            result = bench_scenario(name, code, fast_start, max(1, args.repeat))
+            results.append(result)
+            _print_row(result)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
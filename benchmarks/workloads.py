@@ -0,0 +1,123 @@
+"""
+Synthetic Workloads
+Transactions and cards shaped like data/mock_transactions.json and
+data/mock_user_cards.json, generated deterministically at any scale
+"""
+
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from agents_stub.card_rules import get_rules
+
+# (brand, category, mcc) — brands hit the keyword rules; a share of
+# unknown merchants exercises the fallback path.
+BRANDS = [
+    ("Din Tai Fung", "Dining", 5812),
+    ("Starbucks", "Dining", 5814),
+    ("McDonald's", "Dining", 5814),
+    ("Toast Box Cafe", "Dining", 5812),
+    ("FairPrice", "Groceries", 5411),
+    ("Cold Storage", "Groceries", 5411),
+    ("Sheng Siong", "Groceries", 5411),
+    ("Grab", "Transport", 4121),
+    ("Gojek", "Transport", 4121),
+    ("ComfortDelGro Taxi", "Transport", 4121),
+    ("Uniqlo", "Shopping", 5651),
+    ("Takashimaya Store", "Shopping", 5311),
+    ("Popular Bookstore", "Shopping", 5942),
+    ("Golden Village", "General", 7832),
+    ("Singtel", "General", 4814),
+]
+
+AREAS = [
+    ("Orchard", 1.3048, 103.8318),
+    ("CBD", 1.2847, 103.8510),
+    ("Marina Bay", 1.2834, 103.8607),
+    ("Tampines", 1.3526, 103.9447),
+    ("Jurong East", 1.3331, 103.7422),
+    ("Woodlands", 1.4360, 103.7865),
+    ("Bishan", 1.3508, 103.8485),
+    ("Punggol", 1.4043, 103.9020),
+]
+
+# Foreign currencies for overseas purchases, with roughly how many units
+# one SGD buys, so converted amounts stay in the same range.
+FOREIGN_CURRENCIES = [("USD", 0.73), ("EUR", 0.71), ("JPY", 115.0), ("CNY", 5.4)]
+
+BANKS = ["Citibank", "DBS", "UOB", "OCBC", "Standard Chartered", "HSBC", "Maybank"]
+
+
+def merchant_pool(n_merchants: int = 2000, seed: int = 0) -> list:
+    """Distinct merchant/branch strings, mostly known brands plus noise."""
+    rng = random.Random(seed)
+    pool = []
+    for i in range(n_merchants):
+        area, lat, lng = AREAS[i % len(AREAS)]
+        if rng.random() < 0.85:
+            brand, category, mcc = BRANDS[i % len(BRANDS)]
+            name = f"{brand} {area}" if i >= len(BRANDS) else brand
+        else:
+            name, category, mcc = f"Merchant {i:05d} Pte Ltd", "General", 0
+        pool.append((name, category, mcc, area, lat, lng))
+    return pool
+
+
+def make_cards(n_cards: int, seed: int = 0) -> list:
+    """
+    A wallet of `n_cards` cards. The first five are the catalogue cards from
+    the rule file; the rest are synthetic products on the default rate.
+    """
+    rng = random.Random(seed)
+    known = get_rules().card_names
+    cards = []
+    for i in range(n_cards):
+        name = known[i] if i < len(known) else f"Synthetic Card {i:04d}"
+        cap = rng.choice([500, 1000, 1500, 2000])
+        cards.append({
+            "id": f"card_{i + 1}",
+            "bank": BANKS[i % len(BANKS)],
+            "display_name": name,
+            "last4": f"{rng.randrange(10000):04d}",
+            "image_url": "placeholder",
+            "monthly_cap": cap,
+            "used_this_month": round(rng.uniform(0, cap * 0.6), 2),
+            "benefits": [],
+        })
+    return cards
+
+
+def make_transactions(n_txns: int, seed: int = 0, n_merchants: int = 2000, foreign_share: float = 0.0):
+    """
+    Yield `n_txns` transaction dicts lazily, newest first, with a Zipf-like
+    merchant popularity so repeat purchases dominate as in real traffic.
+    A `foreign_share` of them are in a foreign currency.
+    """
+    rng = random.Random(seed)
+    pool = merchant_pool(n_merchants, seed)
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(pool))))
+    start = datetime(2025, 1, 31, 23, 0, 0)
+
+    produced = 0
+    while produced < n_txns:
+        batch = min(10_000, n_txns - produced)
+        for name, category, mcc, area, lat, lng in rng.choices(pool, cum_weights=cum_weights, k=batch):
+            produced += 1
+            amount = rng.lognormvariate(3.3, 0.9)
+            currency = "SGD"
+            # Only draw when asked, so SGD-only workloads stay reproducible.
+            if foreign_share and rng.random() < foreign_share:
+                currency, per_sgd = rng.choice(FOREIGN_CURRENCIES)
+                amount *= per_sgd
+            yield {
+                "id": f"txn_{produced:08d}",
+                "timestamp": (start - timedelta(minutes=17 * produced)).isoformat(),
+                "merchant": name,
+                "amount": round(amount, 2),
+                "currency": currency,
+                "location": {"city": "Singapore", "area": area, "lat": lat, "lng": lng},
+                "card_used": None,
+                "reward_earned": 0.0,
+                "category": category,
+                "mcc": mcc,
+            }
@@ -3,12 +3,17 @@ Home Dashboard Page
 Shows overview and quick stats
 """
 
-import pandas as pd
+from datetime import datetime
+
 import streamlit as st
 
+from agents_stub.aggregates import get_aggregates
+from agents_stub.ledger import get_cap_ledger
+from agents_stub.store import DEFAULT_USER
+
 
-if "transaction_history" not in st.session_state:
-    st.session_state.transaction_history = []
+if "user_id" not in st.session_state:
+    st.session_state.user_id = DEFAULT_USER
 if "user_cards" not in st.session_state:
     st.session_state.user_cards = []
 
@@ -19,14 +24,15 @@ st.title("🏠 Dashboard")
 st.subheader("Your Rewards Overview")
 
 
-if not st.session_state.transaction_history:
+aggregates = get_aggregates(st.session_state.user_id)
+recent = aggregates.recent_transactions(5)
+
+if not recent:
     st.info("No transactions yet. Start optimizing your rewards!")
 else:
     st.markdown("### Recent Transactions")
 
-    df = pd.DataFrame(st.session_state.transaction_history)
-
-    for txn in df.head(5).to_dict("records"):
+    for txn in recent:
         with st.container():
             col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
 
@@ -44,28 +50,29 @@ st.markdown("### This Month")
 
 col1, col2, col3 = st.columns(3)
 
-monthly_spend = sum(t.get("amount", 0) for t in st.session_state.transaction_history)
-monthly_rewards = sum(t.get("reward", 0) for t in st.session_state.transaction_history)
+month_totals = aggregates.totals(month=datetime.now().strftime("%Y-%m"))
 
 with col1:
-    st.metric("Total Spend", f"${monthly_spend:.2f}")
+    st.metric("Total Spend", f"${month_totals['spend']:.2f}")
 
 with col2:
-    st.metric("Rewards Earned", f"${monthly_rewards:.2f}")
+    st.metric("Rewards Earned", f"${month_totals['rewards']:.2f}")
 
 with col3:
-    reward_rate = (monthly_rewards / monthly_spend) * 100 if monthly_spend else 0
-    st.metric("Effective Rate", f"{reward_rate:.1f}%")
+    st.metric("Effective Rate", f"{month_totals['effective_rate']:.1f}%")
 
 
 st.markdown("### Insights")
 
-insights = [
-    "You are earning 2.3% average cashback",
-    "DBS Altitude has $200 remaining in the dining reward cap",
-    "Consider using UOB One for groceries (5% back)",
-    "You are 2,340 miles away from your next free flight",
-]
+# The insights engine pulls in pandas; importing it here lets the sections
+# above render first on a cold worker.
+from agents_stub.insights import headline_insights, insights_for_user  # noqa: E402
+
+# Cap usage comes from the ledger, not the copy in this session.
+wallet = get_cap_ledger().wallet(st.session_state.user_cards, st.session_state.user_id)
+insights = headline_insights(insights_for_user(wallet, user_id=st.session_state.user_id))
+if not insights:
+    insights = ["Insights appear once you confirm a few payments"]
 
 for insight in insights:
     st.info(insight)
@@ -3,12 +3,16 @@ Transaction Page - Core functionality
 Input transaction -> Get recommendations -> Use card
 """
 
-import time
 from datetime import datetime
 
 import streamlit as st
 
+from agents_stub.aggregates import record_payment
+from agents_stub.card_rules import get_rules
+from agents_stub.ledger import UnknownCard, get_cap_ledger
+from agents_stub.store import DEFAULT_USER
 from agents_stub.utils import optimize_one
+from agents_stub.warmup import CURRENT_LOCATION, QUICK_EXAMPLES, start_warmup
 
 
 st.set_page_config(page_title="AURA - Transactions", page_icon="🛍️", layout="wide")
@@ -29,6 +33,21 @@ if "latest_txn_data" not in st.session_state:
     st.session_state.latest_txn_data = None
 if "last_transaction_input" not in st.session_state:
     st.session_state.last_transaction_input = {}
+if "user_id" not in st.session_state:
+    st.session_state.user_id = DEFAULT_USER
+if "mock_mode" not in st.session_state:
+    st.session_state.mock_mode = True
+
+# Card usage is shared by every session and worker through the cap ledger.
+ledger = get_cap_ledger()
+wallet = ledger.wallet(st.session_state.get("user_cards") or [], st.session_state.user_id)
+if st.session_state.get("warmup_mode") != st.session_state.mock_mode:
+    # Classify likely merchants off the script thread (see agents_stub.warmup).
+    start_warmup(st.session_state.user_id, st.session_state.mock_mode)
+    st.session_state.warmup_mode = st.session_state.mock_mode
+
+prefill = st.session_state.get("prefill") or {}
+prefill_location = prefill.get("location") or {}
 
 
 with st.form("transaction_form"):
@@ -39,6 +58,7 @@ with st.form("transaction_form"):
     with col1:
         merchant = st.text_input(
             "Merchant Name",
+            value=prefill.get("name", ""),
             placeholder="e.g., Din Tai Fung, Starbucks",
             help="Enter the merchant or store name",
         )
@@ -46,22 +66,24 @@ with st.form("transaction_form"):
         amount = st.number_input(
             "Amount",
             min_value=0.01,
-            value=25.50,
+            value=float(prefill.get("amount", 25.50)),
             step=0.01,
             help="Transaction amount",
         )
 
     with col2:
+        currencies = ["SGD", "USD", "EUR", "JPY", "CNY"]
         currency = st.selectbox(
             "Currency",
-            ["SGD", "USD", "EUR", "JPY", "CNY"],
-            index=0,
+            currencies,
+            index=currencies.index(prefill.get("currency", "SGD")),
         )
 
         st.markdown("**Location**")
         location_mode = st.radio(
             "Location method",
             ["Use current location", "Enter manually"],
+            index=1 if prefill_location and prefill_location != CURRENT_LOCATION else 0,
             horizontal=True,
             label_visibility="collapsed",
         )
@@ -69,13 +91,13 @@ with st.form("transaction_form"):
     location_data = {}
     if location_mode == "Use current location":
         st.info("Using location: Orchard, Singapore")
-        location_data = {"city": "Singapore", "area": "Orchard", "lat": 1.3048, "lng": 103.8318}
+        location_data = dict(CURRENT_LOCATION)
     else:
         loc_col1, loc_col2 = st.columns(2)
         with loc_col1:
-            city = st.text_input("City", value="Singapore")
+            city = st.text_input("City", value=prefill_location.get("city", "Singapore"))
         with loc_col2:
-            area = st.text_input("Area", placeholder="e.g., Orchard")
+            area = st.text_input("Area", value=prefill_location.get("area", ""), placeholder="e.g., Orchard")
         location_data = {"city": city, "area": area}
 
     submitted = st.form_submit_button(
@@ -94,13 +116,12 @@ if submitted and merchant and amount > 0:
     }
 
     with st.spinner("Analyzing transaction..."):
-        time.sleep(1)
         result = optimize_one(
             merchant=merchant,
             amount=amount,
             currency=currency,
             location=location_data,
-            user_cards=st.session_state.user_cards,
+            user_cards=wallet,
             mock_mode=st.session_state.mock_mode,
         )
 
@@ -126,6 +147,15 @@ if st.session_state.show_recommendations and st.session_state.current_recommenda
         with col3:
             st.metric("Confidence", f"{txn_data['confidence'] * 100:.0f}%")
 
+        # Foreign-currency purchases are scored on their SGD value.
+        fx = txn_data["explain"].get("fx")
+        if fx:
+            st.caption(
+                f"{fx['currency']} {fx['amount']:,.2f} = {fx['base_currency']} {fx['base_amount']:,.2f} "
+                f"at {fx['rate']:g} (rates as of {fx['rates_as_of']}); overseas spend rules apply"
+            )
+        base_amount = fx["base_amount"] if fx else amount
+
         st.markdown("---")
 
         recommendations = txn_data["explain"].get("recommendations", [])
@@ -141,7 +171,7 @@ if st.session_state.show_recommendations and st.session_state.current_recommenda
 
                 with col2:
                     reward_value = rec["reward"]
-                    reward_pct = (reward_value / amount) * 100 if amount else 0
+                    reward_pct = (reward_value / base_amount) * 100 if base_amount else 0
                     st.metric("Reward Value", f"${reward_value:.2f}")
                     st.progress(min(reward_pct / 5, 1.0))
 
@@ -211,50 +241,58 @@ if st.session_state.show_apple_pay and st.session_state.selected_card:
                 )
 
                 if st.button("Confirm Payment", use_container_width=True, type="primary"):
-                    with st.spinner("Processing..."):
-                        time.sleep(1.5)
-
+                    fx = txn_context["explain"].get("fx")
+                    base_amount = fx["base_amount"] if fx else amount_value
+                    rules = get_rules()
+                    category = rules.categories[rules.category_index(txn_context["predicted_category"])]
+                    card_id = selected.get("card_id") or next(
+                        (card.get("id") for card in wallet if card["display_name"] == selected["card"]), None
+                    )
                     transaction = {
                         "timestamp": datetime.now().isoformat(),
                         "merchant": merchant_name,
                         "amount": amount_value,
                         "currency": currency_code,
+                        "base_amount": base_amount,
                         "card_used": selected["card"],
+                        "card_id": card_id,
                         "reward": selected["reward"],
                         "category": txn_context["predicted_category"],
+                        "mcc": txn_context["predicted_mcc"],
                         "location": location_value,
                     }
-                    st.session_state.transaction_history.append(transaction)
-
-                    card_id = selected.get("card_id")
-                    for card in st.session_state.user_cards:
-                        if card.get("id") == card_id or card.get("display_name") == selected["card"]:
-                            current_used = card.get("used_this_month", 0) or 0
-                            card["used_this_month"] = float(current_used) + selected["reward"]
-                            break
-
-                    st.balloons()
-                    st.success(f"Payment successful! Earned ${selected['reward']:.2f} in rewards")
-
-                    st.session_state.show_apple_pay = False
-                    st.session_state.show_recommendations = False
-                    st.session_state.selected_card = None
-
-                    if st.button("View Transaction History"):
-                        st.switch_page("pages/1_Home.py")
-
+                    try:
+                        # Counted against the card's caps and stored in one database
+                        # transaction; if another payment used up the cap meanwhile,
+                        # less than the quoted reward is credited.
+                        credit = record_payment(
+                            transaction,
+                            card_id,
+                            selected["reward"],
+                            category=category,
+                            sub_cap=rules.sub_cap(selected["card"], category),
+                            user_id=st.session_state.user_id,
+                            ledger=ledger,
+                        )
+                    except UnknownCard:
+                        st.error("This card is not in your wallet. Please generate recommendations again.")
+                    else:
+                        st.balloons()
+                        st.success(f"Payment successful! Earned ${credit['reward']:.2f} in rewards")
+                        # Re-warm from the updated history before cached entries expire.
+                        start_warmup(st.session_state.user_id, st.session_state.mock_mode)
+
+                        st.session_state.show_apple_pay = False
+                        st.session_state.show_recommendations = False
+                        st.session_state.selected_card = None
+
+                        if st.button("View Transaction History"):
+                            st.switch_page("pages/1_Home.py")
 
 with st.sidebar:
     st.markdown("### Quick Examples")
 
-    examples = [
-        {"name": "Din Tai Fung", "amount": 58.20, "location": "Orchard"},
-        {"name": "Starbucks", "amount": 12.50, "location": "CBD"},
-        {"name": "FairPrice", "amount": 145.30, "location": "Tampines"},
-        {"name": "Grab", "amount": 23.40, "location": "Current"},
-    ]
-
-    for ex in examples:
+    for ex in QUICK_EXAMPLES:
         if st.button(f"{ex['name']} (${ex['amount']})"):
             st.session_state.prefill = ex
             st.rerun()
@@ -5,6 +5,9 @@ Display user's credit cards and usage
 
 import streamlit as st
 
+from agents_stub.ledger import get_cap_ledger
+from agents_stub.store import DEFAULT_USER
+
 
 st.set_page_config(page_title="AURA - My Cards", page_icon="💳", layout="wide")
 
@@ -20,8 +23,14 @@ def _get_amount(card_dict, key) -> float:
         return 0.0
 
 
-if st.session_state.user_cards:
-    for card in st.session_state.user_cards:
+if "user_id" not in st.session_state:
+    st.session_state.user_id = DEFAULT_USER
+
+# Usage this month comes from the cap ledger, shared by every session.
+wallet = get_cap_ledger().wallet(st.session_state.user_cards, st.session_state.user_id)
+
+if wallet:
+    for card in wallet:
         with st.container():
             col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
 
@@ -85,11 +94,11 @@ st.markdown("### 📊 Wallet Summary")
 
 col1, col2, col3 = st.columns(3)
 
-total_limit = sum(_get_amount(card, "monthly_cap") for card in st.session_state.user_cards)
-total_used = sum(_get_amount(card, "used_this_month") for card in st.session_state.user_cards)
+total_limit = sum(_get_amount(card, "monthly_cap") for card in wallet)
+total_used = sum(_get_amount(card, "used_this_month") for card in wallet)
 
 with col1:
-    st.metric("Total Cards", len(st.session_state.user_cards))
+    st.metric("Total Cards", len(wallet))
 with col2:
     st.metric("Monthly Reward Cap", f"${total_limit:.2f}")
 with col3:
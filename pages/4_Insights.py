@@ -6,6 +6,10 @@ Show spending patterns and recommendations
 import pandas as pd
 import streamlit as st
 
+from agents_stub.insights import compute_insights, history_frame, insights_for_user
+from agents_stub.ledger import get_cap_ledger
+from agents_stub.store import DEFAULT_USER
+
 
 st.set_page_config(page_title="AURA - Insights", page_icon="📊", layout="wide")
 
@@ -13,26 +17,21 @@ st.title("📊 Insights & Analytics")
 st.subheader("Optimize your reward strategy")
 
 
-insights_data = {
-    "spending_by_category": {
-        "Dining": 450.30,
-        "Transport": 234.50,
-        "Groceries": 567.80,
-        "Shopping": 890.20,
-        "Entertainment": 123.40,
-    },
-    "rewards_by_card": {
-        "Citi Cash Back+": 45.30,
-        "DBS Altitude": 32.10,
-        "UOB One": 28.50,
-        "OCBC 365": 15.20,
-    },
-    "optimization_tips": [
-        {"tip": "Switch to UOB One for groceries", "potential": 23.40},
-        {"tip": "Use DBS Altitude for overseas spending", "potential": 45.00},
-        {"tip": "Maximize dining cap with Citi Cash Back+", "potential": 12.30},
-    ],
-}
+if "user_id" not in st.session_state:
+    st.session_state.user_id = DEFAULT_USER
+if "user_cards" not in st.session_state:
+    st.session_state.user_cards = []
+
+# Cap usage comes from the ledger, not the copy in this session.
+wallet = get_cap_ledger().wallet(st.session_state.user_cards, st.session_state.user_id)
+insights_data = insights_for_user(wallet, user_id=st.session_state.user_id)
+if not insights_data["summary"]["count"] and st.session_state.get("sample_transactions"):
+    st.caption("No payments recorded yet, showing the sample history")
+    insights_data = compute_insights(history_frame(st.session_state.sample_transactions), wallet)
+
+if not insights_data["summary"]["count"]:
+    st.info("No transactions yet. Insights appear once you confirm a payment.")
+    st.stop()
 
 
 st.markdown("### Spending by Category")
@@ -74,13 +73,16 @@ with col1:
 with col2:
     st.metric("Best Performer", best_card)
 with col3:
-    st.metric("Average Reward Rate", f"{(total_rewards / total_spending) * 100:.1f}%")
+    st.metric("Average Reward Rate", f"{insights_data['summary']['effective_rate']:.1f}%")
 
 
 st.markdown("### Optimization Opportunities")
 
 total_potential = sum(tip["potential"] for tip in insights_data["optimization_tips"])
-st.info(f"You could earn an additional ${total_potential:.2f} per month.")
+if insights_data["optimization_tips"]:
+    st.info(f"You could earn an additional ${total_potential:.2f} per month.")
+else:
+    st.success("You picked the best card for every payment.")
 
 for tip in insights_data["optimization_tips"]:
     with st.container():
@@ -91,17 +93,13 @@ for tip in insights_data["optimization_tips"]:
         with col2:
             st.metric("Potential", f"+${tip['potential']:.2f}", label_visibility="collapsed")
         with col3:
-            if st.button("Apply", key=f"apply_{tip['tip'][:10]}"):
+            if st.button("Apply", key=f"apply_{tip['category']}_{tip['card']}"):
                 st.success("Tip saved to preferences")
 
 
 st.markdown("### Monthly Targets")
 
-targets = [
-    {"name": "Citi Cash Back+", "target": "$600 dining", "progress": 75},
-    {"name": "DBS Altitude", "target": "5,000 miles", "progress": 60},
-    {"name": "UOB One", "target": "$500 spend", "progress": 90},
-]
+targets = insights_data["monthly_targets"]
 
 for target in targets:
     col1, col2, col3 = st.columns([2, 2, 1])
@@ -117,9 +115,12 @@ for target in targets:
 st.markdown("### Recommended Actions")
 
 actions = [
+    f"You are ${target['remaining']:.2f} away from the {target['name']} reward cap"
+    for target in targets
+    if 0 < target["progress"] < 100
+][:2]
+actions += [
     "Enable location services for better recommendations",
-    "You are $120 away from the UOB One bonus tier",
-    "Consider applying for HSBC Revolution (high dining rewards)",
     "Review your recurring subscriptions for optimization",
 ]
 
@@ -0,0 +1,19 @@
+"""Shared fixtures: an isolated database, the mock wallet, no snapshot."""
+
+import pytest
+
+from agents_stub.reference import load_cards
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    """Every test gets its own database and loads reference data from source."""
+    monkeypatch.setenv("AURA_DB_PATH", str(tmp_path / "aura.db"))
+    monkeypatch.delenv("AURA_FAST_START", raising=False)
+    monkeypatch.delenv("AURA_API_BASE", raising=False)
+
+
+@pytest.fixture
+def cards():
+    """A private copy of the mock wallet (data/mock_user_cards.json)."""
+    return load_cards()
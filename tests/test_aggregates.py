@@ -0,0 +1,96 @@
+"""Dashboard aggregates: incremental updates agree with a reload from the store."""
+
+import threading
+
+import pytest
+
+from agents_stub.aggregates import DashboardAggregates, get_aggregates, record_transaction
+from agents_stub.store import TransactionStore
+
+
+def _txn(i, card="UOB One", category="Dining", month="2025-01"):
+    return {
+        "timestamp": f"{month}-{1 + i % 28:02d}T12:00:00",
+        "merchant": f"Shop {i}",
+        "amount": 10.0 + i,
+        "currency": "SGD",
+        "card_used": card,
+        "reward": 0.5,
+        "category": category,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TransactionStore(tmp_path / "agg.db")
+    yield store
+    store.close()
+
+
+def _figures(agg):
+    return agg.totals(), agg.totals("2025-01"), agg.by_card(), agg.by_category("2025-02")
+
+
+def test_incremental_matches_reload(store):
+    store.add_many([_txn(i) for i in range(5)], user_id="alice")
+    agg = get_aggregates("alice", store)
+    for i in range(5, 9):
+        record_transaction(_txn(i, card="DBS Altitude", category="General", month="2025-02"), "alice", store)
+    assert get_aggregates("alice", store) is agg
+    assert _figures(agg) == _figures(DashboardAggregates.load(store, "alice"))
+    assert agg.totals()["count"] == 9
+    assert agg.recent_transactions(1)[0]["merchant"] == "Shop 8"
+
+
+def test_other_users_do_not_invalidate(store):
+    agg = get_aggregates("alice", store)
+    record_transaction(_txn(1), "bob", store)
+    record_transaction(_txn(2), "alice", store)
+    assert get_aggregates("alice", store) is agg
+    assert agg.totals()["count"] == 1
+
+
+def test_foreign_writer_forces_reload(store):
+    agg = get_aggregates("alice", store)
+    store.add(_txn(1), user_id="alice")  # another process, bypassing the cache
+    record_transaction(_txn(2), "alice", store)
+    fresh = get_aggregates("alice", store)
+    assert fresh is not agg
+    assert fresh.totals()["count"] == 2
+
+
+def test_last_id_per_user(store):
+    a1 = store.add(_txn(1), user_id="alice")
+    b1 = store.add(_txn(2), user_id="bob")
+    a2 = store.add(_txn(3), user_id="alice")
+    assert store.last_id() == a2
+    assert store.last_id("bob") == b1
+    assert store.last_id("alice", before=a2) == a1
+    assert store.last_id("carol") == 0
+
+
+def test_readers_return_copies_under_concurrent_writes(store):
+    agg = get_aggregates("alice", store)
+    recent = agg.recent_transactions()
+    totals = agg.by_card()
+    errors = []
+
+    def write():
+        for i in range(200):
+            agg.apply(_txn(i, card=f"Card {i}"))
+
+    def read():
+        try:
+            for _ in range(200):
+                agg.by_card()
+                agg.by_category("2025-01")
+        except RuntimeError as exc:  # dict changed size during iteration
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert recent == [] and totals == {}
@@ -0,0 +1,94 @@
+"""Columnar archive: round trip, atomic rewrites and the version 1 layout."""
+
+import json
+
+import numpy as np
+
+from agents_stub import archive as archive_module
+from agents_stub.archive import TransactionArchive, open_transactions, write_archive
+from agents_stub.models import TransactionArray
+
+TXNS = [
+    {"id": "t1", "timestamp": "2025-01-15T10:30:00", "merchant": "Din Tai Fung", "amount": 58.2,
+     "currency": "SGD", "location": {"city": "Singapore", "area": "Orchard", "lat": 1.3048, "lng": 103.8318},
+     "card_used": "Citi Cash Back+", "reward_earned": 4.66, "category": "Dining", "mcc": 5812},
+    {"id": "t2", "timestamp": "2025-01-16T08:00:00.250000", "merchant": "Grab", "amount": 12.0,
+     "currency": "USD", "location": {}, "card_used": None, "reward_earned": 0.0, "category": None,
+     "mcc": None},
+]
+
+
+def _generations(path):
+    return sorted(p.name for p in path.iterdir() if p.is_dir())
+
+
+def test_round_trip(tmp_path):
+    archive = TransactionArchive(write_archive(TXNS, tmp_path / "h.aura"))
+    assert list(archive.records()) == TXNS
+    frame = archive.to_frame(["amount", "category", "mcc"])
+    assert frame["category"].tolist()[0] == "Dining" and frame["mcc"].isna().tolist() == [False, True]
+
+
+def test_empty_archive(tmp_path):
+    archive = TransactionArchive(write_archive([], tmp_path / "e.aura"))
+    assert len(archive) == 0 and list(archive.records()) == []
+
+
+def test_open_reader_survives_rewrites(tmp_path):
+    path = tmp_path / "h.aura"
+    write_archive(TXNS, path)
+    reader = TransactionArchive(path)
+    write_archive(TXNS[:1], path)
+    write_archive([{**TXNS[0], "merchant": "Other"}] * 3, path)
+    assert list(reader.records()) == TXNS
+    assert len(TransactionArchive(path)) == 3
+    assert len(_generations(path)) == 2  # current and previous only
+
+
+def test_open_follows_pointer_when_generation_pruned(tmp_path, monkeypatch):
+    path = tmp_path / "h.aura"
+    write_archive(TXNS, path)
+    old = (path / "meta.json").read_text(encoding="utf-8")
+    load = np.load
+    rewrites = []
+
+    def racing_load(*args, **kwargs):
+        # Two rewrites land after the reader has read meta.json.
+        if not rewrites:
+            rewrites.append(write_archive(TXNS[:1], path))
+            rewrites.append(write_archive([{**TXNS[0], "merchant": "Other"}] * 3, path))
+            assert json.loads(old)["generation"] not in _generations(path)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(archive_module.np, "load", racing_load)
+    assert len(TransactionArchive(path)) == 3
+
+
+def test_version_1_layout_read_and_migrated(tmp_path):
+    json_path = tmp_path / "h.json"
+    json_path.write_text(json.dumps(TXNS))
+    path = write_archive(TXNS, tmp_path / "h.aura")
+    # Flatten into the version 1 layout: columns next to meta.json.
+    meta = json.loads((path / "meta.json").read_text())
+    generation = path / meta.pop("generation")
+    for column in generation.iterdir():
+        column.rename(path / column.name)
+    generation.rmdir()
+    meta["version"] = 1
+    (path / "meta.json").write_text(json.dumps(meta))
+
+    assert list(TransactionArchive(path).records()) == TXNS
+    migrated = open_transactions(json_path)
+    assert migrated.generation is not None
+    assert list(migrated.records()) == TXNS
+    assert not list(path.glob("*.npy"))
+    assert isinstance(migrated.column("amount"), np.memmap)
+
+
+def test_transaction_array_views_archive(tmp_path):
+    archive = TransactionArchive(write_archive(TXNS, tmp_path / "txns.aura"))
+    array = TransactionArray.of(archive)
+    assert np.shares_memory(array.column("amount"), archive.column("amount"))
+    assert [t.merchant for t in array] == ["Din Tai Fung", "Grab"]
+    assert array[1].timestamp == "2025-01-16T08:00:00.250000"
+    assert TransactionArray.of(array) is array
@@ -0,0 +1,74 @@
+"""Historical backfill: a run interrupted mid-shard resumes to the same output."""
+
+import json
+import queue
+
+import pytest
+
+from agents_stub import backfill
+from agents_stub.store import TransactionStore
+
+CHUNK = 2
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "history.db"
+    store = TransactionStore(path)
+    for user_id, n in (("alice", 5), ("bob", 3)):
+        store.add_many(
+            [{"timestamp": f"2025-01-{1 + i:02d}T12:00:00", "merchant": merchant, "amount": 10.0 + i,
+              "currency": "SGD", "card_used": "UOB One", "reward": 0.1, "category": "Dining"}
+             for i, merchant in enumerate(["Toast Box", "FairPrice", "Grab", "Starbucks", "Uniqlo"][:n])],
+            user_id=user_id,
+        )
+    store.close()
+    return path
+
+
+def _run(db, out_dir, cards):
+    out_dir.mkdir(exist_ok=True)
+    backfill._init_worker(str(db), str(out_dir), cards, None, CHUNK, queue.Queue())
+    try:
+        return backfill.run_shard(0, ["alice", "bob"])
+    finally:
+        backfill._worker["store"].close()
+        backfill._worker.clear()
+
+
+def _rows(out_dir):
+    with open(out_dir / "shard-0000.jsonl", "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_full_run(db, tmp_path, cards):
+    ckpt = _run(db, tmp_path / "out", cards)
+    assert ckpt["done"] and ckpt["rows"] == 8
+    rows = _rows(tmp_path / "out")
+    assert [r["user_id"] for r in rows] == ["alice"] * 5 + ["bob"] * 3
+    assert len({(r["user_id"], r["id"]) for r in rows}) == 8
+
+
+def test_resume_truncates_uncommitted_output(db, tmp_path, cards):
+    reference = tmp_path / "reference"
+    _run(db, reference, cards)
+    expected = _rows(reference)
+
+    # Crash after alice's first chunk was checkpointed and part of the
+    # second was written but not checkpointed.
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    lines = (reference / "shard-0000.jsonl").read_bytes().splitlines(keepends=True)
+    committed = b"".join(lines[:CHUNK])
+    (out_dir / "shard-0000.jsonl").write_bytes(committed + lines[CHUNK][:10])
+    backfill._write_json(out_dir / "shard-0000.ckpt.json", {
+        "shard": 0, "users": ["alice", "bob"], "next": 0, "last_id": expected[CHUNK - 1]["id"],
+        "offset": len(committed), "rows": CHUNK, "skipped": [], "done": False,
+    })
+
+    ckpt = _run(db, out_dir, cards)
+    assert ckpt["rows"] == 8
+    assert _rows(out_dir) == expected
+    # A finished shard is not run again.
+    assert _run(db, out_dir, cards)["rows"] == 8
+    assert _rows(out_dir) == expected
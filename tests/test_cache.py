@@ -0,0 +1,87 @@
+"""Result cache and the per-merchant classification cache in optimize_one."""
+
+import pytest
+
+from agents_stub.cache import ResultCache
+from agents_stub.utils import CLASSIFICATION_CACHE, classification_key, optimize_one
+
+ORCHARD = {"city": "Singapore", "area": "Orchard", "lat": 1.3048, "lng": 103.8318}
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    CLASSIFICATION_CACHE.invalidate()
+    yield
+    CLASSIFICATION_CACHE.invalidate()
+
+
+def test_result_cache_lru_and_ttl():
+    now = [0.0]
+    cache = ResultCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts b, the least recently used
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["evictions"], stats["expirations"]) == (1, 1, 1)
+    assert cache.invalidate(lambda key: key == "c") == 1
+
+
+def test_classification_key_ignores_amount_and_spelling():
+    assert classification_key("STARBUCKS ", ORCHARD) == classification_key("Starbucks", dict(ORCHARD))
+    nudged = {**ORCHARD, "lat": ORCHARD["lat"] + 0.00001}  # about a metre
+    assert classification_key("Starbucks", nudged) == classification_key("Starbucks", ORCHARD)
+    assert classification_key("Starbucks", {**ORCHARD, "area": "CBD"}) != classification_key("Starbucks", ORCHARD)
+    assert classification_key("Starbucks", ORCHARD, mock_mode=False) != classification_key("Starbucks", ORCHARD)
+    assert classification_key("Starbucks", None) == classification_key("starbucks", {})
+
+
+def test_cached_classification_rescored_per_amount(cards):
+    first = optimize_one("Starbucks", 12.50, "SGD", ORCHARD, cards)
+    second = optimize_one("Starbucks", 80.00, "SGD", ORCHARD, cards)
+    assert CLASSIFICATION_CACHE.stats()["hits"] == 1
+    assert second == optimize_one("Starbucks", 80.00, "SGD", ORCHARD, cards, use_cache=False)
+    assert first["summary"]["total_expected_reward"] != second["summary"]["total_expected_reward"]
+
+
+def test_contains_is_a_peek():
+    now = [0.0]
+    cache = ResultCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert "a" in cache and "c" not in cache
+    assert (cache.hits, cache.misses) == (0, 0)
+    # Peeking at "a" did not make it the most recently used.
+    cache.put("c", 3)
+    assert "a" not in cache and "b" in cache
+    now[0] = 11
+    assert "b" not in cache
+
+
+def test_cached_result_follows_wallet_and_merchant_spelling(cards):
+    optimize_one("Starbucks", 12.50, "SGD", ORCHARD, cards)
+    for card in cards:
+        card["used_this_month"] = card["monthly_cap"]
+    result = optimize_one("starbucks", 12.50, "SGD", ORCHARD, cards)
+    assert result["per_txn"][0]["merchant"] == "starbucks"
+    assert result["summary"]["total_expected_reward"] == 0
+
+
+def test_cache_hits_are_copies(cards):
+    first = optimize_one("Starbucks", 12.50, "SGD", ORCHARD, cards)
+    first["per_txn"][0]["explain"]["evidence"].append("tampered")
+    second = optimize_one("Starbucks", 12.50, "SGD", ORCHARD, cards)
+    assert "tampered" not in second["per_txn"][0]["explain"]["evidence"]
+    assert second == optimize_one("Starbucks", 12.50, "SGD", ORCHARD, cards, use_cache=False)
+
+
+def test_benchmark_workload_hits_cache():
+    from benchmarks.workloads import make_cards, make_transactions
+
+    wallet = make_cards(5, seed=0)
+    for txn in make_transactions(2000, seed=0):
+        optimize_one(txn["merchant"], txn["amount"], txn["currency"], txn["location"], wallet)
+    assert CLASSIFICATION_CACHE.stats()["hit_rate"] > 0.5
@@ -0,0 +1,114 @@
+"""Rule engine: the shipped rule file reproduces the original rate table."""
+
+import json
+import math
+
+import pytest
+
+from agents_stub.card_rules import RuleEngine, RuleError, compile_rules, get_rules
+
+# The category_rates table score_best_card used before the rule engine.
+BASELINE_RATES = {
+    "Dining": {
+        "Citi Cash Back+": (0.08, "sgd"),
+        "DBS Altitude": (3.0, "mile"),
+        "UOB One": (0.05, "sgd"),
+        "OCBC 365": (0.06, "sgd"),
+        "StanChart Unlimited": (0.015, "sgd"),
+    },
+    "Groceries": {
+        "Citi Cash Back+": (0.08, "sgd"),
+        "DBS Altitude": (1.2, "mile"),
+        "UOB One": (0.10, "sgd"),
+        "OCBC 365": (0.03, "sgd"),
+        "StanChart Unlimited": (0.015, "sgd"),
+    },
+    "Transport": {
+        "Citi Cash Back+": (0.08, "sgd"),
+        "DBS Altitude": (2.0, "mile"),
+        "UOB One": (0.03, "sgd"),
+        "OCBC 365": (0.03, "sgd"),
+        "StanChart Unlimited": (0.03, "sgd"),
+    },
+    "General": {
+        "Citi Cash Back+": (0.015, "sgd"),
+        "DBS Altitude": (1.2, "mile"),
+        "UOB One": (0.01, "sgd"),
+        "OCBC 365": (0.006, "sgd"),
+        "StanChart Unlimited": (0.015, "sgd"),
+    },
+}
+
+RULES = {
+    "version": "t1",
+    "categories": ["Dining", "General"],
+    "cards": {
+        "Card A": {
+            "unit": "sgd",
+            "rates": {"Dining": 0.05, "General": 0.01},
+            "mcc": {"4511": 0.07},
+            "overseas": 0.03,
+            "tiers": [{"min_spend": 500, "rates": {"Dining": 0.06}}],
+            "sub_caps": {"Dining": 25},
+        }
+    },
+}
+
+
+@pytest.mark.parametrize("category", sorted(BASELINE_RATES))
+def test_rule_file_matches_baseline_table(category):
+    rules = get_rules()
+    for card, (rate, unit) in BASELINE_RATES[category].items():
+        rule = rules.lookup(card, category)
+        assert (rule.rate, rule.unit) == (rate, unit), card
+
+
+def test_unknown_card_and_category_fall_back():
+    rules = get_rules()
+    assert rules.lookup("Some Other Card", "Dining")[:2] == (0.01, "sgd")
+    assert rules.lookup("UOB One", "Shopping") == rules.lookup("UOB One", "General")
+    assert rules.lookup("UOB One", None) == rules.lookup("UOB One", "General")
+
+
+def test_precedence_mcc_overseas_tier_base():
+    rules = compile_rules(RULES)
+    assert rules.lookup("Card A", "Dining").rate == 0.05
+    assert rules.lookup("Card A", "Dining", spend=499.99).rate == 0.05
+    assert rules.lookup("Card A", "Dining", spend=500).rate == 0.06
+    assert rules.lookup("Card A", "General", spend=500).rate == 0.01
+    assert rules.lookup("Card A", "Dining", spend=500, overseas=True).rate == 0.03
+    assert rules.lookup("Card A", "Dining", mcc="4511", spend=500, overseas=True).rate == 0.07
+    assert rules.sub_cap("Card A", "Dining") == 25
+    assert rules.sub_cap("Card A", "General") == math.inf
+
+
+@pytest.mark.parametrize("spec", [
+    {"categories": []},
+    {"categories": ["Dining"], "cards": {"X": {"rates": {"Travel": 0.1}}}},
+    {"categories": ["Dining"], "cards": {"X": {"rates": {"Dining": -1}}}},
+    {"categories": ["Dining"], "cards": {"X": {"unit": "points", "rates": {"Dining": 1}}}},
+    {"categories": ["Dining"], "cards": {"X": {"mcc": {"abc": 0.1}}}},
+])
+def test_malformed_rules_rejected(spec):
+    with pytest.raises(RuleError):
+        compile_rules(spec)
+
+
+def test_hot_reload_keeps_previous_rules_on_bad_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES))
+    now = [0.0]
+    engine = RuleEngine(path, check_interval=1.0, clock=lambda: now[0])
+    first = engine.rules
+    assert first.version.startswith("t1+")
+
+    path.write_text(json.dumps({**RULES, "version": "t2"}) + "\n")
+    assert engine.rules is first  # not re-checked inside the interval
+    now[0] = 1.0
+    assert engine.rules.version.startswith("t2+")
+
+    second = engine.rules
+    path.write_text("{not json")
+    now[0] = 2.0
+    assert engine.rules is second
+    assert engine.last_error
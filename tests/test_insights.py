@@ -0,0 +1,71 @@
+"""Insights from stored history, and their per-user memo."""
+
+import pytest
+
+from agents_stub.aggregates import record_transaction
+from agents_stub.archive import TransactionArchive, write_archive
+from agents_stub.insights import INSIGHTS_CACHE, compute_insights, history_frame, insights_for_user
+from agents_stub.models import TransactionArray
+from agents_stub.store import TransactionStore
+
+HISTORY = [
+    {"timestamp": "2025-01-03T09:00:00", "merchant": "Din Tai Fung", "amount": 60.0, "currency": "SGD",
+     "card_used": "StanChart Unlimited", "reward": 0.9, "category": "Dining"},
+    {"timestamp": "2025-01-09T18:00:00", "merchant": "FairPrice", "amount": 120.0, "currency": "SGD",
+     "card_used": "UOB One", "reward": 12.0, "category": "Groceries"},
+    {"timestamp": "2025-02-01T08:00:00", "merchant": "Grab", "amount": 20.0, "currency": "SGD",
+     "card_used": "Citi Cash Back+", "reward": 1.6, "category": "Transport"},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    INSIGHTS_CACHE.invalidate()
+    store = TransactionStore(tmp_path / "insights.db")
+    store.add_many(HISTORY, user_id="alice")
+    yield store
+    store.close()
+    INSIGHTS_CACHE.invalidate()
+
+
+def test_matches_in_memory_history(store, cards):
+    stored = insights_for_user(cards, "alice", store, use_cache=False)
+    assert stored == compute_insights(history_frame(HISTORY), cards)
+    assert stored["summary"]["count"] == 3
+    assert stored["spending_by_category"] == {"Groceries": 120.0, "Dining": 60.0, "Transport": 20.0}
+    tip = stored["optimization_tips"][0]
+    assert (tip["category"], tip["card"]) == ("Dining", "Citi Cash Back+")
+
+
+def test_history_frame_same_for_every_source(tmp_path, cards):
+    archive = TransactionArchive(write_archive(HISTORY, tmp_path / "history.aura"))
+    expected = history_frame(HISTORY)
+    assert list(expected["month"]) == ["2025-01", "2025-01", "2025-02"]
+    for source in (archive, TransactionArray.from_records(HISTORY)):
+        frame = history_frame(source)
+        assert frame.equals(expected)
+        assert compute_insights(frame, cards) == compute_insights(expected, cards)
+
+
+def test_memo_until_next_payment(store, cards, monkeypatch):
+    scans = []
+    original = store.iter_frames
+    monkeypatch.setattr(store, "iter_frames", lambda **kw: scans.append(kw) or original(**kw))
+
+    first = insights_for_user(cards, "alice", store)
+    first["summary"]["count"] = -1  # callers get copies
+    again = insights_for_user(cards, "alice", store)
+    assert len(scans) == 1
+    assert again["summary"]["count"] == 3
+
+    record_transaction({**HISTORY[0], "timestamp": "2025-02-02T12:00:00"}, "alice", store)
+    assert insights_for_user(cards, "alice", store)["summary"]["count"] == 4
+    assert len(scans) == 2
+
+    # Another user's payment or a different wallet state.
+    record_transaction(HISTORY[1], "bob", store)
+    insights_for_user(cards, "alice", store)
+    assert len(scans) == 2
+    cards[0]["monthly_cap"] += 100
+    insights_for_user(cards, "alice", store)
+    assert len(scans) == 3
@@ -0,0 +1,110 @@
+"""Spans, counters and memory tracing."""
+
+import asyncio
+import tracemalloc
+
+import pytest
+
+from agents_stub.instrumentation import InMemoryExporter, Instrumentation
+
+
+@pytest.fixture
+def traced():
+    exporter = InMemoryExporter()
+    inst = Instrumentation(exporters=[exporter], trace_memory=True)
+    yield inst, exporter
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _peaks(exporter) -> dict:
+    return {r["span"]: r["peak_mem_kib"] for r in exporter.records}
+
+
+def test_spans_and_counters():
+    inst = Instrumentation()
+    with inst.span("outer"):
+        with inst.span("inner"):
+            pass
+    inst.incr("hits")
+    inst.incr("hits", 2)
+    snap = inst.snapshot()
+    assert snap["stages"]["outer"]["count"] == snap["stages"]["inner"]["count"] == 1
+    assert snap["counters"] == {"hits": 3}
+
+    with pytest.raises(KeyError):
+        with inst.span("failing"):
+            raise KeyError("x")
+    assert inst.snapshot()["stages"]["failing"]["count"] == 1
+
+
+def test_nested_span_keeps_outer_peak(traced):
+    inst, exporter = traced
+    with inst.span("outer"):
+        block = bytearray(4 << 20)
+        del block
+        with inst.span("inner"):
+            small = bytearray(64 << 10)
+            del small
+    peaks = _peaks(exporter)
+    assert peaks["outer"] >= 4 << 10
+    assert 64 <= peaks["inner"] < 1 << 10
+
+
+def test_peak_is_relative_to_span_start(traced):
+    inst, exporter = traced
+    with inst.span("outer"):
+        held = bytearray(4 << 20)
+        with inst.span("inner"):
+            small = bytearray(64 << 10)
+            del small
+        del held
+    assert _peaks(exporter)["inner"] < 1 << 10
+
+
+def test_tracing_stops_after_outermost_span(traced):
+    inst, _ = traced
+    assert not tracemalloc.is_tracing()
+    with inst.span("outer"):
+        with inst.span("inner"):
+            assert tracemalloc.is_tracing()
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_elsewhere_is_left_running(traced):
+    inst, exporter = traced
+    tracemalloc.start()
+    with inst.span("outer"):
+        pass
+    assert tracemalloc.is_tracing()
+    assert "peak_mem_kib" in exporter.records[0]
+
+
+def test_interleaved_coroutines(traced):
+    inst, exporter = traced
+    a_inner_done, b_open = asyncio.Event(), asyncio.Event()
+
+    async def a():
+        with inst.span("a_outer"):
+            with inst.span("a_inner"):
+                block = bytearray(4 << 20)
+                del block
+                a_inner_done.set()
+                # b opens its span (resetting the shared peak) before a_inner closes.
+                await b_open.wait()
+
+    async def b():
+        await a_inner_done.wait()
+        with inst.span("b"):
+            b_open.set()
+            await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(a(), b())
+
+    asyncio.run(main())
+    peaks = _peaks(exporter)
+    assert peaks["a_inner"] >= 4 << 10
+    assert peaks["a_outer"] >= 4 << 10
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,144 @@
+"""Cap ledger: clamping to caps, and payments stored with their cap event or not at all."""
+
+import threading
+
+import pytest
+
+from agents_stub.aggregates import get_aggregates, record_payment
+from agents_stub.ledger import CapLedger, UnknownCard
+from agents_stub.store import TransactionStore
+
+MONTH = "2025-01"
+CARD = {"id": "c1", "display_name": "UOB One", "bank": "UOB", "monthly_cap": 10.0,
+        "used_this_month": 8.0}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "ledger.db"
+
+
+@pytest.fixture
+def ledger(db):
+    ledger = CapLedger(db)
+    ledger.wallet([CARD], month=MONTH)
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def store(db):
+    store = TransactionStore(db)
+    yield store
+    store.close()
+
+
+def _used(ledger):
+    return ledger.wallet([CARD], month=MONTH)[0]["used_this_month"]
+
+
+def test_reward_clamped_to_cap(ledger):
+    assert ledger.record("c1", 5.0, month=MONTH)["reward"] == pytest.approx(2.0)
+    assert ledger.record("c1", 5.0, month=MONTH)["reward"] == 0.0
+    assert _used(ledger) == pytest.approx(10.0)
+
+
+def test_reward_clamped_to_sub_cap(ledger):
+    first = ledger.record("c1", 1.5, category="Dining", sub_cap=1.0, month=MONTH)
+    assert first["reward"] == pytest.approx(1.0)
+    assert ledger.record("c1", 1.0, category="Dining", sub_cap=1.0, month=MONTH)["reward"] == 0.0
+    assert ledger.record("c1", 0.5, category="Groceries", sub_cap=1.0, month=MONTH)["reward"] == 0.5
+
+
+def test_concurrent_payments_never_exceed_cap(ledger):
+    credited = []
+
+    def pay():
+        credited.append(ledger.record("c1", 0.3, month=MONTH)["reward"])
+
+    threads = [threading.Thread(target=pay) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(credited) == pytest.approx(2.0)
+    assert CapLedger(ledger.path).wallet([CARD], month=MONTH)[0]["used_this_month"] == pytest.approx(10.0)
+
+
+def test_unknown_card(ledger):
+    with pytest.raises(UnknownCard):
+        ledger.record("nope", 1.0, month=MONTH)
+
+
+def _payment(reward=5.0):
+    return {"timestamp": f"{MONTH}-10T12:00:00", "merchant": "FairPrice", "amount": 100.0,
+            "currency": "SGD", "card_used": "UOB One", "card_id": "c1", "reward": reward,
+            "category": "Groceries"}
+
+
+def test_payment_stored_with_credited_reward(ledger, store):
+    agg = get_aggregates("demo", store)
+    credit = record_payment(_payment(), "c1", 5.0, store=store, ledger=ledger)
+    assert credit["reward"] == pytest.approx(2.0)
+    assert store.recent(1)[0]["id"] == credit["id"]
+    assert store.recent(1)[0]["reward"] == pytest.approx(2.0)
+    assert agg.totals()["rewards"] == pytest.approx(2.0)
+
+
+def test_failed_insert_leaves_no_cap_usage(ledger, store, monkeypatch):
+    def broken(conn, txn, user_id):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "insert", broken)
+    with pytest.raises(RuntimeError):
+        record_payment(_payment(), "c1", 5.0, store=store, ledger=ledger)
+    assert store.count() == 0
+    assert _used(ledger) == pytest.approx(8.0)
+    assert _used(CapLedger(ledger.path)) == pytest.approx(8.0)
+
+
+class _Gate:
+    """An account lock that reports when a payment starts waiting on it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        self.waiting.set()
+        self.lock.acquire()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def test_payments_on_different_cards_do_not_wait_on_each_other(ledger, store):
+    other = {**CARD, "id": "c2", "display_name": "DBS Altitude"}
+    ledger.wallet([CARD, other], month=MONTH)
+    get_aggregates("demo", store)
+    gate = ledger._accounts[("demo", "c1")].lock = _Gate()
+
+    with gate.lock:
+        # c1's payment blocks on its card; c2's still goes through.
+        blocked = threading.Thread(target=record_payment, args=(_payment(), "c1", 1.0),
+                                   kwargs={"store": store, "ledger": ledger})
+        blocked.start()
+        assert gate.waiting.wait(5)
+        credit = []
+        other = threading.Thread(target=lambda: credit.append(record_payment(
+            {**_payment(), "card_id": "c2", "card_used": "DBS Altitude"}, "c2", 1.0,
+            store=store, ledger=ledger)))
+        other.start()
+        other.join(5)
+        assert credit and blocked.is_alive()
+    blocked.join(5)
+    other.join(5)
+    assert store.recent(1)[0]["card_used"] == "UOB One" and credit[0]["id"] < store.last_id()
+    assert get_aggregates("demo", store).totals()["rewards"] == pytest.approx(2.0)
+
+
+def test_ledger_and_store_must_share_database(ledger, tmp_path):
+    other = TransactionStore(tmp_path / "other.db")
+    with pytest.raises(ValueError):
+        record_payment(_payment(), "c1", 5.0, store=other, ledger=ledger)
+    other.close()
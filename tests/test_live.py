@@ -0,0 +1,171 @@
+"""Live pipeline against an in-process fake agent client."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agents_stub import agent_client
+from agents_stub.agent_client import AgentClient, AgentUnavailable, CircuitBreaker, set_agent_client
+from agents_stub.merchant_agent import classify_merchant
+from agents_stub.scoring_engine import score_best_card
+from agents_stub.utils import (
+    CLASSIFICATION_CACHE,
+    chunked,
+    optimize_many,
+    optimize_many_async,
+    optimize_one,
+    optimize_one_async,
+)
+
+CBD = {"city": "Singapore", "area": "CBD"}
+
+
+class FakeClient:
+    """Answers like the stub server and counts calls; classify can be made to fail."""
+
+    def __init__(self, classify_down=False):
+        self.classify_down = classify_down
+        self.classify_calls = 0
+        self.score_calls = 0
+
+    def classify(self, merchant, location=None):
+        self.classify_calls += 1
+        if self.classify_down:
+            raise AgentUnavailable("classify is down")
+        return classify_merchant(merchant, location)
+
+    def score(self, txn, cards):
+        self.score_calls += 1
+        return score_best_card(txn, cards)
+
+    async def aclassify(self, merchant, location=None):
+        await asyncio.sleep(0)
+        return self.classify(merchant, location)
+
+    async def ascore(self, txn, cards):
+        await asyncio.sleep(0)
+        return self.score(txn, cards)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client():
+    previous = agent_client._client
+    CLASSIFICATION_CACHE.invalidate()
+    fake = FakeClient()
+    set_agent_client(fake)
+    yield fake
+    set_agent_client(previous)
+    CLASSIFICATION_CACHE.invalidate()
+
+
+def test_async_cache_hit_skips_classifier(client, cards):
+    expected = optimize_one("Starbucks", 12.5, "SGD", CBD, cards, use_cache=False)
+    first = asyncio.run(optimize_one_async("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False))
+    assert client.classify_calls == 1
+    second = asyncio.run(optimize_one_async("starbucks", 40.0, "SGD", CBD, cards, mock_mode=False))
+    assert client.classify_calls == 1
+    assert first == expected
+    assert second == optimize_one("starbucks", 40.0, "SGD", CBD, cards, use_cache=False)
+
+
+def test_async_cache_hit_does_not_speculate(client, cards):
+    asyncio.run(optimize_one_async("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False))
+    client.score_calls = 0
+    asyncio.run(optimize_one_async("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False, speculate=3))
+    assert client.score_calls == 1
+
+
+def test_sync_and_async_share_cache(client, cards):
+    optimize_one("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False)
+    asyncio.run(optimize_many_async([{"merchant": "Starbucks", "amount": 3, "location": CBD}] * 4,
+                                    cards, mock_mode=False))
+    assert client.classify_calls == 1
+
+
+def test_fallback_classification_not_cached(client, cards):
+    client.classify_down = True
+    result = asyncio.run(optimize_one_async("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False))
+    assert result["per_txn"][0]["predicted_category"] == "Dining"
+    asyncio.run(optimize_one_async("Starbucks", 12.5, "SGD", CBD, cards, mock_mode=False))
+    assert client.classify_calls == 2
+    assert len(CLASSIFICATION_CACHE) == 0
+
+
+def test_optimize_many_live_uses_one_loop(client, cards, monkeypatch):
+    runs = []
+    original = asyncio.Runner.run
+
+    def run(self, coro):
+        runs.append(id(self.get_loop()))
+        return original(self, coro)
+
+    monkeypatch.setattr(asyncio.Runner, "run", run)
+    txns = [{"merchant": name, "amount": 10 + i, "location": CBD}
+            for i, name in enumerate(["Starbucks", "Grab", "FairPrice"] * 3)]
+    live = list(optimize_many(txns, cards, chunk_size=2, mock_mode=False))
+    assert len(runs) == 5 and len(set(runs)) == 1
+    assert live == list(optimize_many(txns, cards, chunk_size=2))
+
+
+def test_optimize_many_live_refuses_running_loop(client, cards):
+    async def inside():
+        return list(optimize_many([{"merchant": "Grab", "amount": 5}], cards, mock_mode=False))
+
+    with pytest.raises(RuntimeError, match="optimize_many_async"):
+        asyncio.run(inside())
+
+
+def test_chunked():
+    assert list(chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 3)) == []
+
+
+class BrokenSession:
+    """A session whose post fails with something other than a request error."""
+
+    def post(self, url, json=None, timeout=None):
+        raise RuntimeError("bug")
+
+    def close(self):
+        pass
+
+
+def test_unexpected_error_frees_half_open_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11
+    client = AgentClient(base_url="http://agent", breaker=breaker, session=BrokenSession())
+    with pytest.raises(RuntimeError):
+        client.classify("Starbucks")
+    # The trial ended without a verdict; the next call may try again.
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.allow()
+
+
+def test_executor_created_once(monkeypatch):
+    created = []
+    executor = agent_client.ThreadPoolExecutor
+
+    def slow_executor(*args, **kwargs):
+        time.sleep(0.01)
+        created.append(executor(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(agent_client, "ThreadPoolExecutor", slow_executor)
+    client = AgentClient(base_url="http://agent", session=BrokenSession())
+
+    async def call():
+        return await client._run_in_pool(lambda: 1)
+
+    threads = [threading.Thread(target=asyncio.run, args=(call(),)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 1
+    client.close()
@@ -0,0 +1,69 @@
+"""Merchant catalogue index: lookups and its on-disk snapshot."""
+
+import ast
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import agents_stub
+from agents_stub.mcc_index import INDEX_SUFFIX, MerchantIndex, open_index
+
+CATALOGUE = "merchant,mcc,category\nStarbucks,5814,Dining\nDin Tai Fung,5812,Dining\nFairPrice,5411,Groceries\n"
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    path = tmp_path / "catalogue.csv"
+    path.write_text(CATALOGUE)
+    return path
+
+
+def test_fuzzy_lookup(catalogue):
+    index = open_index(catalogue)
+    assert index.best("STARBUCK'S #123")["merchant"] == "Starbucks"
+    assert index.best("DinTaiFung")["mcc"] == 5812
+    assert index.best("zzzz qqqq") is None
+
+
+def test_snapshot_has_no_object_arrays(catalogue):
+    built = open_index(catalogue)
+    snapshot = catalogue.with_suffix(INDEX_SUFFIX)
+    with np.load(snapshot, allow_pickle=False) as data:
+        assert all(data[name].dtype != object for name in data.files)
+    loaded = MerchantIndex.load(snapshot)
+    assert loaded.category_names == built.category_names
+    assert loaded.best("fairprice") == built.best("fairprice")
+
+
+def test_pickled_snapshot_is_rebuilt_not_loaded(catalogue):
+    snapshot = catalogue.with_suffix(INDEX_SUFFIX)
+    index = open_index(catalogue)
+    arrays = dict(np.load(snapshot))
+    arrays["category_names"] = np.array(index.category_names, dtype=object)
+    np.savez(snapshot, **arrays)
+    os.utime(snapshot, (catalogue.stat().st_mtime + 10,) * 2)
+
+    with pytest.raises(ValueError):
+        MerchantIndex.load(snapshot)
+    assert open_index(catalogue).best("starbucks")["merchant"] == "Starbucks"
+    with np.load(snapshot, allow_pickle=False) as data:
+        assert data["category_names"].dtype.kind == "U"
+
+
+def test_package_imports_are_relative():
+    package = Path(agents_stub.__file__).parent
+    for source in package.glob("*.py"):
+        for node in ast.walk(ast.parse(source.read_text())):
+            if isinstance(node, ast.ImportFrom) and node.level == 0:
+                assert not (node.module or "").startswith("agents_stub"), source.name
+
+
+def test_package_imports_no_private_names():
+    package = Path(agents_stub.__file__).parent
+    for source in package.glob("*.py"):
+        for node in ast.walk(ast.parse(source.read_text())):
+            if isinstance(node, ast.ImportFrom) and node.level > 0:
+                private = [alias.name for alias in node.names if alias.name.startswith("_")]
+                assert not private, f"{source.name} imports {private} from .{node.module}"
@@ -0,0 +1,68 @@
+"""Merchant classification: the model's holdout split and how evidence is combined."""
+
+import numpy as np
+import pytest
+
+from agents_stub.merchant_agent import MODEL_MIN_CONFIDENCE, _build_result, _combine, classify_merchant
+from agents_stub.merchant_model import merchant_groups
+from agents_stub.models import Classification
+
+
+def test_merchant_groups_keep_variants_together():
+    keys = ["starbucks", "starbuck", "starbucks coffee", "cold storage", "cold storag", "starbucks"]
+    groups = merchant_groups(keys, np.array([0, 0, 0, 1, 1, 1]))
+    assert groups[0] == groups[1] == groups[2]
+    assert groups[3] == groups[4]
+    assert groups[0] != groups[3]
+    # Same name under another class is a separate group.
+    assert groups[5] != groups[0]
+
+
+def test_unseen_name_is_not_confident_dining():
+    result = classify_merchant("Changi Recommends")
+    assert not (result["predicted_category"] == "Dining"
+                and result["confidence"] >= MODEL_MIN_CONFIDENCE)
+
+
+def test_rule_mcc_kept_when_model_agrees():
+    result = classify_merchant("Starbucks")
+    assert result["predicted_category"] == "Dining"
+    assert result["predicted_mcc"] == 5812
+
+
+def test_agreeing_evidence_raises_confidence():
+    category, confidence = _combine("Dining", 0.9, "Dining", 0.9)
+    assert category == "Dining"
+    assert confidence == pytest.approx(81 / 82)
+
+
+def test_disagreeing_evidence_lowers_confidence():
+    category, confidence = _combine("Dining", 0.99, "Shopping", 0.9)
+    assert category == "Dining"
+    assert 0.5 < confidence < 0.99
+    category, confidence = _combine("Dining", 0.6, "Shopping", 0.9)
+    assert category == "Shopping"
+    assert confidence == pytest.approx(6 / 7)
+
+
+def test_nearby_branch_is_combined_with_name():
+    near = {"merchant": "Cold Storage", "branch": "AMK Hub", "category": "Groceries",
+            "mcc": 5411, "distance_m": 0.0}
+    location = {"area": "Ang Mo Kio"}
+    alone = _build_result(None, location, near)
+    assert alone["confidence"] == pytest.approx(0.95)
+
+    agree = _build_result(({"category": "Groceries", "mcc": 5499}, "name", 0.85), location, near)
+    assert agree["confidence"] > 0.95
+    assert agree["predicted_mcc"] == 5411
+
+    against = _build_result(({"category": "Dining", "mcc": 5812}, "name", 0.85), location, near)
+    assert against["predicted_category"] == "Groceries"
+    assert against["confidence"] < 0.95
+
+
+def test_classification_round_trips_through_model():
+    result = classify_merchant("Starbucks")
+    assert Classification.from_dict(result).to_dict() == {
+        key: result[key] for key in ("predicted_category", "predicted_mcc", "confidence", "evidence")
+    }
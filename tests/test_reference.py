@@ -0,0 +1,77 @@
+"""Reference snapshot: entries are served only for the sources and code they were built from."""
+
+import json
+import pickle
+import struct
+
+import pytest
+
+from agents_stub import reference
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "reference.snapshot"
+    monkeypatch.setenv("AURA_SNAPSHOT_PATH", str(path))
+    monkeypatch.setenv("AURA_SNAPSHOT_KEY", "test-key")
+    monkeypatch.setattr(reference, "_loaded", None)
+    reference.build(path)
+    return path
+
+
+def test_round_trip(snapshot):
+    objects, stamps = reference.read_snapshot(snapshot)
+    assert "cards" in objects and "rules" in stamps
+    assert reference.main(["check", str(snapshot)]) == 0
+
+
+def test_rejected_when_package_code_changes(snapshot, monkeypatch):
+    monkeypatch.setattr(reference, "_code_digest", "0" * 16)
+    assert reference.read_snapshot(snapshot) is None
+    assert reference.main(["check", str(snapshot)]) == 1
+
+
+def test_cached_falls_back_to_source_on_code_change(snapshot, monkeypatch):
+    monkeypatch.setenv("AURA_FAST_START", "1")
+    monkeypatch.setattr(reference, "_code_digest", "0" * 16)
+    loads = []
+    source = reference.DEFAULT_CARDS_PATH
+    reference.cached("cards", source, lambda path: loads.append(path) or [])
+    assert loads == [source]
+
+
+def test_meta_is_json(snapshot):
+    data = snapshot.read_bytes()
+    _, meta_len, _, _ = struct.unpack_from("<8sQQ32s", data)
+    meta = json.loads(data[56: 56 + meta_len])
+    assert meta["code"] == reference.code_digest()
+
+
+def test_rejected_without_or_with_wrong_key(snapshot, monkeypatch):
+    assert reference.read_snapshot(snapshot, key=b"other-key") is None
+    monkeypatch.delenv("AURA_SNAPSHOT_KEY")
+    assert reference.read_snapshot(snapshot) is None
+    with pytest.raises(ValueError):
+        reference.build(snapshot)
+
+
+def test_rejected_when_tampered(snapshot):
+    data = bytearray(snapshot.read_bytes())
+    data[-1] ^= 0xFF
+    snapshot.write_bytes(bytes(data))
+    assert reference.read_snapshot(snapshot) is None
+
+
+class _Exploit:
+    ran = []
+
+    def __reduce__(self):
+        return _Exploit.ran.append, ("ran",)
+
+
+def test_pickled_meta_never_unpickled(snapshot):
+    # A file in the old layout, with a pickle where the meta block goes.
+    meta = pickle.dumps(_Exploit())
+    snapshot.write_bytes(struct.pack("<8sQQ32s", b"AURAREF\0", len(meta), 0, bytes(32)) + meta)
+    assert reference.read_snapshot(snapshot) is None
+    assert _Exploit.ran == []
@@ -0,0 +1,145 @@
+"""Scoring: equivalence with the original scorer and between the scalar and batch paths."""
+
+import math
+import random
+
+import pandas as pd
+import pytest
+
+from agents_stub.card_rules import get_rules
+from agents_stub.models import Recommendation, TransactionArray
+from agents_stub.scoring_engine import score_batch, score_best_card
+from test_card_rules import BASELINE_RATES
+
+CATEGORIES = ["Dining", "Groceries", "Transport", "General", "Shopping", None]
+
+
+def baseline_score(txn: dict, user_cards: list) -> dict:
+    """score_best_card as it was before the rule engine (category_rates table)."""
+    amount = txn.get("amount", 0)
+    category = txn.get("category", "General")
+    mile_to_sgd = 0.02
+    rates = BASELINE_RATES.get(category, BASELINE_RATES["General"])
+
+    recommendations = []
+    for card in user_cards[:5]:
+        card_name = card["display_name"]
+        rate, unit = rates.get(card_name) or (0.01, "sgd")
+        if unit == "mile":
+            reward_value = amount * rate * mile_to_sgd
+            calc_trace = f"${amount:.2f} x {rate:.1f} miles x ${mile_to_sgd:.2f} = ${reward_value:.2f}"
+            matched_rule = f"{category} {rate:.1f} miles per dollar"
+        else:
+            reward_value = amount * rate
+            calc_trace = f"${amount:.2f} x {rate * 100:.1f}% = ${reward_value:.2f}"
+            matched_rule = f"{category} {rate * 100:.1f}% cashback"
+        remaining_cap = card["monthly_cap"] - card["used_this_month"]
+        capped = reward_value > remaining_cap
+        if capped:
+            reward_value = max(remaining_cap, 0)
+        recommendations.append({
+            "card": card_name,
+            "bank": card["bank"],
+            "reward": round(reward_value, 2),
+            "rate": rate,
+            "rate_unit": unit,
+            "calc_trace": calc_trace,
+            "matched_rule": matched_rule + (" (cap reached)" if capped else ""),
+            "capped": capped,
+            "last4": card.get("last4", "0000"),
+            "card_id": card.get("id"),
+        })
+    recommendations.sort(key=lambda x: x["reward"], reverse=True)
+    return {"recommendations": recommendations[:3]}
+
+
+def _wallet(cards, rng):
+    for card in cards:
+        card["used_this_month"] = rng.choice([0, card["monthly_cap"] - 5, card["monthly_cap"] + 10,
+                                              rng.uniform(0, card["monthly_cap"])])
+    return cards
+
+
+def test_score_best_card_matches_baseline(cards):
+    # Base-currency spend with no MCC and no tier spend: the rules in
+    # card_rules.json reduce to the original table. Amounts stay below the
+    # OCBC dining sub-cap, which the original scorer did not have.
+    rng = random.Random(7)
+    for _ in range(500):
+        wallet = _wallet([dict(c) for c in cards], rng)
+        category = rng.choice([c for c in CATEGORIES if c is not None])
+        txn = {"merchant": "Test", "amount": round(rng.uniform(0, 1300), 2), "category": category}
+        result = score_best_card(txn, wallet)
+        assert result["calculation_method"] == "rule_engine"
+        assert result["recommendations"] == baseline_score(txn, wallet)["recommendations"], txn
+
+
+def _mixed_transactions(rng, n):
+    txns = []
+    for i in range(n):
+        txns.append({
+            "merchant": f"M{i}",
+            "amount": round(rng.uniform(0, 3000), 2),
+            "currency": rng.choice(["SGD", "SGD", "USD", "JPY", "EUR"]),
+            "category": rng.choice(CATEGORIES),
+            "mcc": rng.choice([None, 4511, 5812, "4511"]),
+        })
+    return txns
+
+
+def _tiered(cards, rng):
+    # Spend and sub-cap usage on either side of every threshold in the rule
+    # file, whatever values it ships with.
+    rules = get_rules()
+    programs = [rules.program(card["display_name"]) for card in cards]
+    spends = {0.0} | {value + d for p in programs for value in p.tier_spend for d in (-0.01, 0, 1)}
+    caps = {cap for p in programs for cap in p.sub_caps if cap != math.inf} or {50.0}
+    used = {0.0} | {cap + d for cap in caps for d in (-0.5, 0, 40)}
+    for card in cards:
+        card["spend_this_month"] = rng.choice(sorted(spends))
+        card["category_used"] = {"Dining": rng.choice(sorted(used))}
+    return cards
+
+
+def test_score_batch_matches_score_best_card(cards):
+    rng = random.Random(11)
+    wallet = _tiered(_wallet(cards, rng), rng)
+    txns = _mixed_transactions(rng, 400)
+    expected = [score_best_card(t, wallet) for t in txns]
+    assert score_batch(txns, wallet) == expected
+    assert score_batch(TransactionArray.from_records(txns), wallet) == expected
+
+
+def test_score_batch_dataframe(cards):
+    rng = random.Random(3)
+    txns = _mixed_transactions(rng, 50)
+    frame = pd.DataFrame(txns)
+    assert score_batch(frame, cards) == [score_best_card(t, cards) for t in txns]
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_score_batch_top_k(cards, top_k):
+    txns = _mixed_transactions(random.Random(5), 20)
+    for batch, txn in zip(score_batch(txns, cards, top_k=top_k), txns):
+        full = score_batch([txn], cards, top_k=5)[0]["recommendations"]
+        assert batch["recommendations"] == full[:top_k]
+
+
+def test_score_batch_edge_cases(cards):
+    assert score_batch([], cards) == []
+    empty = score_batch([{"merchant": "x", "amount": 1}], [])
+    assert empty[0]["recommendations"] == []
+
+
+def test_foreign_currency_scored_in_base(cards):
+    result = score_best_card({"merchant": "Shop", "amount": 100, "currency": "USD", "category": "General"}, cards)
+    assert result["fx"]["base_amount"] == 136.52
+    best = result["recommendations"][0]
+    assert best["card"] == "DBS Altitude"  # overseas 2 mpd beats 1.5% local cashback
+    assert best["calc_trace"].startswith("USD 100.00 = $136.52; ")
+
+
+def test_recommendations_round_trip_through_model(cards):
+    txn = {"merchant": "FairPrice", "amount": 145.30, "currency": "SGD", "category": "Groceries"}
+    for rec in score_best_card(txn, cards)["recommendations"]:
+        assert Recommendation.from_dict(rec).to_dict() == rec
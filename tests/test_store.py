@@ -0,0 +1,85 @@
+"""Transaction store: spend in the base currency and the base_amount migration."""
+
+import sqlite3
+
+import pytest
+
+from agents_stub.aggregates import DashboardAggregates, get_aggregates, record_transaction
+from agents_stub.insights import insights_for_user
+from agents_stub.store import TransactionStore
+
+USD_RATE = 1.3652
+
+
+def _txn(amount, currency="SGD", **extra):
+    return {"timestamp": "2025-01-10T12:00:00", "merchant": "Apple", "amount": amount,
+            "currency": currency, "card_used": "DBS Altitude", "reward": 1.0,
+            "category": "Shopping", **extra}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TransactionStore(tmp_path / "store.db")
+    yield store
+    store.close()
+
+
+def test_base_amount_kept_and_summed(store):
+    store.add(_txn(100.0, "USD", base_amount=136.0))
+    store.add(_txn(10.0))
+    row = store.recent(2)[1]
+    assert (row["amount"], row["currency"], row["base_amount"]) == (100.0, "USD", 136.0)
+    assert store.totals()["spend"] == pytest.approx(146.0)
+    assert store.by_card()["DBS Altitude"]["spend"] == pytest.approx(146.0)
+
+
+def test_missing_base_amount_converted(store):
+    store.add_many([_txn(100.0, "USD"), _txn(5.0, "XYZ")])
+    assert store.totals()["spend"] == pytest.approx(100.0 * USD_RATE + 5.0)
+
+
+def test_aggregates_sum_base_amount(store):
+    agg = get_aggregates("demo", store)
+    record_transaction(_txn(100.0, "USD", base_amount=136.0), store=store)
+    assert get_aggregates("demo", store) is agg
+    assert agg.totals()["spend"] == pytest.approx(136.0)
+    assert agg.totals() == DashboardAggregates.load(store).totals()
+
+
+def test_insights_spend_in_base_currency(store, cards):
+    store.add(_txn(100.0, "USD", base_amount=136.0))
+    insights = insights_for_user(cards, "demo", store, use_cache=False)
+    assert insights["spending_by_category"] == {"Shopping": 136.0}
+
+
+def test_migrates_database_without_base_amount(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, ts TEXT NOT NULL,
+            merchant TEXT NOT NULL, amount REAL NOT NULL, currency TEXT NOT NULL DEFAULT 'SGD',
+            card TEXT, card_id TEXT, reward REAL NOT NULL DEFAULT 0, category TEXT,
+            mcc INTEGER, location TEXT
+        );
+        CREATE TABLE txn_rollups (
+            user_id TEXT NOT NULL, month TEXT NOT NULL, card TEXT NOT NULL, category TEXT NOT NULL,
+            spend REAL NOT NULL, reward REAL NOT NULL, count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month, card, category)
+        ) WITHOUT ROWID;
+        INSERT INTO transactions (user_id, ts, merchant, amount, currency, card, reward, category)
+        VALUES ('demo', '2025-01-10T12:00:00', 'Apple', 100.0, 'USD', 'DBS Altitude', 1.0, 'Shopping'),
+               ('demo', '2025-01-11T12:00:00', 'Grab', 20.0, 'SGD', 'DBS Altitude', 0.5, 'Transport');
+        INSERT INTO txn_rollups VALUES ('demo', '2025-01', 'DBS Altitude', 'Shopping', 100.0, 1.0, 1),
+                                       ('demo', '2025-01', 'DBS Altitude', 'Transport', 20.0, 0.5, 1);
+    """)
+    conn.commit()
+    conn.close()
+
+    store = TransactionStore(path)
+    try:
+        assert [t["base_amount"] for t in store.recent(2)] == pytest.approx([20.0, 100.0 * USD_RATE])
+        assert store.totals()["spend"] == pytest.approx(20.0 + 100.0 * USD_RATE)
+        assert store.totals()["count"] == 2
+    finally:
+        store.close()
@@ -0,0 +1,94 @@
+"""Background warm-up: one classification per merchant and place, refreshed after payments."""
+
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from agents_stub import ledger, store as store_module
+
+from agents_stub.store import TransactionStore
+from agents_stub.utils import CLASSIFICATION_CACHE, classification_key, optimize_one
+from agents_stub.warmup import QUICK_EXAMPLES, start_warmup, warm_cache, warm_queries
+
+ORCHARD = {"city": "Singapore", "area": "Orchard", "lat": 1.3048, "lng": 103.8318}
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    CLASSIFICATION_CACHE.invalidate()
+    yield
+    CLASSIFICATION_CACHE.invalidate()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TransactionStore(tmp_path / "warm.db")
+    rows = [
+        {"timestamp": f"2025-01-{day:02d}T12:00:00", "merchant": merchant, "amount": amount,
+         "currency": "SGD", "card_used": "UOB One", "reward": 0.5, "category": "Dining",
+         "location": ORCHARD}
+        for day, (merchant, amount) in enumerate(
+            [("Toast Box", 4.2), ("Toast Box", 5.8), ("TOAST BOX", 6.1), ("Koufu", 7.0)], start=1)
+    ]
+    store.add_many(rows, user_id="alice")
+    yield store
+    store.close()
+
+
+def test_queries_are_distinct_classification_keys(store):
+    queries = warm_queries("alice", store=store)
+    keys = [classification_key(m, loc) for m, loc in queries]
+    assert len(keys) == len(set(keys))
+    # Three Toast Box purchases at different amounts warm a single entry.
+    assert [m for m, _ in queries[:2]] == ["Toast Box", "Koufu"]
+    assert len(queries) == 2 + len(QUICK_EXAMPLES)
+
+
+def test_warm_cache_serves_any_amount(store, cards):
+    lookups = CLASSIFICATION_CACHE.hits, CLASSIFICATION_CACHE.misses
+    assert warm_cache("alice", store=store) == 2 + len(QUICK_EXAMPLES)
+    assert warm_cache("alice", store=store) == 0
+    # Warming never counts as a lookup.
+    assert (CLASSIFICATION_CACHE.hits, CLASSIFICATION_CACHE.misses) == lookups
+    result = optimize_one("Toast Box", 123.45, "SGD", ORCHARD, cards)
+    assert CLASSIFICATION_CACHE.hits == lookups[0] + 1
+    assert result["per_txn"][0]["predicted_category"] == "Dining"
+
+
+def test_start_warmup_fills_cache_off_thread(store, monkeypatch):
+    monkeypatch.setattr("agents_stub.warmup.get_transaction_store", lambda: store)
+    thread = start_warmup("alice")
+    thread.join(timeout=30)
+    assert CLASSIFICATION_CACHE.get(classification_key("Koufu", ORCHARD)) is not None
+
+
+def test_start_warmup_not_started_twice(monkeypatch):
+    monkeypatch.setattr("agents_stub.warmup._running", {("alice", True)})
+    assert start_warmup("alice") is None
+
+
+def test_payment_rewarms(monkeypatch, cards):
+    # Fresh process-wide store and ledger in this test's database.
+    monkeypatch.setattr(ledger, "_ledger", None)
+    monkeypatch.setattr(store_module, "_store", None)
+    calls = []
+    monkeypatch.setattr("agents_stub.warmup.start_warmup", lambda *args: calls.append(args))
+
+    page = Path(__file__).resolve().parent.parent / "pages" / "2_Transactions.py"
+    at = AppTest.from_file(str(page), default_timeout=60)
+    at.session_state.user_id = "alice"
+    at.session_state.user_cards = cards
+    at.run()
+    assert calls == [("alice", True)]
+
+    at.text_input[0].input("Toast Box")
+    at.number_input[0].set_value(12.0)
+    for label in ("Get Recommendation", "Use this card", "Confirm Payment"):
+        next(b for b in at.button if b.label == label).click().run()
+    try:
+        assert not at.exception and at.success
+        assert calls == [("alice", True)] * 2
+    finally:
+        ledger.get_cap_ledger().close()
+        store_module.get_transaction_store().close()